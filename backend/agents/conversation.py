@@ -0,0 +1,239 @@
+import asyncio
+import json
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+from loguru import logger
+from ..config import load_environment
+from ..models.model_manager import ModelManager
+from ..models.scheduler import model_priority, PRIORITY_BACKGROUND
+from ..services.chat_history import ChatHistoryService
+from ..services.history_cache import HISTORY_CACHE_MESSAGES
+from ..utils.cache import SQLiteCache
+from ..utils.concurrency import run_blocking
+from ..utils.tokens import estimate_tokens, CHARS_PER_TOKEN
+from ..utils.metrics import timed_stage
+
+# Load environment variables
+load_environment()
+
+# Configure conversation memory
+CONVERSATION_RECENT_TURNS = int(os.getenv("CONVERSATION_RECENT_TURNS", 4))
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", 1500))
+CONVERSATION_SUMMARY_MAX_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_MAX_TOKENS", 400))
+CONVERSATION_SUMMARY_BATCH_TURNS = int(os.getenv("CONVERSATION_SUMMARY_BATCH_TURNS", 2))
+CONVERSATION_SUMMARY_PATH = os.getenv("CONVERSATION_SUMMARY_PATH", "cache/conversation_summaries.sqlite3")
+
+@dataclass
+class ConversationContext:
+    """The slice of a session's history that fits in the prompt."""
+    summary: str = ""
+    # Recent messages in chronological order
+    messages: List[Dict[str, Any]] = field(default_factory=list)
+    tokens: int = 0
+
+    def render(self) -> str:
+        """Format the summary and recent turns as a prompt section, or "" if there is no history."""
+        sections = []
+        if self.summary:
+            sections.append(f"Summary of earlier conversation:\n{self.summary}")
+        if self.messages:
+            lines = "\n".join(f"{m.get('role', 'user').capitalize()}: {m.get('content', '')}" for m in self.messages)
+            sections.append(f"Recent conversation:\n{lines}")
+        return "\n\n".join(sections)
+
+def _timestamp_key(value: Any) -> datetime:
+    """Parse a message timestamp for ordering, treating naive values as UTC; unparseable values sort first."""
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        parsed = datetime.min
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def _group_turns(messages: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Split chronological messages into turns, each starting at a user message."""
+    turns: List[List[Dict[str, Any]]] = []
+    for message in messages:
+        if message.get("role") == "user" or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+class ConversationMemory:
+    """Builds the conversation section of a session's prompts within a token budget.
+
+    The prompt carries a rolling summary of older turns plus the last
+    ``recent_turns`` turns, newest kept first when the budget runs out. Turns
+    that fall out of the recent window are folded into the summary by a
+    background task once ``summary_batch_turns`` of them have accumulated, so
+    requests never wait on summarization and each fold costs the same however
+    long the conversation gets. Until a fold lands, those turns are simply
+    left out of the prompt.
+    """
+
+    def __init__(
+        self,
+        chat_history: ChatHistoryService,
+        model_manager: ModelManager,
+        recent_turns: int = CONVERSATION_RECENT_TURNS,
+        token_budget: int = CONVERSATION_TOKEN_BUDGET,
+        summary_max_tokens: int = CONVERSATION_SUMMARY_MAX_TOKENS,
+        summary_batch_turns: int = CONVERSATION_SUMMARY_BATCH_TURNS,
+        path: Optional[str] = CONVERSATION_SUMMARY_PATH
+    ):
+        """Initialize conversation memory.
+
+        Args:
+            chat_history: Source of each session's recent messages
+            model_manager: Model used to fold turns into the summary
+            recent_turns: Turns included verbatim after the summary
+            token_budget: Maximum estimated tokens for the whole conversation section
+            summary_max_tokens: Maximum estimated tokens of a summary
+            summary_batch_turns: Turns waiting outside the recent window before a fold is started
+            path: SQLite file for summaries shared by the workers on a host, or None/empty to keep them in memory
+        """
+        self.chat_history = chat_history
+        self.model_manager = model_manager
+        self.recent_turns = recent_turns
+        self.token_budget = token_budget
+        self.summary_max_tokens = summary_max_tokens
+        self.summary_batch_turns = summary_batch_turns
+        self._memory: Dict[str, str] = {}
+        self._store: Optional[SQLiteCache] = None
+        self._tasks: Set["asyncio.Task[None]"] = set()
+        self._summarizing: Set[str] = set()
+        self._stats = {"contexts": 0, "summaries": 0, "summary_errors": 0, "truncated_turns": 0}
+
+        if path:
+            try:
+                self._store = SQLiteCache(path, table="conversation_summaries")
+            except Exception as e:
+                logger.error(f"Error opening conversation summary store: {str(e)}")
+                self._store = None
+
+    @timed_stage("conversation")
+    async def build_context(self, session_id: str) -> ConversationContext:
+        """Return the summary and recent turns for a session that fit in the token budget.
+
+        Schedules a background fold when enough turns have left the recent window.
+
+        Args:
+            session_id: The chat session
+
+        Returns:
+            The conversation context; empty for a new session
+        """
+        messages = await self.chat_history.recent_messages(session_id, HISTORY_CACHE_MESSAGES)
+        record = await self._load(session_id)
+        summary = record.get("summary", "")
+        through = _timestamp_key(record["through"]) if record.get("through") else None
+
+        unsummarized = [m for m in messages if through is None or _timestamp_key(m.get("timestamp")) > through]
+        turns = _group_turns(unsummarized)
+        split = max(len(turns) - self.recent_turns, 0)
+        older, recent = turns[:split], turns[split:]
+        if len(older) >= self.summary_batch_turns:
+            self._schedule_summary(session_id, summary, older)
+
+        # Spend the budget on the summary first, then on turns from newest to oldest
+        context = ConversationContext(summary=self._truncate(summary, self.token_budget))
+        context.tokens = estimate_tokens(context.summary)
+        kept: List[List[Dict[str, Any]]] = []
+        for turn in reversed(recent):
+            turn_tokens = estimate_tokens([m.get("content", "") for m in turn])
+            if context.tokens + turn_tokens > self.token_budget:
+                self._stats["truncated_turns"] += len(recent) - len(kept)
+                break
+            kept.append(turn)
+            context.tokens += turn_tokens
+        context.messages = [message for turn in reversed(kept) for message in turn]
+        self._stats["contexts"] += 1
+        return context
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return context and summarization counters."""
+        return {**self._stats, "summaries_in_progress": len(self._summarizing)}
+
+    async def close(self) -> None:
+        """Wait for folds in progress, then close the summary store."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._store is not None:
+            await run_blocking(self._store.close)
+
+    def _schedule_summary(self, session_id: str, summary: str, turns: List[List[Dict[str, Any]]]) -> None:
+        """Start a background fold for a session unless one is already running in this worker."""
+        if session_id in self._summarizing:
+            return
+        self._summarizing.add(session_id)
+        # Summaries are housekeeping, so they yield to interactive model calls
+        with model_priority(PRIORITY_BACKGROUND):
+            task = asyncio.ensure_future(self._summarize(session_id, summary, turns))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    @timed_stage("summarize")
+    async def _summarize(self, session_id: str, summary: str, turns: List[List[Dict[str, Any]]]) -> None:
+        """Fold turns into the session's summary and store it."""
+        try:
+            messages = [message for turn in turns for message in turn]
+            updated = await self.model_manager.generate_text_async(self._build_prompt(summary, messages))
+            if not updated.strip() or updated.startswith("Error generating"):
+                raise RuntimeError(updated or "empty summary")
+            record = {
+                "summary": self._truncate(updated.strip(), self.summary_max_tokens),
+                "through": messages[-1].get("timestamp")
+            }
+            await self._save(session_id, record)
+            self._stats["summaries"] += 1
+            logger.info(f"Folded {len(turns)} turns into the summary of session {session_id}")
+        except Exception as e:
+            self._stats["summary_errors"] += 1
+            logger.error(f"Error summarizing session {session_id}: {str(e)}")
+        finally:
+            self._summarizing.discard(session_id)
+
+    def _build_prompt(self, summary: str, messages: List[Dict[str, Any]]) -> str:
+        """Build the prompt that folds new turns into the running summary."""
+        transcript = "\n".join(f"{m.get('role', 'user').capitalize()}: {m.get('content', '')}" for m in messages)
+        words = self.summary_max_tokens * CHARS_PER_TOKEN // 6
+        return f"""You maintain a running summary of a conversation with an ecological assistant.
+
+            Current summary:
+            {summary or "(none yet)"}
+
+            New turns:
+            {transcript}
+
+            Rewrite the summary to include the new turns. Keep the facts, plants, places and preferences
+            the user mentioned and any advice already given. Use at most {words} words and return only the summary.
+            """
+
+    async def _load(self, session_id: str) -> Dict[str, Any]:
+        """Return the stored summary record for a session, or an empty one."""
+        if self._store is None:
+            value = self._memory.get(session_id)
+        else:
+            try:
+                stored = await run_blocking(self._store.get, session_id)
+            except Exception as e:
+                logger.error(f"Error reading conversation summary: {str(e)}")
+                stored = None
+            value = stored[0] if stored else None
+        return json.loads(value) if value else {}
+
+    async def _save(self, session_id: str, record: Dict[str, Any]) -> None:
+        """Store a session's summary record."""
+        value = json.dumps(record)
+        if self._store is None:
+            self._memory[session_id] = value
+        else:
+            await run_blocking(self._store.set, session_id, value)
+
+    @staticmethod
+    def _truncate(text: str, max_tokens: int) -> str:
+        """Cut text to roughly ``max_tokens`` tokens."""
+        max_chars = max_tokens * CHARS_PER_TOKEN
+        return text if len(text) <= max_chars else text[:max_chars].rstrip() + "…"
@@ -0,0 +1,191 @@
+import os
+import random
+import re
+import threading
+from collections import Counter
+from typing import Dict, Any, Optional, Tuple
+from loguru import logger
+from ..config import load_environment
+from .executor import FALLBACK_RESPONSE
+
+# Load environment variables
+load_environment()
+
+# Configure the evaluation policy (always, never, sampled or gated); always keeps the
+# evaluator pass on every response, the others trade some of it for latency and tokens
+EVALUATION_POLICY = os.getenv("EVALUATION_POLICY", "always").lower()
+EVALUATION_SAMPLE_RATE = float(os.getenv("EVALUATION_SAMPLE_RATE", 0.1))
+EVALUATION_MIN_CHARS = int(os.getenv("EVALUATION_MIN_CHARS", 80))
+EVALUATION_MIN_GROUNDING = float(os.getenv("EVALUATION_MIN_GROUNDING", 0.2))
+
+EVALUATION_MODES = ("always", "never", "sampled", "gated")
+
+# Markers of a failed or refused draft that the evaluator may be able to recover
+FAILURE_MARKERS = (
+    "error generating response",
+    "error analyzing image",
+    FALLBACK_RESPONSE.lower(),
+    "i'm sorry, i can't",
+    "i'm sorry, i cannot",
+    "i am unable to",
+    "i'm unable to",
+    "i cannot help",
+    "as an ai",
+)
+
+# Number of the most frequent search terms checked for grounding coverage
+GROUNDING_TERMS = 20
+
+TERM_PATTERN = re.compile(r"[a-z][a-z-]{4,}")
+URL_PATTERN = re.compile(r"https?://\S+")
+STOPWORDS = frozenset((
+    "about", "after", "again", "being", "below", "between", "could", "every", "first",
+    "found", "their", "there", "these", "those", "through", "under", "where", "which",
+    "while", "would", "should", "other", "results", "search", "information", "learn",
+))
+
+def grounding_coverage(response: str, context: str) -> Optional[float]:
+    """Return the share of the top web search terms that the response mentions.
+
+    Args:
+        response: The drafted response
+        context: The executor context the response was generated from
+
+    Returns:
+        Coverage between 0 and 1, or None if the context has no search results
+    """
+    start = context.find("Web Search Results:")
+    if start < 0:
+        return None
+    section = context[start:]
+    end = section.find("Image Analysis Results:")
+    if end >= 0:
+        section = section[:end]
+
+    terms = Counter(
+        term for term in TERM_PATTERN.findall(URL_PATTERN.sub(" ", section.lower()))
+        if term not in STOPWORDS
+    )
+    if not terms:
+        return None
+    top_terms = [term for term, _ in terms.most_common(GROUNDING_TERMS)]
+    response_terms = set(TERM_PATTERN.findall(response.lower()))
+    return sum(1 for term in top_terms if term in response_terms) / len(top_terms)
+
+class EvaluationPolicy:
+    """Decides whether a drafted response gets the evaluator's extra LLM pass.
+
+    ``always`` and ``never`` are unconditional, ``sampled`` evaluates a random
+    ``sample_rate`` share of responses, and ``gated`` evaluates only drafts
+    that fail a cheap local check: too short, containing an error or refusal
+    marker, or ignoring most of the web search results it was given.
+    Decisions, evaluation latency and evaluator tokens are counted so the
+    policies can be compared; token counts are estimated from text length,
+    not reported by the model.
+    """
+
+    def __init__(
+        self,
+        mode: str = EVALUATION_POLICY,
+        sample_rate: float = EVALUATION_SAMPLE_RATE,
+        min_chars: int = EVALUATION_MIN_CHARS,
+        min_grounding: float = EVALUATION_MIN_GROUNDING
+    ):
+        """Initialize the policy.
+
+        Args:
+            mode: ``always``, ``never``, ``sampled`` or ``gated``
+            sample_rate: Share of responses evaluated in ``sampled`` mode
+            min_chars: Drafts shorter than this are evaluated in ``gated`` mode
+            min_grounding: Drafts covering less of the search terms are evaluated in ``gated`` mode
+        """
+        if mode not in EVALUATION_MODES:
+            raise ValueError(f"Unsupported evaluation policy: {mode}")
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.min_chars = min_chars
+        self.min_grounding = min_grounding
+        self._reasons: Counter = Counter()
+        self._stats = {
+            "evaluated": 0,
+            "skipped": 0,
+            "pipeline_seconds": 0.0,
+            "evaluation_seconds": 0.0,
+            "evaluation_tokens": 0,
+        }
+        self._lock = threading.Lock()
+        logger.info(f"EvaluationPolicy initialized (mode={mode})")
+
+    def should_evaluate(self, response: str, query: str, context: str = "") -> Tuple[bool, str]:
+        """Decide whether a draft is worth an evaluator pass.
+
+        Args:
+            response: The executor's draft
+            query: The original user query
+            context: The context the draft was generated from
+
+        Returns:
+            ``(evaluate, reason)``
+        """
+        if self.mode == "always":
+            return True, "always"
+        if self.mode == "never":
+            return False, "never"
+        if self.mode == "sampled":
+            if random.random() < self.sample_rate:
+                return True, "sampled"
+            return False, "not sampled"
+
+        stripped = response.strip()
+        if len(stripped) < self.min_chars:
+            return True, "too short"
+        lowered = stripped.lower()
+        if any(marker in lowered for marker in FAILURE_MARKERS):
+            return True, "error or refusal"
+        coverage = grounding_coverage(stripped, context)
+        if coverage is not None and coverage < self.min_grounding:
+            return True, "low grounding"
+        return False, "passed checks"
+
+    def record(self, evaluated: bool, reason: str, pipeline_seconds: float,
+               evaluation_seconds: float = 0.0, evaluation_tokens: int = 0) -> None:
+        """Record the outcome of one decision.
+
+        Args:
+            evaluated: Whether the evaluator ran
+            reason: The reason returned by ``should_evaluate``
+            pipeline_seconds: Time from the start of the pipeline to the final response
+            evaluation_seconds: Time spent in the evaluator
+            evaluation_tokens: Estimated prompt and output tokens spent in the evaluator
+        """
+        with self._lock:
+            self._stats["evaluated" if evaluated else "skipped"] += 1
+            self._stats["pipeline_seconds"] += pipeline_seconds
+            self._stats["evaluation_seconds"] += evaluation_seconds
+            self._stats["evaluation_tokens"] += evaluation_tokens
+            self._reasons[reason] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return decision counts with average latency and estimated token spend for this policy.
+
+        ``estimated_tokens_saved`` assumes each skipped response would have
+        cost the average of the evaluated ones.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            reasons = dict(self._reasons)
+        total = stats["evaluated"] + stats["skipped"]
+        return {
+            "policy": self.mode,
+            "requests": total,
+            "evaluated": stats["evaluated"],
+            "skipped": stats["skipped"],
+            "reasons": reasons,
+            "avg_pipeline_seconds": stats["pipeline_seconds"] / total if total else 0.0,
+            "avg_evaluation_seconds": stats["evaluation_seconds"] / stats["evaluated"] if stats["evaluated"] else 0.0,
+            "estimated_evaluation_tokens": stats["evaluation_tokens"],
+            "avg_estimated_evaluation_tokens": stats["evaluation_tokens"] / total if total else 0.0,
+            "estimated_tokens_saved": (
+                stats["skipped"] * stats["evaluation_tokens"] / stats["evaluated"] if stats["evaluated"] else None
+            ),
+        }
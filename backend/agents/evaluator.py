@@ -1,23 +1,21 @@
-import google.generativeai as genai
-from typing import Dict, Any
-import os
+from typing import Dict, Any, Optional, AsyncIterator, List, Tuple
 from loguru import logger
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-# Configure Google Generative AI
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+from ..models.model_manager import ModelManager
+from ..utils.batching import parse_json_array
+from ..utils.metrics import timed_stage, record_fallback
 
 class EvaluatorAgent:
     """Agent responsible for evaluating and refining the responses generated by the executor."""
     
-    def __init__(self):
-        """Initialize the evaluator agent with the Gemini model."""
+    def __init__(self, model_manager: Optional[ModelManager] = None):
+        """Initialize the evaluator agent.
+        
+        Args:
+            model_manager: Shared model manager; a private one is created if omitted
+        """
         try:
-            # Initialize the Gemini model
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
+            # Reuse the shared model manager when one is provided
+            self.model_manager = model_manager or ModelManager()
             logger.info("EvaluatorAgent initialized successfully")
         except Exception as e:
             logger.error(f"Error initializing EvaluatorAgent: {str(e)}")
@@ -35,7 +33,101 @@ class EvaluatorAgent:
         """
         try:
             # Prepare the prompt for the model
-            prompt = f"""You are an ecological assistant. Evaluate and refine the following response to ensure it is:
+            prompt = self._build_prompt(response, original_query)
+            
+            # Generate the refined response
+            refined_response = self.model_manager.generate_content(prompt)
+            
+            return refined_response
+            
+        except Exception as e:
+            logger.error(f"Error evaluating response: {str(e)}")
+            # Return the original response in case of error
+            record_fallback("evaluator")
+            return response
+    
+    @timed_stage("evaluator")
+    async def evaluate_response_async(self, response: str, original_query: str) -> str:
+        """Async counterpart of ``evaluate_response``.
+        
+        Args:
+            response: The response generated by the executor
+            original_query: The original user query
+            
+        Returns:
+            The refined response
+        """
+        try:
+            # Prepare the prompt for the model
+            prompt = self._build_prompt(response, original_query)
+            
+            # Generate the refined response
+            return await self.model_manager.generate_content_async(prompt)
+            
+        except Exception as e:
+            logger.error(f"Error evaluating response: {str(e)}")
+            # Return the original response in case of error
+            record_fallback("evaluator")
+            return response
+    
+    @timed_stage("evaluator_stream")
+    async def evaluate_response_stream(self, response: str, original_query: str) -> AsyncIterator[str]:
+        """Streaming counterpart of ``evaluate_response``.
+        
+        Args:
+            response: The response generated by the executor
+            original_query: The original user query
+            
+        Yields:
+            Chunks of the refined response; the original response if refinement fails before any output
+        """
+        streamed = False
+        try:
+            # Prepare the prompt for the model
+            prompt = self._build_prompt(response, original_query)
+            
+            # Stream the refined response
+            async for chunk in self.model_manager.generate_content_stream(prompt):
+                streamed = True
+                yield chunk
+                
+        except Exception as e:
+            logger.error(f"Error evaluating response: {str(e)}")
+            # Fall back to the original response if nothing has been sent yet
+            if not streamed:
+                record_fallback("evaluator")
+                yield response
+    
+    @timed_stage("evaluator_batch")
+    async def evaluate_responses_async(self, pairs: List[Tuple[str, str]]) -> List[str]:
+        """Refine several responses with one packed model call.
+        
+        If the packed output cannot be matched back to the responses, each
+        response is evaluated with its own call instead.
+        
+        Args:
+            pairs: ``(response, original_query)`` pairs
+            
+        Returns:
+            One refined response per pair, in order
+        """
+        if len(pairs) == 1:
+            return [await self.evaluate_response_async(*pairs[0])]
+        
+        try:
+            packed = await self.model_manager.generate_content_async(self._build_batch_prompt(pairs))
+            refined = parse_json_array(packed, len(pairs))
+            if refined is not None:
+                return refined
+            logger.warning(f"Packed evaluation output did not match {len(pairs)} responses; evaluating individually")
+        except Exception as e:
+            logger.error(f"Error evaluating packed responses: {str(e)}")
+        
+        return [await self.evaluate_response_async(response, query) for response, query in pairs]
+    
+    def _build_prompt(self, response: str, original_query: str) -> str:
+        """Build the evaluation prompt for an executor response."""
+        return f"""You are an ecological assistant. Evaluate and refine the following response to ensure it is:
             
             1. Accurate and scientifically sound
             2. Directly addresses the user's query
@@ -50,16 +142,22 @@ class EvaluatorAgent:
             
             Provide a refined version of this response that maintains all correct information while improving any issues.
             """
+    
+    def _build_batch_prompt(self, pairs: List[Tuple[str, str]]) -> str:
+        """Build an evaluation prompt covering several numbered responses."""
+        items = "\n\n".join(
+            f"{i}. Original User Query: {query}\n   Response to Evaluate:\n{response}"
+            for i, (response, query) in enumerate(pairs, 1)
+        )
+        return f"""You are an ecological assistant. Evaluate and refine each of the following numbered responses to ensure it is:
             
-            # Generate content
-            result = self.model.generate_content(prompt)
-            
-            # Extract the refined response
-            refined_response = result.text
+            1. Accurate and scientifically sound
+            2. Directly addresses the user's query
+            3. Helpful and actionable
+            4. Concise but comprehensive
+            5. Written in a friendly, conversational tone
             
-            return refined_response
+            {items}
             
-        except Exception as e:
-            logger.error(f"Error evaluating response: {str(e)}")
-            # Return the original response in case of error
-            return response
\ No newline at end of file
+            Return only a JSON array with exactly {len(pairs)} strings, where element i is the refined version of response i.
+            """
\ No newline at end of file
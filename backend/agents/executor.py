@@ -1,30 +1,56 @@
-import google.generativeai as genai
-import requests
-from typing import Dict, Any, Optional
+import asyncio
+from typing import Dict, Any, Optional, AsyncIterator, Callable, Awaitable, Tuple
 import os
 import json
 from loguru import logger
-from dotenv import load_dotenv
+from ..config import load_environment
 from ..services.web_search import WebSearchService
 from ..services.image_analysis import ImageAnalysisService
 from ..models.model_manager import ModelManager
+from ..utils.metrics import timed_stage, time_stage, record_fallback
 
 # Load environment variables
-load_dotenv()
+load_environment()
 
-# Configure Google Generative AI
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+# Per-tool timeout in seconds; tools that finish late are left out of the context
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", 15))
+
+# Tools each tool waits on before it starts; tools without pending dependencies run concurrently
+TOOL_DEPENDENCIES: Dict[str, Tuple[str, ...]] = {
+    "web_search": (),
+    "image_analysis": (),
+}
+
+# A tool receives the results of its dependencies and returns its own result
+ToolRunner = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+# Response returned when the plan cannot be executed
+FALLBACK_RESPONSE = "I'm sorry, I encountered an issue while processing your request. Please try again or ask a different question."
 
 class ExecutorAgent:
     """Agent responsible for executing the plan created by the planner."""
     
-    def __init__(self):
-        """Initialize the executor agent with the Gemini model."""
+    def __init__(
+        self,
+        model_manager: Optional[ModelManager] = None,
+        web_search: Optional[WebSearchService] = None,
+        image_analysis: Optional[ImageAnalysisService] = None,
+        tool_timeout: float = TOOL_TIMEOUT_SECONDS
+    ):
+        """Initialize the executor agent.
+        
+        Args:
+            model_manager: Shared model manager; a private one is created if omitted
+            web_search: Shared web search service; a private one is created if omitted
+            image_analysis: Shared image analysis service; a private one is created if omitted
+            tool_timeout: Seconds to wait for each tool before continuing without it
+        """
         try:
-            # Initialize the model manager and services
-            self.model_manager = ModelManager()
-            self.web_search = WebSearchService()
-            self.image_analysis = ImageAnalysisService()
+            # Reuse shared instances where provided, otherwise build our own
+            self.model_manager = model_manager or ModelManager()
+            self.web_search = web_search or WebSearchService()
+            self.image_analysis = image_analysis or ImageAnalysisService(model_manager=self.model_manager)
+            self.tool_timeout = tool_timeout
             logger.info("ExecutorAgent initialized successfully")
         except Exception as e:
             logger.error(f"Error initializing ExecutorAgent: {str(e)}")
@@ -45,44 +71,184 @@ class ExecutorAgent:
             requires_image_analysis = plan.get("requires_image_analysis", False)
             requires_web_search = plan.get("requires_web_search", False)
             image_path = plan.get("image_path", None)
+            image = plan.get("image", None)
             
             # Prepare context for the model
-            context = f"Plan: {plan_text}\n\n"
+            context = f"Plan: {plan_text}\n\n" + self._format_conversation_context(plan)
             
             # Perform web search if required
             if requires_web_search:
                 search_results = self.web_search.search(plan_text)
-                if search_results.get("success", False):
-                    formatted_results = self.web_search.format_search_results(search_results.get("results", []))
-                    context += f"Web Search Results:\n{formatted_results}\n\n"
+                context += self._format_search_context(search_results)
             
             # Perform image analysis if required
             if requires_image_analysis and image_path:
-                analysis_results = self.image_analysis.analyze_image(image_path)
-                if analysis_results.get("success", False):
-                    context += f"Image Analysis Results:\n{analysis_results.get('analysis', '')}\n\n"
+                analysis_results = self.image_analysis.analyze_image(image_path, image=image)
+                context += self._format_analysis_context(analysis_results)
             
-            # Prepare the prompt for the model
-            prompt = f"""You are an ecological assistant. Execute the following plan to provide a helpful response:
+            # Generate content using the model manager
+            result = self.model_manager.generate_text(self._build_prompt(context))
             
-            {context}
+            return result
             
-            Based on the plan and available information, provide a detailed, accurate, and helpful response.
-            Focus on ecological information, gardening advice, plant identification, or research information as appropriate.
-            """
+        except Exception as e:
+            logger.error(f"Error executing plan: {str(e)}")
+            # Return a fallback response in case of error
+            record_fallback("executor")
+            return FALLBACK_RESPONSE
+    
+    @timed_stage("executor")
+    async def execute_plan_async(self, plan: Dict[str, Any], context: Optional[str] = None) -> str:
+        """Async counterpart of ``execute_plan``.
+        
+        Args:
+            plan: The plan dictionary from the planner agent
+            context: Context already gathered for the plan, if any
+            
+        Returns:
+            The result of executing the plan
+        """
+        try:
+            # Gather tool results unless the caller already did
+            if context is None:
+                context = await self.gather_context_async(plan)
             
             # Generate content using the model manager
-            result = self.model_manager.generate_text(prompt)
+            return await self.model_manager.generate_text_async(self._build_prompt(context))
             
-            return result
+        except Exception as e:
+            logger.error(f"Error executing plan: {str(e)}")
+            # Return a fallback response in case of error
+            record_fallback("executor")
+            return FALLBACK_RESPONSE
+    
+    @timed_stage("executor_stream")
+    async def execute_plan_stream(self, plan: Dict[str, Any], context: Optional[str] = None) -> AsyncIterator[str]:
+        """Streaming counterpart of ``execute_plan_async``.
+        
+        Args:
+            plan: The plan dictionary from the planner agent
+            context: Context already gathered for the plan, if any
             
+        Yields:
+            Chunks of the executor's response
+        """
+        try:
+            # Gather tool results unless the caller already did
+            if context is None:
+                context = await self.gather_context_async(plan)
+            
+            # Stream content using the model manager
+            async for chunk in self.model_manager.generate_text_stream(self._build_prompt(context)):
+                yield chunk
+                
         except Exception as e:
             logger.error(f"Error executing plan: {str(e)}")
             # Return a fallback response in case of error
-            return "I'm sorry, I encountered an issue while processing your request. Please try again or ask a different question."
+            record_fallback("executor")
+            yield FALLBACK_RESPONSE
+    
+    @timed_stage("tools")
+    async def gather_context_async(self, plan: Dict[str, Any]) -> str:
+        """Run the tools required by the plan and build the model context.
+        
+        Independent tools run concurrently, each bounded by ``tool_timeout``;
+        a tool that fails or finishes late is simply left out of the context.
+        
+        Args:
+            plan: The plan dictionary from the planner agent
+            
+        Returns:
+            The context section for the execution prompt
+        """
+        # Extract plan details
+        plan_text = plan.get("plan", "")
+        requires_image_analysis = plan.get("requires_image_analysis", False)
+        requires_web_search = plan.get("requires_web_search", False)
+        image_path = plan.get("image_path", None)
+        image = plan.get("image", None)
+        
+        # Select the tools the plan needs
+        tools: Dict[str, ToolRunner] = {}
+        if requires_web_search:
+            tools["web_search"] = lambda deps: self.web_search.search_async(plan_text)
+        if requires_image_analysis and image_path:
+            tools["image_analysis"] = lambda deps: self.image_analysis.analyze_image_async(image_path, image=image)
+        
+        results = await self._run_tools(tools)
+        
+        # Prepare context for the model
+        context = f"Plan: {plan_text}\n\n" + self._format_conversation_context(plan)
+        if "web_search" in results:
+            context += self._format_search_context(results["web_search"])
+        if "image_analysis" in results:
+            context += self._format_analysis_context(results["image_analysis"])
+        
+        return context
+    
+    async def _run_tools(self, tools: Dict[str, ToolRunner]) -> Dict[str, Dict[str, Any]]:
+        """Run tools as a dependency graph with a per-tool timeout.
+        
+        Args:
+            tools: Mapping of tool name to runner
+            
+        Returns:
+            Results of the tools that completed in time
+        """
+        tasks: Dict[str, "asyncio.Task[Optional[Dict[str, Any]]]"] = {}
+        
+        async def run_tool(name: str) -> Optional[Dict[str, Any]]:
+            # Wait for dependencies that are part of this run
+            dependency_results = {}
+            for dependency in TOOL_DEPENDENCIES.get(name, ()):
+                if dependency in tasks:
+                    dependency_results[dependency] = await tasks[dependency]
+            
+            try:
+                with time_stage(name):
+                    return await asyncio.wait_for(tools[name](dependency_results), timeout=self.tool_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Tool {name} timed out after {self.tool_timeout}s; continuing without it")
+            except Exception as e:
+                logger.error(f"Error running tool {name}: {str(e)}")
+            return None
+        
+        for name in tools:
+            tasks[name] = asyncio.ensure_future(run_tool(name))
+        
+        completed = await asyncio.gather(*tasks.values())
+        return {name: result for name, result in zip(tasks, completed) if result is not None}
+    
+    def _format_conversation_context(self, plan: Dict[str, Any]) -> str:
+        """Format the session's earlier conversation carried by the plan as a context section."""
+        conversation = plan.get("conversation", "")
+        return f"{conversation}\n\n" if conversation else ""
+    
+    def _format_search_context(self, search_results: Dict[str, Any]) -> str:
+        """Format successful web search results as a context section."""
+        if not search_results.get("success", False):
+            return ""
+        formatted_results = self.web_search.format_search_results(search_results.get("results", []))
+        return f"Web Search Results:\n{formatted_results}\n\n"
+    
+    def _format_analysis_context(self, analysis_results: Dict[str, Any]) -> str:
+        """Format a successful image analysis as a context section."""
+        if not analysis_results.get("success", False):
+            return ""
+        return f"Image Analysis Results:\n{analysis_results.get('analysis', '')}\n\n"
+    
+    def _build_prompt(self, context: str) -> str:
+        """Build the execution prompt from the gathered context."""
+        return f"""You are an ecological assistant. Execute the following plan to provide a helpful response:
+            
+            {context}
+            
+            Based on the plan and available information, provide a detailed, accurate, and helpful response.
+            Focus on ecological information, gardening advice, plant identification, or research information as appropriate.
+            """
     
     def _perform_web_search(self, query: str) -> str:
-        """Perform a web search using the Brave Search API.
+        """Perform a web search and return the results as a string.
         
         Args:
             query: The search query
@@ -90,51 +256,7 @@ class ExecutorAgent:
         Returns:
             The search results as a string
         """
-        try:
-            if not BRAVE_API_KEY:
-                return "Web search capability not available."
-                
-            # Prepare the search query
-            search_query = query.strip()
-            
-            # Add ecological context to the query
-            if not any(term in search_query.lower() for term in ["plant", "ecology", "garden", "farm", "soil", "crop"]):
-                search_query = f"ecology {search_query}"
-            
-            # Make the API request
-            headers = {
-                "X-Subscription-Token": BRAVE_API_KEY,
-                "Accept": "application/json"
-            }
-            
-            params = {
-                "q": search_query,
-                "count": 5  # Limit to 5 results
-            }
-            
-            response = requests.get(
-                "https://api.search.brave.com/res/v1/web/search",
-                headers=headers,
-                params=params
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"Brave Search API error: {response.status_code}")
-                return "Web search failed."
-            
-            # Parse the response
-            data = response.json()
-            
-            # Extract the search results
-            results = []
-            for web in data.get("web", {}).get("results", []):
-                title = web.get("title", "")
-                description = web.get("description", "")
-                results.append(f"Title: {title}\nDescription: {description}\n")
-            
-            # Join the results
-            return "\n".join(results)
-            
-        except Exception as e:
-            logger.error(f"Error performing web search: {str(e)}")
-            return "Web search failed due to an error."
\ No newline at end of file
+        search_results = self.web_search.search(query)
+        if not search_results.get("success", False):
+            return "Web search failed."
+        return self.web_search.format_search_results(search_results.get("results", []))
\ No newline at end of file
@@ -0,0 +1,162 @@
+import asyncio
+import os
+import socket
+import uuid
+from typing import Dict, Any, List, Optional
+from loguru import logger
+from ..config import load_environment
+from .pipeline import ChatPipeline
+from ..services.job_queue import JobQueue, JOB_STALE_AFTER
+from ..services.chat_history import ChatHistoryService
+from ..utils.concurrency import run_blocking
+from ..models.scheduler import model_priority, PRIORITY_BACKGROUND
+from ..utils.request_context import begin_request, end_request
+
+# Load environment variables
+load_environment()
+
+# Configure job workers; disable in-process workers when running backend/worker.py separately
+JOB_IN_PROCESS_WORKERS = os.getenv("JOB_IN_PROCESS_WORKERS", "true").lower() in ("1", "true", "yes")
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", 2))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 0.5))
+JOB_MAINTENANCE_INTERVAL = float(os.getenv("JOB_MAINTENANCE_INTERVAL", 60))
+JOB_SHUTDOWN_GRACE = float(os.getenv("JOB_SHUTDOWN_GRACE", 30))
+
+# Running jobs are heartbeated well within JOB_STALE_AFTER so long pipeline runs are not requeued
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", JOB_STALE_AFTER / 5))
+
+class JobWorker:
+    """Pulls chat jobs off the queue and runs them through the pipeline.
+
+    Runs ``concurrency`` claim loops on the current event loop. It is started
+    inside the API process by default, or on its own by ``backend/worker.py``
+    so workers can be scaled separately from the API.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        pipeline: ChatPipeline,
+        concurrency: int = JOB_WORKER_CONCURRENCY,
+        poll_interval: float = JOB_POLL_INTERVAL,
+        chat_history: Optional[ChatHistoryService] = None
+    ):
+        """Initialize the worker.
+
+        Args:
+            queue: The job queue
+            pipeline: The chat pipeline jobs are run through
+            concurrency: Number of jobs processed at once
+            poll_interval: Seconds to wait before polling an empty queue again
+            chat_history: Optional history service that records turns of jobs sent with a session id
+        """
+        self.queue = queue
+        self.pipeline = pipeline
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.chat_history = chat_history
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._stopping: Optional[asyncio.Event] = None
+        self._tasks: List["asyncio.Task[None]"] = []
+
+    def start(self) -> None:
+        """Start the claim loops and queue maintenance on the running event loop."""
+        self._stopping = asyncio.Event()
+        # Jobs run at background priority so interactive chats are admitted first
+        with model_priority(PRIORITY_BACKGROUND):
+            self._tasks = [asyncio.ensure_future(self._claim_loop()) for _ in range(self.concurrency)]
+        self._tasks.append(asyncio.ensure_future(self._maintenance_loop()))
+        logger.info(f"JobWorker {self.worker_id} started with concurrency {self.concurrency}")
+
+    async def stop(self, grace: float = JOB_SHUTDOWN_GRACE) -> None:
+        """Stop claiming jobs and give the jobs in progress ``grace`` seconds to finish.
+
+        Jobs still running after the grace period are cancelled; they stay
+        ``running`` in the queue and are requeued once they go stale.
+        """
+        if self._stopping is None or not self._tasks:
+            return
+        self._stopping.set()
+        _, pending = await asyncio.wait(self._tasks, timeout=grace)
+        if pending:
+            logger.warning(f"Cancelling {len(pending)} jobs still running after {grace}s")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+        logger.info(f"JobWorker {self.worker_id} stopped")
+
+    async def wait(self) -> None:
+        """Block until the worker is stopped."""
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def process(self, job: Dict[str, Any]) -> None:
+        """Run one claimed job and store its outcome, logging under the id of the request that queued it."""
+        payload = job["payload"]
+        token = begin_request(payload.get("request_id") or job["id"])
+        logger.info(f"Processing job {job['id']} (attempt {job['attempts']})")
+        heartbeat = asyncio.ensure_future(self._heartbeat(job["id"]))
+        try:
+            response = await self.pipeline.run(
+                payload["message"],
+                payload.get("image_path"),
+                image_hash=payload.get("image_hash"),
+                session_id=payload.get("session_id")
+            )
+            heartbeat.cancel()
+            if not await run_blocking(self.queue.complete, job["id"], self.worker_id, response):
+                logger.warning(f"Discarding result of job {job['id']}, which was requeued to another worker")
+                return
+            if self.chat_history is not None:
+                self.chat_history.record_turn(
+                    payload.get("session_id"), payload["message"], response, payload.get("user_id")
+                )
+            logger.info(f"Completed job {job['id']}")
+        except Exception as e:
+            logger.error(f"Error processing job {job['id']}: {str(e)}")
+            heartbeat.cancel()
+            await run_blocking(self.queue.fail, job["id"], self.worker_id, str(e))
+        finally:
+            heartbeat.cancel()
+            end_request(token)
+
+    async def _heartbeat(self, job_id: str) -> None:
+        """Keep a running job fresh until cancelled or until the worker no longer holds it."""
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                if not await run_blocking(self.queue.heartbeat, job_id, self.worker_id):
+                    logger.warning(f"Job {job_id} is no longer held by this worker")
+                    return
+            except Exception as e:
+                logger.error(f"Error heartbeating job {job_id}: {str(e)}")
+
+    async def _claim_loop(self) -> None:
+        """Claim and process jobs until stopped, backing off while the queue is empty."""
+        while not self._stopping.is_set():
+            try:
+                job = await run_blocking(self.queue.claim, self.worker_id)
+            except Exception as e:
+                logger.error(f"Error claiming job: {str(e)}")
+                job = None
+            if job is None:
+                await self._sleep(self.poll_interval)
+                continue
+            await self.process(job)
+
+    async def _maintenance_loop(self) -> None:
+        """Periodically requeue jobs abandoned by dead workers and purge old results."""
+        while not self._stopping.is_set():
+            try:
+                await run_blocking(self.queue.requeue_stale)
+                await run_blocking(self.queue.purge_finished)
+            except Exception as e:
+                logger.error(f"Error maintaining job queue: {str(e)}")
+            await self._sleep(JOB_MAINTENANCE_INTERVAL)
+
+    async def _sleep(self, seconds: float) -> None:
+        """Sleep, waking early when the worker is stopped."""
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
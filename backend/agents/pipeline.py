@@ -0,0 +1,503 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass, replace
+from typing import Optional, AsyncIterator, Tuple, Dict, Any, List
+from loguru import logger
+from ..config import load_environment
+from .planner import PlannerAgent
+from .executor import ExecutorAgent
+from .evaluator import EvaluatorAgent
+from .router import QueryRouter
+from .evaluation_policy import EvaluationPolicy
+from .conversation import ConversationMemory
+from ..services.response_cache import ResponseCache
+from ..services.image_preprocessing import ImagePreprocessor, PreparedImage
+from ..services.image_references import ImageReferenceStore
+from ..utils.tokens import estimate_tokens
+from ..utils.batching import chunked
+from ..models.scheduler import model_priority, PRIORITY_BATCH
+from ..utils.metrics import tracked_in_progress, PIPELINE_RUNS_IN_PROGRESS
+from ..utils.logging import log_payload
+
+# Load environment variables
+load_environment()
+
+# Configure batch runs
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 500))
+BATCH_DEFAULT_CONCURRENCY = int(os.getenv("BATCH_DEFAULT_CONCURRENCY", 4))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", 16))
+
+# Number of batch items whose planner and evaluator prompts are packed into one model call
+BATCH_GROUP_SIZE = int(os.getenv("BATCH_GROUP_SIZE", 5))
+
+@dataclass(frozen=True)
+class BatchItem:
+    """One message of a batch request."""
+    index: int
+    message: str
+    image_path: Optional[str] = None
+    image_hash: Optional[str] = None
+
+@dataclass(frozen=True)
+class BatchResult:
+    """The outcome of one batch item; exactly one of ``response`` and ``error`` is set."""
+    index: int
+    response: Optional[str] = None
+    error: Optional[str] = None
+
+class ChatPipeline:
+    """Runs a chat message through the planner, executor and evaluator agents."""
+
+    def __init__(
+        self,
+        planner: PlannerAgent,
+        executor: ExecutorAgent,
+        evaluator: EvaluatorAgent,
+        response_cache: Optional[ResponseCache] = None,
+        image_preprocessor: Optional[ImagePreprocessor] = None,
+        router: Optional[QueryRouter] = None,
+        evaluation_policy: Optional[EvaluationPolicy] = None,
+        conversation_memory: Optional[ConversationMemory] = None,
+        image_references: Optional[ImageReferenceStore] = None
+    ):
+        """Initialize the pipeline with the shared agents.
+
+        Args:
+            planner: The planner agent
+            executor: The executor agent
+            evaluator: The evaluator agent
+            response_cache: Optional cache of final responses for repeated queries
+            image_preprocessor: Optional preprocessor that prepares each upload once for all stages
+            router: Optional router that sends simple queries straight to a single generation call
+            evaluation_policy: Optional policy deciding which drafts get the evaluator pass; all do if omitted
+            conversation_memory: Optional memory that gives messages sent with a session id the earlier conversation
+            image_references: Optional store that uploads each prepared image once so stages send a handle instead
+        """
+        self.planner = planner
+        self.executor = executor
+        self.evaluator = evaluator
+        self.response_cache = response_cache
+        self.image_preprocessor = image_preprocessor
+        self.router = router
+        self.evaluation_policy = evaluation_policy
+        self.conversation_memory = conversation_memory
+        self.image_references = image_references
+
+    @tracked_in_progress(PIPELINE_RUNS_IN_PROGRESS, "run")
+    async def run(
+        self,
+        message: str,
+        image_path: Optional[str] = None,
+        image_hash: Optional[str] = None,
+        session_id: Optional[str] = None
+    ) -> str:
+        """Produce the final response for a chat message without blocking the event loop.
+
+        Args:
+            message: The user's message
+            image_path: Optional path to an uploaded image
+            image_hash: Content hash of the image, required for cached image queries
+            session_id: Optional chat session whose earlier conversation informs the answer
+
+        Returns:
+            The final response, evaluated if the evaluation policy asks for it
+        """
+        started = time.perf_counter()
+
+        # Answers that depend on earlier turns are never served from or stored in the cache
+        conversation = await self._conversation(session_id)
+        cache_key = None if conversation else self._cache_key(message, image_path, image_hash)
+
+        # Answer repeated queries from the cache
+        if cache_key:
+            cached_response = await self.response_cache.get(cache_key)
+            if cached_response is not None:
+                logger.info("Serving chat response from cache")
+                return cached_response
+
+        # Simple queries are answered with a single generation call
+        if self._route_direct(message, image_path):
+            final_response = await self._answer_direct(message, started, conversation)
+        else:
+            # Decode and downscale the image once for every stage
+            image = await self._prepare_image(image_path)
+
+            # Generate plan
+            plan = await self.planner.create_plan_async(message, image_path, image=image, conversation=conversation)
+            log_payload("Generated plan", plan.get("plan"))
+
+            # Execute plan
+            result, context = await self._draft(plan)
+
+            # Evaluate result
+            final_response = await self._evaluate(result, message, context, started)
+            log_payload("Final response after evaluation", final_response)
+
+        if cache_key:
+            await self.response_cache.set(cache_key, final_response)
+
+        return final_response
+
+    @tracked_in_progress(PIPELINE_RUNS_IN_PROGRESS, "stream")
+    async def run_stream(
+        self,
+        message: str,
+        image_path: Optional[str] = None,
+        refine: bool = False,
+        image_hash: Optional[str] = None,
+        session_id: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Run the pipeline, yielding stage events and answer tokens as they happen.
+
+        Args:
+            message: The user's message
+            image_path: Optional path to an uploaded image
+            refine: Whether to stream the evaluator's refinement instead of the executor's draft
+            image_hash: Content hash of the image, required for cached image queries
+            session_id: Optional chat session whose earlier conversation informs the answer
+
+        Yields:
+            ``(event, data)`` pairs: ``planned`` (with the route taken), ``searching``, ``analyzing_image``,
+            ``drafted``, ``token`` and finally ``done`` with the full response;
+            a cache hit yields ``cached``, one ``token`` and ``done``
+        """
+        # Answers that depend on earlier turns are never served from or stored in the cache
+        conversation = await self._conversation(session_id)
+        cache_key = None if conversation else self._cache_key(message, image_path, image_hash)
+
+        # Answer repeated queries from the cache
+        if cache_key:
+            cached_response = await self.response_cache.get(cache_key)
+            if cached_response is not None:
+                logger.info("Serving streamed chat response from cache")
+                yield "cached", {}
+                yield "token", {"text": cached_response}
+                yield "done", {"response": cached_response}
+                return
+
+        # Simple queries skip the planner; otherwise plan with the prepared image
+        direct = self._route_direct(message, image_path)
+        if direct:
+            plan = self._direct_plan(message, conversation)
+        else:
+            # Decode and downscale the image once for every stage
+            image = await self._prepare_image(image_path)
+
+            # Generate plan
+            plan = await self.planner.create_plan_async(message, image_path, image=image, conversation=conversation)
+            log_payload("Generated plan", plan.get("plan"))
+        yield "planned", {
+            "route": "direct" if direct else "full",
+            "requires_web_search": plan.get("requires_web_search", False),
+            "requires_image_analysis": plan.get("requires_image_analysis", False)
+        }
+
+        # Announce and run the tools the plan needs
+        if plan.get("requires_web_search", False):
+            yield "searching", {}
+        if plan.get("requires_image_analysis", False) and plan.get("image_path"):
+            yield "analyzing_image", {}
+        context = await self.executor.gather_context_async(plan)
+
+        # Stream the answer, either directly from the executor or through the evaluator
+        chunks = []
+        if refine:
+            result = await self.executor.execute_plan_async(plan, context)
+            yield "drafted", {}
+            tokens = self.evaluator.evaluate_response_stream(result, message)
+        else:
+            tokens = self.executor.execute_plan_stream(plan, context)
+
+        async for chunk in tokens:
+            chunks.append(chunk)
+            yield "token", {"text": chunk}
+
+        final_response = "".join(chunks)
+        log_payload("Final streamed response", final_response)
+
+        if cache_key:
+            await self.response_cache.set(cache_key, final_response)
+
+        yield "done", {"response": final_response}
+
+    @tracked_in_progress(PIPELINE_RUNS_IN_PROGRESS, "batch")
+    async def run_batch(
+        self,
+        items: List[BatchItem],
+        concurrency: int,
+        group_size: int = BATCH_GROUP_SIZE
+    ) -> AsyncIterator[BatchResult]:
+        """Run many messages through the pipeline, yielding each result as soon as it is ready.
+
+        Items are split into groups of ``group_size``. Within a group the
+        planner prompts of text-only items, and the evaluator prompts of drafts
+        the evaluation policy selects, are packed into one model call each.
+        At most ``concurrency`` model-bound steps run at a time across the batch.
+
+        Args:
+            items: The batch items
+            concurrency: Maximum number of concurrent model-bound steps
+            group_size: Number of items whose planner and evaluator prompts are packed together
+
+        Yields:
+            One result per item, in completion order
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        results: "asyncio.Queue[BatchResult]" = asyncio.Queue()
+        # Tasks inherit the batch priority, so interactive chats are admitted first
+        with model_priority(PRIORITY_BATCH):
+            groups = {
+                asyncio.ensure_future(self._run_batch_group(group, semaphore, results)): group
+                for group in chunked(items, max(1, group_size))
+            }
+        owed = {item.index for item in items}
+        running = set(groups)
+        getter: Optional["asyncio.Future[BatchResult]"] = None
+        try:
+            while owed:
+                if getter is None:
+                    getter = asyncio.ensure_future(results.get())
+                done, running = await asyncio.wait({getter, *running}, return_when=asyncio.FIRST_COMPLETED)
+                running.discard(getter)
+                if getter in done:
+                    result = getter.result()
+                    getter = None
+                    owed.discard(result.index)
+                    yield result
+                for task in done & groups.keys():
+                    # A group that dies without a result for each item would leave the stream hanging
+                    while not results.empty():
+                        result = results.get_nowait()
+                        owed.discard(result.index)
+                        yield result
+                    unanswered = [item for item in groups[task] if item.index in owed]
+                    if unanswered:
+                        error = self._batch_group_error(task)
+                        for item in unanswered:
+                            owed.discard(item.index)
+                            yield BatchResult(item.index, error=error)
+        finally:
+            # Stop outstanding work if the consumer goes away
+            if getter is not None:
+                getter.cancel()
+            for task in groups:
+                task.cancel()
+
+    @staticmethod
+    def _batch_group_error(task: "asyncio.Future[None]") -> str:
+        """Describe why a batch group task stopped before answering all its items."""
+        if task.cancelled():
+            error = "Batch group was cancelled"
+        elif task.exception() is not None:
+            error = str(task.exception()) or type(task.exception()).__name__
+        else:
+            error = "Batch group finished without a result"
+        logger.error(f"Error processing batch group: {error}")
+        return error
+
+    async def _run_batch_group(
+        self,
+        group: List[BatchItem],
+        semaphore: asyncio.Semaphore,
+        results: "asyncio.Queue[BatchResult]"
+    ) -> None:
+        """Run one group of batch items, putting a result on the queue for every item."""
+        started = time.perf_counter()
+        finished = set()
+        direct_tasks: List["asyncio.Future[None]"] = []
+
+        async def finish(item: BatchItem, cache_key: Optional[str], response: str) -> None:
+            if cache_key:
+                await self.response_cache.set(cache_key, response)
+            finished.add(item.index)
+            await results.put(BatchResult(item.index, response=response))
+
+        async def fail(item: BatchItem, e: Exception) -> None:
+            logger.error(f"Error processing batch item {item.index}: {str(e)}")
+            finished.add(item.index)
+            await results.put(BatchResult(item.index, error=str(e)))
+
+        async def answer_direct(item: BatchItem, cache_key: Optional[str]) -> None:
+            try:
+                async with semaphore:
+                    response = await self._answer_direct(item.message, started)
+                await finish(item, cache_key, response)
+            except Exception as e:
+                await fail(item, e)
+
+        async def draft(item: BatchItem, plan: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+            try:
+                async with semaphore:
+                    return await self._draft(plan)
+            except Exception as e:
+                await fail(item, e)
+                return None
+
+        try:
+            # Serve cache hits and split the rest by route
+            direct, full = [], []
+            for item in group:
+                cache_key = self._cache_key(item.message, item.image_path, item.image_hash)
+                if cache_key:
+                    cached_response = await self.response_cache.get(cache_key)
+                    if cached_response is not None:
+                        finished.add(item.index)
+                        await results.put(BatchResult(item.index, response=cached_response))
+                        continue
+                if self._route_direct(item.message, item.image_path):
+                    direct.append((item, cache_key))
+                else:
+                    full.append((item, cache_key))
+            direct_tasks = [asyncio.ensure_future(answer_direct(item, key)) for item, key in direct]
+
+            # Plan text-only items with one packed call and image items one by one
+            text_items = [(item, key) for item, key in full if not item.image_path]
+            image_items = [(item, key) for item, key in full if item.image_path]
+            plans: List[Dict[str, Any]] = []
+            if text_items:
+                async with semaphore:
+                    plans = await self.planner.create_plans_async([item.message for item, _ in text_items])
+            for item, _ in image_items:
+                image = await self._prepare_image(item.image_path)
+                async with semaphore:
+                    plans.append(await self.planner.create_plan_async(item.message, item.image_path, image=image))
+            planned = text_items + image_items
+
+            # Draft every planned item concurrently
+            drafts = await asyncio.gather(*(draft(item, plan) for (item, _), plan in zip(planned, plans)))
+
+            # Release drafts that need no evaluation and refine the rest with one packed call
+            to_evaluate = []
+            for (item, cache_key), drafted in zip(planned, drafts):
+                if drafted is None:
+                    continue
+                result, context = drafted
+                evaluate, reason = self._should_evaluate(result, item.message, context)
+                if evaluate:
+                    to_evaluate.append((item, cache_key, result, reason))
+                else:
+                    self._record_evaluation(False, reason, started)
+                    await finish(item, cache_key, result)
+
+            if to_evaluate:
+                evaluation_started = time.perf_counter()
+                async with semaphore:
+                    refined = await self.evaluator.evaluate_responses_async(
+                        [(result, item.message) for item, _, result, _ in to_evaluate]
+                    )
+                evaluation_seconds = (time.perf_counter() - evaluation_started) / len(to_evaluate)
+                for (item, cache_key, result, reason), response in zip(to_evaluate, refined):
+                    self._record_evaluation(
+                        True,
+                        reason,
+                        started,
+                        evaluation_seconds=evaluation_seconds,
+                        evaluation_tokens=estimate_tokens([result, item.message, response])
+                    )
+                    await finish(item, cache_key, response)
+
+            await asyncio.gather(*direct_tasks)
+        except Exception as e:
+            # Every item must produce a result so the consumer is never left waiting
+            for task in direct_tasks:
+                task.cancel()
+            for item in group:
+                if item.index not in finished:
+                    await fail(item, e)
+
+    async def _conversation(self, session_id: Optional[str]) -> str:
+        """Return the session's earlier conversation fitted to the token budget, or "" without one."""
+        if not session_id or self.conversation_memory is None:
+            return ""
+        try:
+            context = await self.conversation_memory.build_context(session_id)
+        except Exception as e:
+            logger.error(f"Error building conversation context: {str(e)}")
+            return ""
+        return context.render()
+
+    def _direct_plan(self, message: str, conversation: str = "") -> Dict[str, Any]:
+        """Return the router's single-call plan, carrying the session's conversation."""
+        plan = self.router.direct_plan(message)
+        plan["conversation"] = conversation
+        return plan
+
+    async def _answer_direct(self, message: str, started: float, conversation: str = "") -> str:
+        """Answer a directly routed query with a single generation call."""
+        response = await self.executor.execute_plan_async(self._direct_plan(message, conversation))
+        log_payload("Direct response", response)
+        self._record_evaluation(False, "direct route", started)
+        return response
+
+    async def _draft(self, plan: Dict[str, Any]) -> Tuple[str, str]:
+        """Run the plan's tools and the executor, returning the draft and its context."""
+        context = await self.executor.gather_context_async(plan)
+        result = await self.executor.execute_plan_async(plan, context)
+        log_payload("Executed plan with result", result)
+        return result, context
+
+    async def _evaluate(self, result: str, message: str, context: str, started: float) -> str:
+        """Run the evaluator on a draft if the evaluation policy calls for it, recording the outcome."""
+        evaluate, reason = self._should_evaluate(result, message, context)
+        if not evaluate:
+            logger.info(f"Skipping evaluation ({reason})")
+            self._record_evaluation(False, reason, started)
+            return result
+
+        evaluation_started = time.perf_counter()
+        final_response = await self.evaluator.evaluate_response_async(result, message)
+        self._record_evaluation(
+            True,
+            reason,
+            started,
+            evaluation_seconds=time.perf_counter() - evaluation_started,
+            evaluation_tokens=estimate_tokens([result, message, final_response])
+        )
+        return final_response
+
+    def _should_evaluate(self, result: str, message: str, context: str) -> Tuple[bool, str]:
+        """Ask the evaluation policy about a draft; without a policy every draft is evaluated."""
+        if self.evaluation_policy is None:
+            return True, "always"
+        return self.evaluation_policy.should_evaluate(result, message, context)
+
+    def _record_evaluation(self, evaluated: bool, reason: str, started: float, **kwargs: Any) -> None:
+        """Record an evaluation decision with the policy, if there is one."""
+        if self.evaluation_policy is not None:
+            self.evaluation_policy.record(evaluated, reason, time.perf_counter() - started, **kwargs)
+
+    def _route_direct(self, message: str, image_path: Optional[str]) -> bool:
+        """Return whether the router sends this query down the single-call path."""
+        if self.router is None:
+            return False
+        return self.router.route(message, image_path).is_direct
+
+    async def _prepare_image(self, image_path: Optional[str]) -> Optional[PreparedImage]:
+        """Prepare the uploaded image, or return None to let stages read the file themselves.
+
+        With an image reference store the image is uploaded once, or its
+        earlier upload reused, and every stage sends the handle if the
+        provider holds a copy.
+        """
+        if not image_path or self.image_preprocessor is None:
+            return None
+        try:
+            image = await self.image_preprocessor.prepare(image_path)
+        except Exception as e:
+            logger.error(f"Error preprocessing image: {str(e)}")
+            return None
+        if self.image_references is not None:
+            handle = await self.image_references.get_or_upload(image)
+            if handle is not None:
+                image = replace(image, handle=handle)
+        return image
+
+    def _cache_key(self, message: str, image_path: Optional[str], image_hash: Optional[str]) -> Optional[str]:
+        """Return the response cache key, or None if the query cannot be cached."""
+        if self.response_cache is None:
+            return None
+        # Image queries are only cacheable when the image content is known
+        if image_path and not image_hash:
+            return None
+        return self.response_cache.make_key(message, image_hash)
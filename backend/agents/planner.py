@@ -1,82 +1,198 @@
-import google.generativeai as genai
-from typing import Optional, Dict, Any
-import os
+from typing import Optional, Dict, Any, List
 from loguru import logger
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-# Configure Google Generative AI
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+from ..models.model_manager import ModelManager
+from ..services.image_preprocessing import PreparedImage
+from ..utils.concurrency import run_blocking
+from ..utils.batching import parse_json_array
+from ..utils.metrics import timed_stage, record_fallback
 
 class PlannerAgent:
     """Agent responsible for creating a plan based on the user's message."""
     
-    def __init__(self):
-        """Initialize the planner agent with the Gemini model."""
+    def __init__(self, model_manager: Optional[ModelManager] = None):
+        """Initialize the planner agent.
+        
+        Args:
+            model_manager: Shared model manager; a private one is created if omitted
+        """
         try:
-            # Initialize the Gemini model
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
+            # Reuse the shared model manager when one is provided
+            self.model_manager = model_manager or ModelManager()
             logger.info("PlannerAgent initialized successfully")
         except Exception as e:
             logger.error(f"Error initializing PlannerAgent: {str(e)}")
             raise
     
-    def create_plan(self, message: str, image_path: Optional[str] = None) -> Dict[str, Any]:
+    def create_plan(
+        self,
+        message: str,
+        image_path: Optional[str] = None,
+        image: Optional[PreparedImage] = None,
+        conversation: str = ""
+    ) -> Dict[str, Any]:
         """Create a plan based on the user's message and optional image.
         
         Args:
             message: The user's message
             image_path: Optional path to an uploaded image
+            image: The already prepared image, used instead of reading the file
+            conversation: Earlier conversation in the session, already fitted to the token budget
             
         Returns:
             A dictionary containing the plan details
         """
         try:
             # Prepare the prompt for the model
-            prompt = f"""You are an ecological assistant. Create a plan to respond to the following query:
+            prompt = self._build_prompt(message, conversation)
             
-            User Query: {message}
+            # If an image is provided, include it in the generation
+            if image_path:
+                # Use the prepared image, or read the file
+                image_part = image.to_part() if image else self.model_manager.load_image_part(image_path)
+                
+                # Generate content with the image
+                plan = self.model_manager.generate_content([prompt, image_part])
+            else:
+                # Generate content without an image
+                plan = self.model_manager.generate_content(prompt)
             
-            Your plan should include:
-            1. What information needs to be gathered
-            2. What sources should be consulted
-            3. What format the response should take
+            return self._build_plan(plan, message, image_path, image, conversation)
             
-            Return your plan as a structured JSON object.
-            """
+        except Exception as e:
+            logger.error(f"Error creating plan: {str(e)}")
+            # Return a fallback plan in case of error
+            record_fallback("planner")
+            return self._fallback_plan(conversation)
+    
+    @timed_stage("planner")
+    async def create_plan_async(
+        self,
+        message: str,
+        image_path: Optional[str] = None,
+        image: Optional[PreparedImage] = None,
+        conversation: str = ""
+    ) -> Dict[str, Any]:
+        """Async counterpart of ``create_plan``.
+        
+        Args:
+            message: The user's message
+            image_path: Optional path to an uploaded image
+            image: The already prepared image, used instead of reading the file
+            conversation: Earlier conversation in the session, already fitted to the token budget
+            
+        Returns:
+            A dictionary containing the plan details
+        """
+        try:
+            # Prepare the prompt for the model
+            prompt = self._build_prompt(message, conversation)
             
             # If an image is provided, include it in the generation
             if image_path:
-                # Read the image file
-                with open(image_path, "rb") as f:
-                    image_data = f.read()
+                # Use the prepared image, or read the file off the event loop
+                if image:
+                    image_part = image.to_part()
+                else:
+                    image_part = await run_blocking(self.model_manager.load_image_part, image_path)
                 
                 # Generate content with the image
-                response = self.model.generate_content([prompt, image_data])
+                plan = await self.model_manager.generate_content_async([prompt, image_part])
             else:
                 # Generate content without an image
-                response = self.model.generate_content(prompt)
-            
-            # Extract the plan from the response
-            plan = response.text
+                plan = await self.model_manager.generate_content_async(prompt)
             
-            # For now, return a simple dictionary with the plan
-            # In a real implementation, this would parse the response into a structured format
-            return {
-                "plan": plan,
-                "requires_image_analysis": image_path is not None,
-                "requires_web_search": "research" in message.lower() or "information" in message.lower(),
-                "requires_database": False  # Could be determined based on the plan
-            }
+            return self._build_plan(plan, message, image_path, image, conversation)
             
         except Exception as e:
             logger.error(f"Error creating plan: {str(e)}")
             # Return a fallback plan in case of error
-            return {
-                "plan": "Provide a simple response based on general knowledge",
-                "requires_image_analysis": False,
-                "requires_web_search": False,
-                "requires_database": False
-            }
\ No newline at end of file
+            record_fallback("planner")
+            return self._fallback_plan(conversation)
+    
+    @timed_stage("planner_batch")
+    async def create_plans_async(self, messages: List[str]) -> List[Dict[str, Any]]:
+        """Create plans for several text-only messages with one packed model call.
+        
+        If the packed output cannot be matched back to the messages, each
+        message is planned with its own call instead.
+        
+        Args:
+            messages: The users' messages
+            
+        Returns:
+            One plan dictionary per message, in order
+        """
+        if len(messages) == 1:
+            return [await self.create_plan_async(messages[0])]
+        
+        try:
+            packed = await self.model_manager.generate_content_async(self._build_batch_prompt(messages))
+            plans = parse_json_array(packed, len(messages))
+            if plans is not None:
+                return [self._build_plan(plan, message, None) for plan, message in zip(plans, messages)]
+            logger.warning(f"Packed plan output did not match {len(messages)} queries; planning individually")
+        except Exception as e:
+            logger.error(f"Error creating packed plans: {str(e)}")
+        
+        return [await self.create_plan_async(message) for message in messages]
+    
+    def _build_prompt(self, message: str, conversation: str = "") -> str:
+        """Build the planning prompt for a user message, after the session's conversation if any."""
+        history = f"{conversation}\n\n            " if conversation else ""
+        return f"""You are an ecological assistant. Create a plan to respond to the following query:
+            
+            {history}User Query: {message}
+            
+            Your plan should include:
+            1. What information needs to be gathered
+            2. What sources should be consulted
+            3. What format the response should take
+            
+            Return your plan as a structured JSON object.
+            """
+    
+    def _build_batch_prompt(self, messages: List[str]) -> str:
+        """Build a planning prompt covering several numbered messages."""
+        queries = "\n".join(f"{i}. {message}" for i, message in enumerate(messages, 1))
+        return f"""You are an ecological assistant. Create a plan to respond to each of the following numbered queries:
+            
+            {queries}
+            
+            Each plan should include:
+            1. What information needs to be gathered
+            2. What sources should be consulted
+            3. What format the response should take
+            
+            Return only a JSON array with exactly {len(messages)} strings, where element i is the plan for query i.
+            """
+    
+    def _build_plan(
+        self,
+        plan: str,
+        message: str,
+        image_path: Optional[str],
+        image: Optional[PreparedImage] = None,
+        conversation: str = ""
+    ) -> Dict[str, Any]:
+        """Wrap the generated plan text in the plan dictionary used by the executor."""
+        # For now, return a simple dictionary with the plan
+        # In a real implementation, this would parse the response into a structured format
+        return {
+            "plan": plan,
+            "requires_image_analysis": image_path is not None,
+            "requires_web_search": "research" in message.lower() or "information" in message.lower(),
+            "requires_database": False,  # Could be determined based on the plan
+            "image_path": image_path,
+            "image": image,
+            "conversation": conversation
+        }
+    
+    def _fallback_plan(self, conversation: str = "") -> Dict[str, Any]:
+        """Return the plan used when plan generation fails."""
+        return {
+            "plan": "Provide a simple response based on general knowledge",
+            "requires_image_analysis": False,
+            "requires_web_search": False,
+            "requires_database": False,
+            "conversation": conversation
+        }
\ No newline at end of file
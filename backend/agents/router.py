@@ -0,0 +1,167 @@
+import json
+import math
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, Any, Optional
+from loguru import logger
+from ..config import load_environment
+
+# Load environment variables
+load_environment()
+
+# Configure the query router
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "true").lower() in ("1", "true", "yes")
+ROUTER_MODEL_PATH = os.getenv(
+    "ROUTER_MODEL_PATH",
+    os.path.join(os.path.dirname(__file__), "router_model.json")
+)
+ROUTER_THRESHOLD = float(os.getenv("ROUTER_THRESHOLD", 0.6))
+
+# Queries longer than this always take the full pipeline
+ROUTER_MAX_DIRECT_WORDS = int(os.getenv("ROUTER_MAX_DIRECT_WORDS", 30))
+
+# Keywords the planner treats as requiring a web search
+SEARCH_KEYWORDS = ("research", "information")
+
+# Short conversational messages that never need planning
+SMALL_TALK_PATTERN = re.compile(
+    r"^(hi|hello|hey|good (morning|afternoon|evening)|thanks|thank you|ok|okay|bye|goodbye)\b",
+    re.IGNORECASE
+)
+
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+SENTENCE_PATTERN = re.compile(r"[.!?]+(\s|$)")
+
+@dataclass(frozen=True)
+class RouteDecision:
+    """Where a query is sent and why."""
+    route: str
+    score: float
+    reason: str
+
+    @property
+    def is_direct(self) -> bool:
+        """Whether the query takes the single-call path."""
+        return self.route == "direct"
+
+def extract_features(message: str) -> Dict[str, float]:
+    """Return the numeric features the router model scores.
+
+    Args:
+        message: The user's message
+
+    Returns:
+        Mapping of feature name to value
+    """
+    words = WORD_PATTERN.findall(message.lower())
+    return {
+        "word_count": float(len(words)),
+        "extra_sentences": float(max(len(SENTENCE_PATTERN.findall(message.strip())) - 1, 0)),
+        "extra_questions": float(max(message.count("?") - 1, 0)),
+        "conjunctions": float(sum(1 for word in words if word in ("and", "also", "but", "versus", "vs"))),
+    }
+
+class QueryRouter:
+    """Classifies queries locally so simple ones skip the planner and evaluator.
+
+    Hard rules come first: image queries and queries that need a web search
+    always take the full pipeline, small talk always goes direct. Everything
+    else is scored by a logistic model whose weights are read from a JSON file
+    on disk; a probability of at least ``threshold`` sends the query direct.
+    """
+
+    def __init__(
+        self,
+        model_path: Optional[str] = ROUTER_MODEL_PATH,
+        threshold: float = ROUTER_THRESHOLD,
+        enabled: bool = ROUTER_ENABLED
+    ):
+        """Initialize the router and load its model.
+
+        Args:
+            model_path: JSON file with the model weights; rules only if missing
+            threshold: Minimum model probability for the direct route
+            enabled: Whether to route at all; when False every query takes the full pipeline
+        """
+        self.enabled = enabled
+        self.model = self._load_model(model_path)
+        self.threshold = threshold
+        self.counts = {"direct": 0, "full": 0}
+        logger.info(f"QueryRouter initialized (enabled={enabled}, threshold={self.threshold})")
+
+    def route(self, message: str, image_path: Optional[str] = None) -> RouteDecision:
+        """Decide whether a query takes the direct or the full pipeline.
+
+        Args:
+            message: The user's message
+            image_path: Optional path to an uploaded image
+
+        Returns:
+            The routing decision
+        """
+        decision = self._decide(message, image_path)
+        self.counts[decision.route] += 1
+        logger.info(f"Routed query to {decision.route} path ({decision.reason}, score={decision.score:.2f})")
+        return decision
+
+    def direct_plan(self, message: str) -> Dict[str, Any]:
+        """Return the plan executed for a directly routed query, without any tools."""
+        return {
+            "plan": f"Answer the user's question directly and concisely.\n\nUser Query: {message}",
+            "requires_image_analysis": False,
+            "requires_web_search": False,
+            "requires_database": False
+        }
+
+    def score(self, message: str) -> float:
+        """Return the model's probability that a query can be answered directly."""
+        total = self.model.get("bias", 0.0)
+        feature_weights = self.model.get("features", {})
+        for name, value in extract_features(message).items():
+            total += feature_weights.get(name, 0.0) * value
+        token_weights = self.model.get("tokens", {})
+        for word in set(WORD_PATTERN.findall(message.lower())):
+            total += token_weights.get(word, 0.0)
+        return 1.0 / (1.0 + math.exp(-total))
+
+    def get_stats(self) -> Dict[str, int]:
+        """Return how many queries took each route."""
+        return dict(self.counts)
+
+    def _decide(self, message: str, image_path: Optional[str]) -> RouteDecision:
+        """Apply the rules, then the model."""
+        if not self.enabled:
+            return RouteDecision("full", 0.0, "router disabled")
+        if image_path:
+            return RouteDecision("full", 0.0, "image attached")
+
+        lowered = message.lower()
+        if any(keyword in lowered for keyword in SEARCH_KEYWORDS):
+            return RouteDecision("full", 0.0, "web search needed")
+        word_count = len(WORD_PATTERN.findall(lowered))
+        if word_count > ROUTER_MAX_DIRECT_WORDS:
+            return RouteDecision("full", 0.0, "long query")
+        if word_count <= 6 and SMALL_TALK_PATTERN.match(message.strip()):
+            return RouteDecision("direct", 1.0, "small talk")
+
+        if not self.model:
+            return RouteDecision("full", 0.0, "no router model")
+        score = self.score(message)
+        if score >= self.threshold:
+            return RouteDecision("direct", score, "model")
+        return RouteDecision("full", score, "model")
+
+    @staticmethod
+    def _load_model(model_path: Optional[str]) -> Dict[str, Any]:
+        """Read the model weights, returning an empty model if they are unavailable."""
+        if not model_path:
+            return {}
+        try:
+            with open(model_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            logger.warning(f"Router model {model_path} not found; routing with rules only")
+        except Exception as e:
+            logger.error(f"Error loading router model: {str(e)}")
+        return {}
@@ -1,14 +1,50 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from pydantic import BaseModel
-from typing import Optional
-import os
+from typing import Optional, Dict, Any, AsyncIterator, Tuple, List
+import asyncio
+import json
+import time
+import uuid
 from loguru import logger
-from ..agents.planner import PlannerAgent
-from ..agents.executor import ExecutorAgent
-from ..agents.evaluator import EvaluatorAgent
+from ..agents.pipeline import (
+    ChatPipeline,
+    BatchItem,
+    BATCH_MAX_ITEMS,
+    BATCH_DEFAULT_CONCURRENCY,
+    BATCH_MAX_CONCURRENCY
+)
+from ..services.upload_store import UploadStore, MAX_UPLOAD_BYTES
+from ..services.job_queue import JobQueue
+from ..services.chat_history import ChatHistoryService
+from ..services.database import SESSION_PAGE_SIZE, MESSAGE_PAGE_SIZE, MAX_PAGE_SIZE
+from ..agents.job_worker import JOB_POLL_INTERVAL
+from ..utils.concurrency import run_blocking
+from ..utils.error_handling import AppError
+from ..utils.metrics import (
+    HTTP_REQUEST_SECONDS,
+    REQUESTS_IN_PROGRESS,
+    render_metrics,
+    track_in_progress
+)
+from ..utils.logging import setup_logging, log_payload
+from ..utils.request_context import current_request_id
+from .request_logging import RequestLoggingMiddleware
+from .dependencies import (
+    lifespan,
+    get_pipeline,
+    get_container,
+    get_upload_store,
+    get_job_queue,
+    get_chat_history,
+    ServiceContainer
+)
+
+# Configure logging before the app starts handling requests
+setup_logging()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -17,53 +53,403 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
 
+# Allowance for multipart framing and form fields on top of the image itself
+REQUEST_OVERHEAD_BYTES = 64 * 1024
+
+@app.middleware("http")
+async def reject_oversized_requests(request: Request, call_next):
+    """Reject requests whose declared body is too large before the body is parsed."""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES + REQUEST_OVERHEAD_BYTES:
+        return JSONResponse(status_code=413, content={"detail": "Request body too large"})
+    return await call_next(request)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Record in-flight requests and request latency by route template."""
+    if request.url.path == "/metrics":
+        return await call_next(request)
+    started = time.perf_counter()
+    status = 500
+    with track_in_progress(REQUESTS_IN_PROGRESS, request.method):
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            # Label by the matched route's template so ids in paths do not multiply series
+            route = request.scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                request.method, getattr(route, "path", "unmatched"), str(status)
+            ).observe(time.perf_counter() - started)
+
+# Added last so it is outermost: the request id covers every other middleware and the full streamed body
+app.add_middleware(RequestLoggingMiddleware)
+
+async def _save_upload(
+    image: Optional[UploadFile],
+    upload_store: UploadStore,
+    image_hash: Optional[str] = None
+) -> Tuple[Optional[str], Optional[str]]:
+    """Store an uploaded image and return its path and content hash, or (None, None) if no image was sent.
+    
+    Without an upload, ``image_hash`` refers to an image stored earlier, so
+    follow-up questions about the same photo need not send it again.
+    """
+    if not image:
+        if not image_hash:
+            return None, None
+        stored = upload_store.find(image_hash)
+        if stored is None:
+            raise HTTPException(status_code=404, detail="Unknown image_hash")
+        return stored.path, stored.sha256
+    
+    try:
+        stored = await upload_store.save(image)
+    except AppError as e:
+        logger.warning(f"Rejected upload: {e.message}")
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    return stored.path, stored.sha256
+
+def _validate_session_id(session_id: Optional[str]) -> Optional[str]:
+    """Return a session id in canonical form, rejecting ids the database would refuse."""
+    if not session_id:
+        return None
+    try:
+        return str(uuid.UUID(session_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="session_id must be a UUID")
+
+def _format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Format a Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 class ChatResponse(BaseModel):
     response: str
     session_id: Optional[str] = None
+    image_hash: Optional[str] = None
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+
+class UploadResponse(BaseModel):
+    image_hash: str
+    size: int
+
+class BatchChatItem(BaseModel):
+    message: str
+    image_hash: Optional[str] = None
+    id: Optional[str] = None
+
+class BatchChatRequest(BaseModel):
+    items: List[BatchChatItem]
+    concurrency: Optional[int] = None
 
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat_endpoint(
     message: str = Form(...),
-    image: Optional[UploadFile] = File(None)
+    image: Optional[UploadFile] = File(None),
+    image_hash: Optional[str] = Form(None),
+    background: bool = Form(False),
+    session_id: Optional[str] = Form(None),
+    user_id: Optional[str] = Form(None),
+    pipeline: ChatPipeline = Depends(get_pipeline),
+    upload_store: UploadStore = Depends(get_upload_store),
+    job_queue: JobQueue = Depends(get_job_queue),
+    chat_history: ChatHistoryService = Depends(get_chat_history)
 ):
+    """Answer a chat message.
+    
+    With ``background=true`` the message is queued and a ``202`` with a job id
+    is returned at once; poll ``/api/jobs/{job_id}`` or subscribe to
+    ``/api/jobs/{job_id}/events`` for the result. With a ``session_id`` (a
+    UUID) the answer takes the session's earlier conversation into account
+    and the turn is saved to the session's history in the background; the
+    session is created for ``user_id`` on its first turn. Follow-up
+    questions about a photo can send the returned ``image_hash`` instead of
+    the image.
+    """
+    session_id = _validate_session_id(session_id)
     try:
         # Log incoming request
-        logger.info(f"Received chat request with message: {message}")
-        
-        # Save image if provided
-        image_path = None
-        if image:
-            # Create uploads directory if it doesn't exist
-            os.makedirs("uploads", exist_ok=True)
-            
-            # Save the uploaded image
-            image_path = f"uploads/{image.filename}"
-            with open(image_path, "wb") as f:
-                f.write(await image.read())
-            logger.info(f"Saved uploaded image to {image_path}")
+        log_payload("Received chat request with message", message)
         
-        # Initialize agents
-        planner = PlannerAgent()
-        executor = ExecutorAgent()
-        evaluator = EvaluatorAgent()
+        # Save image if provided, or find the one referred to by hash
+        image_path, image_hash = await _save_upload(image, upload_store, image_hash)
         
-        # Generate plan
-        plan = planner.create_plan(message, image_path)
-        logger.info(f"Generated plan: {plan}")
+        # Queue long-running work for the job workers
+        if background:
+            job_id = await run_blocking(
+                job_queue.enqueue,
+                {
+                    "message": message,
+                    "image_path": image_path,
+                    "image_hash": image_hash,
+                    "session_id": session_id,
+                    "user_id": user_id,
+                    "request_id": current_request_id()
+                }
+            )
+            logger.info(f"Queued chat job {job_id}")
+            return JSONResponse(status_code=202, content=JobResponse(job_id=job_id, status="queued").model_dump())
         
-        # Execute plan
-        result = executor.execute_plan(plan)
-        logger.info(f"Executed plan with result: {result}")
+        # Run the planner, executor and evaluator
+        final_response = await pipeline.run(message, image_path, image_hash=image_hash, session_id=session_id)
         
-        # Evaluate result
-        final_response = evaluator.evaluate_response(result, message)
-        logger.info(f"Final response after evaluation: {final_response}")
+        # Persist the turn without waiting for the database
+        chat_history.record_turn(session_id, message, final_response, user_id)
         
         # Return response
-        return ChatResponse(response=final_response)
+        return ChatResponse(response=final_response, session_id=session_id, image_hash=image_hash)
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing chat request: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(
+    message: str = Form(...),
+    image: Optional[UploadFile] = File(None),
+    image_hash: Optional[str] = Form(None),
+    refine: bool = Form(False),
+    session_id: Optional[str] = Form(None),
+    user_id: Optional[str] = Form(None),
+    pipeline: ChatPipeline = Depends(get_pipeline),
+    upload_store: UploadStore = Depends(get_upload_store),
+    chat_history: ChatHistoryService = Depends(get_chat_history)
+):
+    """Stream pipeline stage events and answer tokens as Server-Sent Events.
+    
+    By default the executor's answer is streamed directly for the lowest
+    time-to-first-token; pass ``refine=true`` to stream the evaluator's
+    refinement instead. As with ``/api/chat``, ``image_hash`` may stand in for
+    an image sent before, and ``session_id`` and ``user_id`` work the same way.
+    """
+    session_id = _validate_session_id(session_id)
+    log_payload("Received streaming chat request with message", message)
+    
+    # Save the image before the response starts so upload errors surface as HTTP errors
+    try:
+        image_path, image_hash = await _save_upload(image, upload_store, image_hash)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error saving uploaded image: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def event_stream() -> AsyncIterator[str]:
+        try:
+            async for event, data in pipeline.run_stream(
+                message, image_path, refine=refine, image_hash=image_hash, session_id=session_id
+            ):
+                if event == "done":
+                    chat_history.record_turn(session_id, message, data["response"], user_id)
+                yield _format_sse(event, data)
+        except Exception as e:
+            logger.error(f"Error streaming chat response: {str(e)}")
+            yield _format_sse("error", {"message": str(e)})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/jobs/stats")
+async def job_stats_endpoint(job_queue: JobQueue = Depends(get_job_queue)):
+    """Return the number of background jobs in each state."""
+    return await run_blocking(job_queue.get_stats)
+
+@app.get("/api/jobs/{job_id}")
+async def job_status_endpoint(job_id: str, job_queue: JobQueue = Depends(get_job_queue)):
+    """Return a background job's status, with its result once completed."""
+    job = await run_blocking(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events_endpoint(job_id: str, job_queue: JobQueue = Depends(get_job_queue)):
+    """Stream a background job's status changes as Server-Sent Events, ending with ``completed`` or ``failed``."""
+    job = await run_blocking(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def event_stream() -> AsyncIterator[str]:
+        current = job
+        last_status = None
+        while True:
+            if current is None:
+                yield _format_sse("error", {"message": "Job not found"})
+                return
+            if current["status"] != last_status:
+                last_status = current["status"]
+                yield _format_sse(last_status, current)
+                if last_status in ("completed", "failed"):
+                    return
+            # Workers may live in other processes, so poll the queue
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+            current = await run_blocking(job_queue.get, job_id)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/uploads", response_model=UploadResponse)
+async def upload_endpoint(
+    image: UploadFile = File(...),
+    upload_store: UploadStore = Depends(get_upload_store)
+):
+    """Store an image once so batch items can refer to it by ``image_hash``."""
+    try:
+        stored = await upload_store.save(image)
+    except AppError as e:
+        logger.warning(f"Rejected upload: {e.message}")
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    return UploadResponse(image_hash=stored.sha256, size=stored.size)
+
+@app.post("/api/chat/batch")
+async def chat_batch_endpoint(
+    batch: BatchChatRequest,
+    pipeline: ChatPipeline = Depends(get_pipeline),
+    upload_store: UploadStore = Depends(get_upload_store)
+):
+    """Answer many messages with bounded concurrency, streaming NDJSON lines as items finish.
+    
+    Each line is ``{"index", "id", "response"}`` or ``{"index", "id", "error"}``,
+    where ``index`` is the item's position in the request. Images are referred to
+    by the ``image_hash`` returned from ``/api/uploads``.
+    """
+    if not batch.items:
+        raise HTTPException(status_code=400, detail="Batch contains no items")
+    if len(batch.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch exceeds the {BATCH_MAX_ITEMS} item limit")
+    concurrency = min(max(batch.concurrency or BATCH_DEFAULT_CONCURRENCY, 1), BATCH_MAX_CONCURRENCY)
+    logger.info(f"Received batch chat request with {len(batch.items)} items (concurrency={concurrency})")
+    
+    # Resolve image references up front; unknown ones fail only their own item
+    items, unresolved = [], []
+    for index, item in enumerate(batch.items):
+        if item.image_hash:
+            stored = upload_store.find(item.image_hash)
+            if stored is None:
+                unresolved.append(index)
+                continue
+            items.append(BatchItem(index, item.message, stored.path, stored.sha256))
+        else:
+            items.append(BatchItem(index, item.message))
+    
+    def format_line(index: int, **fields: Any) -> str:
+        return json.dumps({"index": index, "id": batch.items[index].id, **fields}) + "\n"
+    
+    async def result_stream() -> AsyncIterator[str]:
+        for index in unresolved:
+            yield format_line(index, error="Unknown image_hash")
+        try:
+            async for result in pipeline.run_batch(items, concurrency):
+                if result.error is not None:
+                    yield format_line(result.index, error=result.error)
+                else:
+                    yield format_line(result.index, response=result.response)
+        except Exception as e:
+            logger.error(f"Error processing batch: {str(e)}")
+            yield json.dumps({"error": str(e)}) + "\n"
+    
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/sessions")
+async def list_sessions_endpoint(
+    user_id: str = Query(..., min_length=1),
+    limit: int = Query(SESSION_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: str = "summary",
+    chat_history: ChatHistoryService = Depends(get_chat_history)
+):
+    """Return a page of a user's chat sessions, newest first.
+    
+    ``user_id`` is required; sessions are never listed across users. Pass
+    the returned ``next_cursor`` as ``cursor`` to fetch the next page; it is
+    null on the last page. ``fields=full`` returns every column.
+    """
+    try:
+        return await chat_history.list_sessions(user_id, limit, cursor, fields)
+    except AppError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+
+@app.get("/api/sessions/{session_id}/messages")
+async def list_messages_endpoint(
+    session_id: str,
+    user_id: str = Query(..., min_length=1),
+    limit: int = Query(MESSAGE_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    fields: str = "summary",
+    chat_history: ChatHistoryService = Depends(get_chat_history)
+):
+    """Return a page of a session's messages in chronological order, starting from the newest.
+    
+    The session must belong to ``user_id``; otherwise the response is a 404,
+    as for a session that does not exist. Pass the returned ``next_cursor``
+    as ``before`` to fetch older messages; it is null once the start of the
+    session is reached.
+    """
+    session_id = _validate_session_id(session_id)
+    try:
+        return await chat_history.get_messages(session_id, user_id, limit, before, fields)
+    except AppError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Expose Prometheus metrics."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/api/cache/stats")
+async def cache_stats_endpoint(container: ServiceContainer = Depends(get_container)):
+    """Return hit/miss counters for the response cache."""
+    if container.response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **container.response_cache.get_stats()}
+
+@app.get("/api/history/stats")
+async def history_stats_endpoint(container: ServiceContainer = Depends(get_container)):
+    """Return hit/miss counters and size of this worker's chat history cache."""
+    if container.history_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **container.history_cache.get_stats()}
+
+@app.get("/api/conversation/stats")
+async def conversation_stats_endpoint(container: ServiceContainer = Depends(get_container)):
+    """Return conversation context and background summarization counters."""
+    if container.conversation_memory is None:
+        return {"enabled": False}
+    return {"enabled": True, **container.conversation_memory.get_stats()}
+
+@app.get("/api/images/stats")
+async def image_stats_endpoint(container: ServiceContainer = Depends(get_container)):
+    """Return reuse and upload counters for image handles."""
+    if container.image_references is None:
+        return {"enabled": False}
+    return {"enabled": True, **container.image_references.get_stats()}
+
+@app.get("/api/model/stats")
+async def model_stats_endpoint(container: ServiceContainer = Depends(get_container)):
+    """Return model call queue depth, concurrency limit, admission counters and per-backend routing stats."""
+    return container.model_manager.get_stats()
+
+@app.get("/api/evaluation/stats")
+async def evaluation_stats_endpoint(container: ServiceContainer = Depends(get_container)):
+    """Return evaluator decisions, latency and estimated token spend and savings for the active evaluation policy."""
+    return container.evaluation_policy.get_stats()
\ No newline at end of file
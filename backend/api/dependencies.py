@@ -0,0 +1,190 @@
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from loguru import logger
+from ..agents.planner import PlannerAgent
+from ..agents.executor import ExecutorAgent
+from ..agents.evaluator import EvaluatorAgent
+from ..agents.pipeline import ChatPipeline
+from ..agents.router import QueryRouter
+from ..agents.evaluation_policy import EvaluationPolicy
+from ..agents.conversation import ConversationMemory
+from ..agents.job_worker import JobWorker, JOB_IN_PROCESS_WORKERS
+from ..models.model_manager import ModelManager
+from ..services.web_search import WebSearchService
+from ..services.image_analysis import ImageAnalysisService
+from ..services.image_analysis_cache import ImageAnalysisCache
+from ..services.response_cache import create_response_cache
+from ..services.image_preprocessing import ImagePreprocessor
+from ..services.image_references import create_image_reference_store
+from ..services.upload_store import UploadStore
+from ..services.job_queue import JobQueue
+from ..services.database import DatabaseService
+from ..services.write_behind import WriteBehindBuffer
+from ..services.chat_history import ChatHistoryService
+from ..services.history_cache import HistoryCache, create_invalidation_channel
+from ..config import get_settings
+from ..utils.concurrency import run_blocking, shutdown_blocking_pool
+from ..utils.http import close_http_clients
+
+class ServiceContainer:
+    """Process-wide holder for the agents and services shared by all requests."""
+
+    def __init__(self):
+        """Build the shared model manager, services and agents once per worker."""
+        try:
+            # One model manager backs every agent and service
+            self.model_manager = ModelManager()
+
+            # Services
+            self.web_search = WebSearchService()
+            self.image_analysis_cache = ImageAnalysisCache()
+            self.image_analysis = ImageAnalysisService(
+                model_manager=self.model_manager,
+                analysis_cache=self.image_analysis_cache
+            )
+            self.image_preprocessor = ImagePreprocessor()
+            self.image_references = create_image_reference_store()
+            self.upload_store = UploadStore()
+
+            # Chat history, written behind the request through a buffered spill file
+            # and read through a per-worker cache of recent messages
+            self.database = DatabaseService()
+            self.write_buffer = WriteBehindBuffer(self.database) if self.database.configured else None
+            self.history_cache = HistoryCache(channel=create_invalidation_channel()) if self.database.configured else None
+            self.chat_history = ChatHistoryService(self.database, self.write_buffer, self.history_cache)
+
+            # Agents
+            self.planner = PlannerAgent(model_manager=self.model_manager)
+            self.executor = ExecutorAgent(
+                model_manager=self.model_manager,
+                web_search=self.web_search,
+                image_analysis=self.image_analysis
+            )
+            self.evaluator = EvaluatorAgent(model_manager=self.model_manager)
+            self.router = QueryRouter()
+            self.evaluation_policy = EvaluationPolicy()
+            self.conversation_memory = (
+                ConversationMemory(self.chat_history, self.model_manager)
+                if self.database.configured else None
+            )
+
+            # Pipeline, fronted by the response cache
+            self.response_cache = create_response_cache()
+            self.pipeline = ChatPipeline(
+                self.planner,
+                self.executor,
+                self.evaluator,
+                response_cache=self.response_cache,
+                image_preprocessor=self.image_preprocessor,
+                router=self.router,
+                evaluation_policy=self.evaluation_policy,
+                conversation_memory=self.conversation_memory,
+                image_references=self.image_references
+            )
+
+            # Background jobs, run in this process unless workers are deployed separately
+            self.job_queue = JobQueue()
+            self.job_worker = (
+                JobWorker(self.job_queue, self.pipeline, chat_history=self.chat_history)
+                if JOB_IN_PROCESS_WORKERS else None
+            )
+
+            logger.info("ServiceContainer initialized successfully")
+        except Exception as e:
+            logger.error(f"Error initializing ServiceContainer: {str(e)}")
+            raise
+
+    def start(self) -> None:
+        """Start background work that needs the running event loop."""
+        if self.write_buffer is not None:
+            self.write_buffer.start()
+        if self.job_worker is not None:
+            self.job_worker.start()
+        self.start_preload()
+
+    def start_preload(self) -> None:
+        """Load the model and database SDKs on a background thread, unless PRELOAD_SDKS is off.
+
+        The SDKs are imported on first use so the app serves sooner after a
+        restart; preloading moves that cost off the first requests.
+        """
+        if get_settings().preload_sdks:
+            asyncio.ensure_future(run_blocking(self._preload_sdks))
+
+    def _preload_sdks(self) -> None:
+        """Import the SDKs the services use; blocking."""
+        try:
+            for backend in self.model_manager.pool.backends:
+                backend.load()
+            if self.database.configured:
+                self.database.client
+            logger.info("SDKs preloaded")
+        except Exception as e:
+            logger.error(f"Error preloading SDKs: {str(e)}")
+
+    async def close(self) -> None:
+        """Release resources held by the shared services."""
+        if self.job_worker is not None:
+            await self.job_worker.stop()
+        await self.web_search.aclose()
+        await close_http_clients()
+        self.image_preprocessor.close()
+        self.image_analysis_cache.close()
+        if self.image_references is not None:
+            self.image_references.close()
+        if self.response_cache is not None:
+            await self.response_cache.close()
+        self.job_queue.close()
+        if self.write_buffer is not None:
+            await self.write_buffer.close()
+        if self.conversation_memory is not None:
+            await self.conversation_memory.close()
+        if self.history_cache is not None:
+            self.history_cache.close()
+        shutdown_blocking_pool()
+        logger.info("ServiceContainer closed")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build the service container on startup and release it on shutdown."""
+    app.state.container = ServiceContainer()
+    app.state.container.start()
+    try:
+        yield
+    finally:
+        await app.state.container.close()
+        # Drain the queued log sinks before the process exits
+        await logger.complete()
+
+def get_container(request: Request) -> ServiceContainer:
+    """Return the service container built by the application lifespan."""
+    return request.app.state.container
+
+def get_planner(request: Request) -> PlannerAgent:
+    """Dependency providing the shared planner agent."""
+    return get_container(request).planner
+
+def get_executor(request: Request) -> ExecutorAgent:
+    """Dependency providing the shared executor agent."""
+    return get_container(request).executor
+
+def get_evaluator(request: Request) -> EvaluatorAgent:
+    """Dependency providing the shared evaluator agent."""
+    return get_container(request).evaluator
+
+def get_pipeline(request: Request) -> ChatPipeline:
+    """Dependency providing the shared chat pipeline."""
+    return get_container(request).pipeline
+
+def get_upload_store(request: Request) -> UploadStore:
+    """Dependency providing the shared upload store."""
+    return get_container(request).upload_store
+
+def get_chat_history(request: Request) -> ChatHistoryService:
+    """Dependency providing the shared chat history service."""
+    return get_container(request).chat_history
+
+def get_job_queue(request: Request) -> JobQueue:
+    """Dependency providing the shared job queue."""
+    return get_container(request).job_queue
@@ -0,0 +1,59 @@
+import time
+from typing import Any, Callable, Dict
+from loguru import logger
+from ..utils.logging import LOG_PAYLOAD_SAMPLE_RATE
+from ..utils.request_context import begin_request, end_request, current_request
+
+# Header carrying the correlation id in requests and responses
+REQUEST_ID_HEADER = "x-request-id"
+
+# Paths scraped too often to be worth a log line each
+UNLOGGED_PATHS = ("/metrics",)
+
+class RequestLoggingMiddleware:
+    """ASGI middleware giving each request a correlation id and one summary log line.
+
+    The id is taken from a valid ``X-Request-ID`` header or generated, attached
+    to every log record made while handling the request (including in the
+    blocking thread pool), and returned in the response header. When the
+    response has been fully sent, including streamed bodies, a single line
+    records the status, total time and the time spent in each pipeline stage.
+    """
+
+    def __init__(self, app: Callable[..., Any]):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable[..., Any], send: Callable[..., Any]) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = None
+        for name, value in scope.get("headers", ()):
+            if name == REQUEST_ID_HEADER.encode("latin-1"):
+                incoming = value.decode("latin-1")
+                break
+        token = begin_request(incoming, LOG_PAYLOAD_SAMPLE_RATE)
+        context = current_request()
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_request_id(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", ()))
+                headers.append((REQUEST_ID_HEADER.encode("latin-1"), context.request_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            if scope["path"] not in UNLOGGED_PATHS:
+                duration_ms = round((time.perf_counter() - started) * 1000, 1)
+                spans = {stage: round(ms, 1) for stage, ms in context.spans.items()}
+                logger.bind(status=status, duration_ms=duration_ms, spans=spans).info(
+                    "{} {} {} in {}ms {}", scope["method"], scope["path"], status, duration_ms, spans
+                )
+            end_request(token)
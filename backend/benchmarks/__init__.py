@@ -0,0 +1,19 @@
+"""Offline load tests for the chat API.
+
+The real FastAPI app is run against local stand-ins for Gemini, Brave Search
+and Supabase PostgREST, so throughput and tail latency can be measured
+without spending API quota::
+
+    python -m backend.benchmarks.run --output bench.json
+    python -m backend.benchmarks.run --scenario text research --baseline bench.json
+
+The app runs with its usual settings, read from the environment, so the
+model scheduler's rate limits apply; export ``MODEL_REQUESTS_PER_SECOND``
+and friends to measure without them. See ``run.py`` for the options and
+``scenarios.py`` for what each scenario sends.
+
+Cold start is measured separately, in fresh processes with no upstream
+services::
+
+    python -m backend.benchmarks.startup --output startup.json
+"""
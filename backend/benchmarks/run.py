@@ -0,0 +1,438 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import httpx
+from loguru import logger
+from .scenarios import SCENARIOS, Scenario
+from .stand_ins import STAND_IN_GEMINI, STAND_IN_BRAVE, STAND_IN_SUPABASE, STAND_IN_OPENAI, write_self_signed_cert
+
+# Repository root, put on PYTHONPATH of the child processes
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Version of the results file layout
+RESULTS_VERSION = 1
+
+# Metrics compared against a baseline, and whether a higher value is worse
+COMPARED_METRICS = {
+    "latency_ms.p50": True,
+    "latency_ms.p95": True,
+    "latency_ms.p99": True,
+    "rps": False,
+    "error_rate": True,
+    "memory_mb.peak": True,
+}
+
+# Seconds to wait for a child server to accept requests
+STARTUP_TIMEOUT = 60
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _git_commit() -> Tuple[Optional[str], bool]:
+    """Return the checked-out commit and whether the tree has local changes."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout
+        return commit, bool(status.strip())
+    except Exception:
+        return None, False
+
+def _read_memory(pid: int) -> Dict[str, float]:
+    """Return the resident and peak resident memory of a process in MiB, from /proc (Linux only)."""
+    memory = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM"):
+                    memory[key] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return memory
+
+def percentile(values: List[float], q: float) -> float:
+    """Linearly interpolated percentile of already sorted values."""
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def summarize_latencies(latencies: List[float]) -> Dict[str, float]:
+    """Summarize latencies in seconds as rounded millisecond statistics."""
+    ordered = sorted(latencies)
+    stats = {
+        "mean": sum(ordered) / len(ordered) if ordered else 0.0,
+        "p50": percentile(ordered, 0.50),
+        "p95": percentile(ordered, 0.95),
+        "p99": percentile(ordered, 0.99),
+        "max": ordered[-1] if ordered else 0.0,
+    }
+    return {key: round(value * 1000, 1) for key, value in stats.items()}
+
+class ChildProcess:
+    """A server run as a child process, with its output written to a log file."""
+
+    def __init__(self, name: str, args: List[str], env: Dict[str, str], cwd: str, log_path: str):
+        self.name = name
+        self._log = open(log_path, "wb")
+        self.process = subprocess.Popen(args, env=env, cwd=cwd, stdout=self._log, stderr=subprocess.STDOUT)
+
+    async def wait_ready(self, url: str, poll_interval: float = 0.2) -> None:
+        """Poll ``url`` until it answers, failing if the process exits or takes too long."""
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        async with httpx.AsyncClient() as client:
+            while time.monotonic() < deadline:
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"{self.name} exited with code {self.process.returncode}; see {self._log.name}")
+                try:
+                    await client.get(url, timeout=1)
+                    return
+                except httpx.TransportError:
+                    await asyncio.sleep(poll_interval)
+        raise RuntimeError(f"{self.name} did not start within {STARTUP_TIMEOUT}s; see {self._log.name}")
+
+    def stop(self) -> None:
+        """Ask the process to shut down cleanly, killing it if it does not."""
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self._log.close()
+
+def _app_env(
+    workdir: str,
+    http_port: int,
+    grpc_port: int,
+    cert_path: str,
+    openai_backend: bool,
+    overrides: Dict[str, str]
+) -> Dict[str, str]:
+    """Environment pointing the app at the stand-ins, with all state kept under ``workdir``."""
+    env = {key: value for key, value in os.environ.items() if key != "PROMETHEUS_MULTIPROC_DIR"}
+    env.update({
+        "PYTHONPATH": os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])),
+        "NO_PROXY": "127.0.0.1,localhost",
+        "GEMINI_API_KEY": "bench",
+        "GEMINI_API_ENDPOINT": f"127.0.0.1:{grpc_port}",
+        "GRPC_DEFAULT_SSL_ROOTS_FILE_PATH": cert_path,
+        "BRAVE_API_KEY": "bench",
+        "BRAVE_SEARCH_URL": f"http://127.0.0.1:{http_port}/res/v1/web/search",
+        "SUPABASE_URL": f"http://127.0.0.1:{http_port}",
+        "SUPABASE_KEY": "bench",
+        "RESPONSE_CACHE_BACKEND": "memory",
+        "HISTORY_INVALIDATION_BACKEND": "local",
+        "JOB_IN_PROCESS_WORKERS": "true",
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "LOG_DIR": os.path.join(workdir, "logs"),
+        "JOB_QUEUE_PATH": os.path.join(workdir, "jobs.sqlite3"),
+        "WRITE_BEHIND_SPILL_PATH": os.path.join(workdir, "write_behind.jsonl"),
+        "WRITE_BEHIND_DEAD_LETTER_PATH": os.path.join(workdir, "write_behind-dead-letter.jsonl"),
+        "WEB_SEARCH_CACHE_PATH": os.path.join(workdir, "web_search.sqlite3"),
+        "IMAGE_ANALYSIS_CACHE_PATH": os.path.join(workdir, "image_analysis.sqlite3"),
+        # The stand-in has no Files API, so image handles use the local store
+        "IMAGE_HANDLE_BACKEND": "local",
+        "IMAGE_HANDLE_DIR": os.path.join(workdir, "image_handles"),
+        "IMAGE_HANDLE_CACHE_PATH": os.path.join(workdir, "image_handles.sqlite3"),
+        "CONVERSATION_SUMMARY_PATH": os.path.join(workdir, "conversation_summaries.sqlite3"),
+        "OPENAI_COMPAT_BASE_URL": f"http://127.0.0.1:{http_port}/v1" if openai_backend else "",
+    })
+    env.update(overrides)
+    return env
+
+async def _send(client: httpx.AsyncClient, scenario: Scenario, index: int) -> Tuple[str, float, bool]:
+    """Send request ``index`` of a scenario and return its label, latency and success."""
+    request = scenario.build(index)
+    started = time.perf_counter()
+    try:
+        response = await client.request(request.method, request.path, data=request.data, files=request.files)
+        ok = response.status_code < 400
+    except httpx.HTTPError:
+        ok = False
+    return request.label, time.perf_counter() - started, ok
+
+async def run_load(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    requests: int,
+    concurrency: int,
+    first_index: int = 0
+) -> Tuple[List[Tuple[str, float, bool]], float]:
+    """Send ``requests`` requests from ``concurrency`` closed-loop clients.
+
+    Returns:
+        ``(label, seconds, ok)`` per request, and the wall time of the run
+    """
+    results: List[Tuple[str, float, bool]] = []
+    next_index = first_index
+
+    async def client_loop() -> None:
+        nonlocal next_index
+        while next_index < first_index + requests:
+            index = next_index
+            next_index += 1
+            results.append(await _send(client, scenario, index))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    return results, time.perf_counter() - started
+
+async def run_scenario(
+    scenario: Scenario,
+    requests: int,
+    concurrency: int,
+    warmup: int,
+    workdir: str,
+    stand_ins_url: str,
+    app_env: Dict[str, str]
+) -> Dict[str, Any]:
+    """Start a fresh app process, load it with one scenario and summarize the run."""
+    port = _free_port()
+    app = ChildProcess(
+        f"app ({scenario.name})",
+        [sys.executable, "-m", "uvicorn", "backend.api.chat:app",
+         "--host", "127.0.0.1", "--port", str(port), "--no-access-log", "--log-level", "warning"],
+        app_env,
+        workdir,
+        os.path.join(workdir, "app.log"),
+    )
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        await app.wait_ready(f"{base_url}/metrics")
+        memory_start = _read_memory(app.process.pid).get("VmRSS", 0.0)
+
+        async with httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(120.0),
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        ) as client:
+            # Warm up imports, connection pools and caches outside the measurement
+            if warmup:
+                await run_load(client, scenario, warmup, min(concurrency, warmup), first_index=requests)
+            async with httpx.AsyncClient() as stand_ins:
+                await stand_ins.post(f"{stand_ins_url}/stand-in/reset")
+
+            # Sample resident memory while the load runs
+            samples: List[float] = []
+            sampling = True
+
+            async def sample_memory() -> None:
+                while sampling:
+                    rss = _read_memory(app.process.pid).get("VmRSS")
+                    if rss is not None:
+                        samples.append(rss)
+                    await asyncio.sleep(0.1)
+
+            sampler = asyncio.create_task(sample_memory())
+            results, duration = await run_load(client, scenario, requests, concurrency)
+            sampling = False
+            await sampler
+
+        async with httpx.AsyncClient() as stand_ins:
+            upstream = (await stand_ins.get(f"{stand_ins_url}/stand-in/stats")).json()
+        memory = _read_memory(app.process.pid)
+    finally:
+        app.stop()
+
+    errors = sum(1 for _, _, ok in results if not ok)
+    endpoints: Dict[str, Dict[str, Any]] = {}
+    for label in sorted({label for label, _, _ in results}):
+        latencies = [seconds for name, seconds, _ in results if name == label]
+        endpoints[label] = {
+            "count": len(latencies),
+            "errors": sum(1 for name, _, ok in results if name == label and not ok),
+            "latency_ms": summarize_latencies(latencies),
+        }
+    return {
+        "name": scenario.name,
+        "description": scenario.description,
+        "requests": len(results),
+        "concurrency": concurrency,
+        "errors": errors,
+        "error_rate": round(errors / len(results), 4) if results else 0.0,
+        "duration_s": round(duration, 3),
+        "rps": round(len(results) / duration, 2) if duration else 0.0,
+        "latency_ms": summarize_latencies([seconds for _, seconds, _ in results]),
+        "endpoints": endpoints,
+        "memory_mb": {
+            "start": round(memory_start, 1),
+            "peak": round(max(samples + [memory.get("VmHWM", 0.0)]), 1),
+            "end": round(memory.get("VmRSS", samples[-1] if samples else 0.0), 1),
+        },
+        "upstream_calls": upstream["calls"],
+        "upstream_errors": upstream["errors"],
+    }
+
+async def run_benchmarks(args: argparse.Namespace) -> Dict[str, Any]:
+    """Start the stand-ins, run each selected scenario against a fresh app and collect the results."""
+    workdir = tempfile.mkdtemp(prefix="greenie-bench-")
+    cert_path, key_path = write_self_signed_cert(workdir)
+    http_port, grpc_port = _free_port(), _free_port()
+    profiles = {"gemini": args.gemini, "brave": args.brave, "supabase": args.supabase, "openai": args.openai}
+
+    stand_ins = ChildProcess(
+        "stand-ins",
+        [sys.executable, "-m", "backend.benchmarks.stand_ins",
+         "--http-port", str(http_port), "--grpc-port", str(grpc_port), "--cert", cert_path, "--key", key_path],
+        {
+            **os.environ,
+            "PYTHONPATH": os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])),
+            "STAND_IN_GEMINI": args.gemini,
+            "STAND_IN_BRAVE": args.brave,
+            "STAND_IN_SUPABASE": args.supabase,
+            "STAND_IN_OPENAI": args.openai,
+        },
+        workdir,
+        os.path.join(workdir, "stand-ins.log"),
+    )
+    stand_ins_url = f"http://127.0.0.1:{http_port}"
+    commit, dirty = _git_commit()
+    report: Dict[str, Any] = {
+        "version": RESULTS_VERSION,
+        "commit": commit,
+        "dirty": dirty,
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "settings": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+            "openai_backend": args.openai_backend,
+        },
+        "stand_ins": profiles,
+        "scenarios": [],
+    }
+    try:
+        await stand_ins.wait_ready(f"{stand_ins_url}/stand-in/stats")
+        for name in args.scenario:
+            scenario = SCENARIOS[name]()
+            scenario_dir = os.path.join(workdir, name)
+            os.makedirs(scenario_dir)
+            logger.info(f"Running scenario {name}: {args.requests} requests at concurrency {args.concurrency}")
+            result = await run_scenario(
+                scenario,
+                args.requests,
+                args.concurrency,
+                args.warmup,
+                scenario_dir,
+                stand_ins_url,
+                _app_env(scenario_dir, http_port, grpc_port, cert_path, args.openai_backend, scenario.env),
+            )
+            logger.info(
+                f"{name}: {result['rps']} rps, p50 {result['latency_ms']['p50']}ms, "
+                f"p95 {result['latency_ms']['p95']}ms, p99 {result['latency_ms']['p99']}ms, "
+                f"{result['errors']} errors, peak {result['memory_mb']['peak']} MiB"
+            )
+            report["scenarios"].append(result)
+    finally:
+        stand_ins.stop()
+        if args.keep_workdir:
+            logger.info(f"Kept logs and state in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+def _metric(result: Dict[str, Any], path: str) -> Optional[float]:
+    value: Any = result
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """Compare matching scenarios of two reports.
+
+    Returns:
+        One row per scenario and metric, flagged as a regression when it is
+        worse than the baseline by more than ``tolerance`` (a fraction)
+    """
+    rows = []
+    baseline_scenarios = {result["name"]: result for result in baseline.get("scenarios", [])}
+    for result in current["scenarios"]:
+        before = baseline_scenarios.get(result["name"])
+        if before is None:
+            continue
+        for path, higher_is_worse in COMPARED_METRICS.items():
+            old, new = _metric(before, path), _metric(result, path)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else (0.0 if new == old else float("inf"))
+            worse = change > tolerance if higher_is_worse else change < -tolerance
+            # An error rate rising from zero is a regression however small
+            if path == "error_rate" and old == 0 and new > 0:
+                worse = True
+            rows.append({
+                "scenario": result["name"],
+                "metric": path,
+                "baseline": old,
+                "current": new,
+                "change": round(change, 4) if change != float("inf") else None,
+                "regression": worse,
+            })
+    return rows
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load-test the chat API against local stand-ins")
+    parser.add_argument("--scenario", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent closed-loop clients")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured requests sent first")
+    parser.add_argument("--gemini", default=STAND_IN_GEMINI, help="Gemini fault profile, e.g. latency=0.8,jitter=0.3,error_rate=0.01")
+    parser.add_argument("--brave", default=STAND_IN_BRAVE, help="Brave Search fault profile")
+    parser.add_argument("--supabase", default=STAND_IN_SUPABASE, help="Supabase fault profile")
+    parser.add_argument("--openai", default=STAND_IN_OPENAI, help="OpenAI-compatible model fault profile")
+    parser.add_argument("--openai-backend", action="store_true", help="Register the OpenAI-compatible stand-in as a model backend")
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative change allowed before flagging a regression")
+    parser.add_argument("--keep-workdir", action="store_true", help="Keep app logs and state after the run")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_benchmarks(args))
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows = compare(baseline, report, args.tolerance)
+        report["comparison"] = {"baseline_commit": baseline.get("commit"), "tolerance": args.tolerance, "metrics": rows}
+        for row in rows:
+            change = f"{row['change']:+.1%}" if row["change"] is not None else "new"
+            flag = "  REGRESSION" if row["regression"] else ""
+            logger.info(f"{row['scenario']:<10} {row['metric']:<16} {row['baseline']:>10} -> {row['current']:>10} ({change}){flag}")
+        if any(row["regression"] for row in rows):
+            exit_code = 1
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        logger.info(f"Wrote {args.output}")
+    else:
+        print(output)
+    sys.exit(exit_code)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import io
+import random
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Sample questions; an index is appended so each request misses the response cache
+TEXT_QUESTIONS = (
+    "Why are the lower leaves of my tomato plants turning yellow?",
+    "How often should I water basil growing on a sunny balcony?",
+    "What cover crop should I sow after harvesting potatoes?",
+    "My rose leaves have black spots, what can I do?",
+    "Is coffee grounds compost good for blueberries?",
+    "When is the best time to prune apple trees?",
+)
+RESEARCH_QUESTIONS = (
+    "Summarize recent research on biochar and soil carbon retention",
+    "What does research say about neonicotinoids and bee colony decline?",
+    "Find information on drought tolerant wheat varieties for sandy soil",
+    "What research exists on companion planting marigolds with tomatoes?",
+)
+IMAGE_QUESTIONS = (
+    "What is wrong with this plant?",
+    "Can you identify this flower?",
+    "Why are these leaves curling?",
+)
+
+@dataclass
+class BenchRequest:
+    """One HTTP request sent by a scenario, labelled for the per-endpoint breakdown."""
+    label: str
+    method: str
+    path: str
+    data: Optional[Dict[str, Any]] = None
+    files: Optional[Dict[str, Tuple[str, bytes, str]]] = None
+
+@dataclass
+class Scenario:
+    """A named workload: how to build request ``index`` and app settings to run it under.
+
+    ``env`` is merged over the app's environment for this scenario only.
+    """
+    name: str
+    description: str
+    build: Callable[[int], BenchRequest]
+    env: Dict[str, str] = field(default_factory=dict)
+
+def _jpeg(seed: int, size: Tuple[int, int] = (1280, 960)) -> bytes:
+    """Render a noisy green test photo; each seed gives a visually different image."""
+    # Imported here so only the image scenario needs Pillow at build time
+    from PIL import Image
+
+    rng = random.Random(seed)
+    width, height = size
+    image = Image.effect_noise(size, 40 + seed % 20).convert("RGB")
+    tint = Image.new("RGB", size, (rng.randint(20, 90), rng.randint(100, 200), rng.randint(20, 90)))
+    image = Image.blend(image, tint, 0.6)
+    for _ in range(12):
+        x, y = rng.randrange(width), rng.randrange(height)
+        radius = rng.randint(20, 120)
+        image.paste(
+            (rng.randint(120, 255), rng.randint(120, 255), rng.randint(0, 80)),
+            (max(x - radius, 0), max(y - radius, 0), min(x + radius, width), min(y + radius, height)),
+        )
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=88)
+    return buffer.getvalue()
+
+def text_scenario() -> Scenario:
+    def build(index: int) -> BenchRequest:
+        question = TEXT_QUESTIONS[index % len(TEXT_QUESTIONS)]
+        return BenchRequest("POST /api/chat", "POST", "/api/chat", data={"message": f"{question} (bed {index})"})
+    return Scenario("text", "Text-only questions, each distinct", build)
+
+def image_scenario(distinct_images: int = 16) -> Scenario:
+    # Images repeat after ``distinct_images`` requests, so later ones can hit the image analysis cache
+    images: List[bytes] = []
+
+    def build(index: int) -> BenchRequest:
+        if not images:
+            images.extend(_jpeg(seed) for seed in range(distinct_images))
+        question = IMAGE_QUESTIONS[index % len(IMAGE_QUESTIONS)]
+        return BenchRequest(
+            "POST /api/chat (image)",
+            "POST",
+            "/api/chat",
+            data={"message": f"{question} (photo {index})"},
+            files={"image": (f"plant-{index % distinct_images}.jpg", images[index % distinct_images], "image/jpeg")},
+        )
+    return Scenario("image", f"Questions with a 1280x960 JPEG, {distinct_images} distinct photos", build)
+
+def research_scenario() -> Scenario:
+    def build(index: int) -> BenchRequest:
+        question = RESEARCH_QUESTIONS[index % len(RESEARCH_QUESTIONS)]
+        return BenchRequest("POST /api/chat", "POST", "/api/chat", data={"message": f"{question} (study {index})"})
+    return Scenario("research", "Questions that trigger a web search", build)
+
+# Owner of the benchmark's sessions
+BENCH_USER_ID = "bench-user"
+
+def session_scenario(sessions: int = 20, read_every: int = 4) -> Scenario:
+    # Requests rotate over the sessions, so each session accumulates history turn by turn
+    def build(index: int) -> BenchRequest:
+        session_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"bench-session-{index % sessions}"))
+        if index % read_every == read_every - 1:
+            return BenchRequest(
+                "GET /api/sessions/{id}/messages",
+                "GET",
+                f"/api/sessions/{session_id}/messages?user_id={BENCH_USER_ID}",
+            )
+        question = TEXT_QUESTIONS[index % len(TEXT_QUESTIONS)]
+        return BenchRequest(
+            "POST /api/chat (session)",
+            "POST",
+            "/api/chat",
+            data={
+                "message": f"Following up: {question} (turn {index // sessions})",
+                "session_id": session_id,
+                "user_id": BENCH_USER_ID,
+            },
+        )
+    return Scenario(
+        "session",
+        f"Multi-turn chats over {sessions} sessions, with every {read_every}th request reading history",
+        build,
+    )
+
+# Factories so every run starts from fresh scenario state
+SCENARIOS: Dict[str, Callable[[], Scenario]] = {
+    "text": text_scenario,
+    "image": image_scenario,
+    "research": research_scenario,
+    "session": session_scenario,
+}
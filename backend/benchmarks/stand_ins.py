@@ -0,0 +1,491 @@
+import argparse
+import asyncio
+import datetime
+import hashlib
+import ipaddress
+import json
+import math
+import os
+import random
+import re
+import uuid
+from collections import Counter
+from dataclasses import dataclass, asdict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import grpc
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from google.ai import generativelanguage as glm
+from loguru import logger
+
+# Fault profiles, e.g. "latency=0.8,jitter=0.3,error_rate=0.01,error_status=503"
+STAND_IN_GEMINI = os.getenv("STAND_IN_GEMINI", "latency=0.8,jitter=0.3,error_rate=0")
+STAND_IN_BRAVE = os.getenv("STAND_IN_BRAVE", "latency=0.3,jitter=0.3,error_rate=0")
+STAND_IN_SUPABASE = os.getenv("STAND_IN_SUPABASE", "latency=0.02,jitter=0.3,error_rate=0")
+STAND_IN_OPENAI = os.getenv("STAND_IN_OPENAI", "latency=0.5,jitter=0.3,error_rate=0")
+# Words in each generated model reply, and chunks a streamed reply is split into
+STAND_IN_REPLY_WORDS = int(os.getenv("STAND_IN_REPLY_WORDS", 120))
+STAND_IN_STREAM_CHUNKS = int(os.getenv("STAND_IN_STREAM_CHUNKS", 8))
+
+GEMINI_SERVICE = "google.ai.generativelanguage.v1beta.GenerativeService"
+
+# Packed planner and evaluator prompts ask for a JSON array of this many strings
+PACKED_PROMPT_PATTERN = re.compile(r"exactly (\d+) strings")
+
+# gRPC status returned for each simulated HTTP error status
+GRPC_ERROR_CODES = {
+    429: grpc.StatusCode.RESOURCE_EXHAUSTED,
+    500: grpc.StatusCode.INTERNAL,
+    503: grpc.StatusCode.UNAVAILABLE,
+    504: grpc.StatusCode.DEADLINE_EXCEEDED,
+}
+
+REPLY_VOCABULARY = (
+    "soil moisture nitrogen leaves roots compost mulch drainage sunlight pruning aphids "
+    "fungus watering seedlings pollinators rotation yield canopy humidity ph nutrients"
+).split()
+
+@dataclass
+class FaultProfile:
+    """Latency and error distribution of one stand-in service.
+
+    Latency is log-normal around the ``latency`` median in seconds, with
+    ``jitter`` as the standard deviation of its logarithm. A fraction
+    ``error_rate`` of calls fails with ``error_status`` after the delay.
+    """
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 503
+
+    @classmethod
+    def parse(cls, spec: str) -> "FaultProfile":
+        """Parse a ``key=value,...`` profile; omitted keys keep their defaults."""
+        values: Dict[str, Any] = {}
+        for item in filter(None, (part.strip() for part in spec.split(","))):
+            key, _, value = item.partition("=")
+            if key not in cls.__dataclass_fields__:
+                raise ValueError(f"Unknown fault profile key: {key}")
+            values[key] = int(value) if key == "error_status" else float(value)
+        return cls(**values)
+
+    def sample_delay(self) -> float:
+        """Draw the delay of one call."""
+        if self.latency <= 0:
+            return 0.0
+        return self.latency * math.exp(random.gauss(0, self.jitter)) if self.jitter > 0 else self.latency
+
+    def sample_failure(self) -> bool:
+        """Draw whether one call fails."""
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+class StandIns:
+    """State shared by the stand-in services: fault profiles, call counters and the PostgREST tables."""
+
+    def __init__(self, gemini: FaultProfile, brave: FaultProfile, supabase: FaultProfile, openai: FaultProfile):
+        self.profiles = {"gemini": gemini, "brave": brave, "supabase": supabase, "openai": openai}
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+
+    async def delay(self, service: str) -> bool:
+        """Count a call, wait for its sampled latency and return whether it should fail."""
+        profile = self.profiles[service]
+        self.calls[service] += 1
+        await asyncio.sleep(profile.sample_delay())
+        failed = profile.sample_failure()
+        if failed:
+            self.errors[service] += 1
+        return failed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return calls and injected errors per service."""
+        return {
+            "calls": dict(self.calls),
+            "errors": dict(self.errors),
+            "rows": {table: len(rows) for table, rows in self.tables.items()},
+            "profiles": {service: asdict(profile) for service, profile in self.profiles.items()},
+        }
+
+    def reset_stats(self) -> None:
+        """Zero the call counters, keeping stored rows."""
+        self.calls.clear()
+        self.errors.clear()
+
+def _prompt_text(request: Any) -> Tuple[str, int]:
+    """Return the text of a generate request and how many inline images it carries."""
+    texts, images = [], 0
+    for content in request.contents:
+        for part in content.parts:
+            if part.text:
+                texts.append(part.text)
+            elif part.inline_data.data:
+                images += 1
+    return "\n".join(texts), images
+
+def generate_reply(prompt: str, words: int = STAND_IN_REPLY_WORDS) -> str:
+    """Produce a deterministic reply shaped like what the prompt asks for.
+
+    Packed prompts get a JSON array of the requested length; anything else
+    gets ``words`` words of filler seeded by the prompt, so identical prompts
+    give identical replies and different prompts differ.
+    """
+    seed = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+    rng = random.Random(seed)
+    packed = PACKED_PROMPT_PATTERN.search(prompt)
+    if packed:
+        count = int(packed.group(1))
+        per_item = max(words // max(count, 1), 10)
+        return json.dumps([
+            " ".join(rng.choice(REPLY_VOCABULARY) for _ in range(per_item)) for _ in range(count)
+        ])
+    return f"[{seed[:8]}] " + " ".join(rng.choice(REPLY_VOCABULARY) for _ in range(words))
+
+def _generate_response(text: str, prompt: str, images: int, final: bool = True) -> Any:
+    """Build a GenerateContentResponse carrying ``text`` and token usage."""
+    prompt_tokens = len(prompt) // 4 + images * 258
+    output_tokens = len(text) // 4
+    return glm.GenerateContentResponse(
+        candidates=[glm.Candidate(
+            content=glm.Content(parts=[glm.Part(text=text)], role="model"),
+            finish_reason=glm.Candidate.FinishReason.STOP if final else glm.Candidate.FinishReason.FINISH_REASON_UNSPECIFIED,
+            index=0,
+        )],
+        usage_metadata=glm.GenerateContentResponse.UsageMetadata(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens,
+        ),
+    )
+
+def create_gemini_server(stand_ins: StandIns, port: int, cert_path: str, key_path: str) -> "grpc.aio.Server":
+    """Build a TLS gRPC server answering Gemini's GenerateContent and StreamGenerateContent.
+
+    gRPC is what the SDK uses for ``generate_content_async``, so the app's
+    async model calls run exactly as in production.
+    """
+    profile = stand_ins.profiles["gemini"]
+
+    async def abort(context: Any) -> None:
+        code = GRPC_ERROR_CODES.get(profile.error_status, grpc.StatusCode.UNAVAILABLE)
+        await context.abort(code, "Injected stand-in failure")
+
+    async def generate_content(request: Any, context: Any) -> Any:
+        if await stand_ins.delay("gemini"):
+            await abort(context)
+        prompt, images = _prompt_text(request)
+        return _generate_response(generate_reply(prompt), prompt, images)
+
+    async def stream_generate_content(request: Any, context: Any) -> AsyncIterator[Any]:
+        # The sampled latency covers the whole stream; the first chunk takes the largest share
+        stand_ins.calls["gemini"] += 1
+        total = profile.sample_delay()
+        await asyncio.sleep(total * 0.3)
+        if profile.sample_failure():
+            stand_ins.errors["gemini"] += 1
+            await abort(context)
+        prompt, images = _prompt_text(request)
+        words = generate_reply(prompt).split(" ")
+        step = max(math.ceil(len(words) / STAND_IN_STREAM_CHUNKS), 1)
+        chunks = [" ".join(words[i:i + step]) + " " for i in range(0, len(words), step)]
+        for index, chunk in enumerate(chunks):
+            if index:
+                await asyncio.sleep(total * 0.7 / max(len(chunks) - 1, 1))
+            yield _generate_response(chunk, prompt, images, final=index == len(chunks) - 1)
+
+    handler = grpc.method_handlers_generic_handler(GEMINI_SERVICE, {
+        "GenerateContent": grpc.unary_unary_rpc_method_handler(
+            generate_content,
+            request_deserializer=glm.GenerateContentRequest.deserialize,
+            response_serializer=glm.GenerateContentResponse.serialize,
+        ),
+        "StreamGenerateContent": grpc.unary_stream_rpc_method_handler(
+            stream_generate_content,
+            request_deserializer=glm.GenerateContentRequest.deserialize,
+            response_serializer=glm.GenerateContentResponse.serialize,
+        ),
+    })
+    server = grpc.aio.server()
+    server.add_generic_rpc_handlers((handler,))
+    with open(cert_path, "rb") as cert_file, open(key_path, "rb") as key_file:
+        credentials = grpc.ssl_server_credentials([(key_file.read(), cert_file.read())])
+    server.add_secure_port(f"127.0.0.1:{port}", credentials)
+    return server
+
+def _compare(row: Dict[str, Any], column: str, operator: str, value: str) -> bool:
+    """Evaluate one PostgREST filter against a row, comparing values as text."""
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        value = json.loads(value)
+    actual = row.get(column)
+    if operator == "is":
+        return actual is None if value == "null" else str(actual).lower() == value
+    if actual is None:
+        return False
+    actual = str(actual).lower() if isinstance(actual, bool) else str(actual)
+    if operator == "eq":
+        return actual == value
+    if operator == "neq":
+        return actual != value
+    if operator == "lt":
+        return actual < value
+    if operator == "lte":
+        return actual <= value
+    if operator == "gt":
+        return actual > value
+    if operator == "gte":
+        return actual >= value
+    if operator == "in":
+        return actual in value.strip("()").split(",")
+    raise ValueError(f"Unsupported filter operator: {operator}")
+
+def _split_top_level(expression: str) -> List[str]:
+    """Split a PostgREST logical expression on commas outside parentheses and quotes."""
+    parts, depth, quoted, current = [], 0, False, ""
+    for char in expression:
+        if char == "," and depth == 0 and not quoted:
+            parts.append(current)
+            current = ""
+            continue
+        if char == '"':
+            quoted = not quoted
+        elif not quoted:
+            depth += (char == "(") - (char == ")")
+        current += char
+    if current:
+        parts.append(current)
+    return parts
+
+def _logical(row: Dict[str, Any], conditions: str, combine: Any) -> bool:
+    """Evaluate an ``or``/``and`` group such as ``(a.lt.1,and(a.eq.1,b.lt.2))``."""
+    results = []
+    for condition in _split_top_level(conditions[1:-1]):
+        if condition.startswith(("and(", "or(")):
+            name, _, rest = condition.partition("(")
+            results.append(_logical(row, f"({rest}", all if name == "and" else any))
+        else:
+            column, operator, value = condition.split(".", 2)
+            results.append(_compare(row, column, operator, value))
+    return combine(results)
+
+def _select(rows: List[Dict[str, Any]], params: Any) -> List[Dict[str, Any]]:
+    """Apply PostgREST filters, ordering, limit and column projection to a table."""
+    matched = rows
+    for column, expression in params.multi_items():
+        if column in ("select", "order", "limit", "offset"):
+            continue
+        if column in ("or", "and"):
+            matched = [row for row in matched if _logical(row, expression, any if column == "or" else all)]
+            continue
+        operator, _, value = expression.partition(".")
+        matched = [row for row in matched if _compare(row, column, operator, value)]
+
+    # Stable sorts applied last key first give a multi-column ordering
+    for term in reversed(params.get("order", "").split(",") if params.get("order") else []):
+        column, _, direction = term.partition(".")
+        matched = sorted(
+            matched,
+            key=lambda row: (row.get(column) is None, str(row.get(column, ""))),
+            reverse=direction.startswith("desc"),
+        )
+
+    offset = int(params.get("offset", 0))
+    limit = params.get("limit")
+    matched = matched[offset:offset + int(limit)] if limit else matched[offset:]
+
+    select = params.get("select", "*")
+    if select == "*":
+        return [dict(row) for row in matched]
+    columns = select.split(",")
+    return [{column: row.get(column) for column in columns} for row in matched]
+
+def create_http_app(stand_ins: StandIns) -> FastAPI:
+    """Build the HTTP stand-ins: Brave web search, Supabase PostgREST, an OpenAI-compatible model and a stats endpoint."""
+    app = FastAPI()
+
+    def failure(service: str) -> JSONResponse:
+        status = stand_ins.profiles[service].error_status
+        return JSONResponse(status_code=status, content={"message": "Injected stand-in failure"})
+
+    @app.get("/res/v1/web/search")
+    async def brave_search(q: str, count: int = 5):
+        if await stand_ins.delay("brave"):
+            return failure("brave")
+        digest = hashlib.sha1(q.encode("utf-8")).hexdigest()[:8]
+        return {"web": {"results": [
+            {
+                "title": f"{q} - result {i}",
+                "url": f"https://example.org/{digest}/{i}",
+                "description": generate_reply(f"{q} {i}", words=30),
+            }
+            for i in range(1, count + 1)
+        ]}}
+
+    @app.get("/rest/v1/{table}")
+    async def postgrest_select(table: str, request: Request):
+        if await stand_ins.delay("supabase"):
+            return failure("supabase")
+        try:
+            return _select(stand_ins.tables.get(table, []), request.query_params)
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"message": str(e)})
+
+    @app.post("/rest/v1/{table}")
+    async def postgrest_insert(table: str, request: Request):
+        if await stand_ins.delay("supabase"):
+            return failure("supabase")
+        body = await request.json()
+        rows = body if isinstance(body, list) else [body]
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        existing = stand_ins.tables.setdefault(table, [])
+        key = request.query_params.get("on_conflict")
+        if key and "resolution=ignore-duplicates" in request.headers.get("prefer", ""):
+            # Upsert that skips rows whose key already exists
+            taken = {row.get(key) for row in existing}
+            rows = [row for row in rows if row.get(key) not in taken]
+        stored = [{"id": str(uuid.uuid4()), "created_at": now, **row} for row in rows]
+        existing.extend(stored)
+        return JSONResponse(status_code=201, content=stored)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        prompt = "\n".join(
+            message["content"] if isinstance(message["content"], str)
+            else "\n".join(part.get("text", "") for part in message["content"])
+            for message in body.get("messages", [])
+        )
+        text = generate_reply(prompt)
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4}
+        if not body.get("stream"):
+            if await stand_ins.delay("openai"):
+                return failure("openai")
+            return {
+                "object": "chat.completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {**usage, "total_tokens": sum(usage.values())},
+            }
+
+        # As for Gemini, the sampled latency covers the whole stream
+        profile = stand_ins.profiles["openai"]
+        stand_ins.calls["openai"] += 1
+        total = profile.sample_delay()
+        await asyncio.sleep(total * 0.3)
+        if profile.sample_failure():
+            stand_ins.errors["openai"] += 1
+            return failure("openai")
+
+        async def events() -> AsyncIterator[str]:
+            words = text.split(" ")
+            step = max(math.ceil(len(words) / STAND_IN_STREAM_CHUNKS), 1)
+            chunks = [" ".join(words[i:i + step]) + " " for i in range(0, len(words), step)]
+            for index, chunk in enumerate(chunks):
+                if index:
+                    await asyncio.sleep(total * 0.7 / max(len(chunks) - 1, 1))
+                delta = {"choices": [{"index": 0, "delta": {"content": chunk}}]}
+                yield f"data: {json.dumps(delta)}\n\n"
+            yield f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stand-in/stats")
+    async def stats():
+        return stand_ins.get_stats()
+
+    @app.post("/stand-in/reset")
+    async def reset():
+        stand_ins.reset_stats()
+        return {"success": True}
+
+    return app
+
+def write_self_signed_cert(directory: str) -> Tuple[str, str]:
+    """Write a certificate and key for 127.0.0.1 and localhost, for the Gemini stand-in's TLS.
+
+    Returns:
+        Paths of the PEM certificate and private key
+    """
+    # Imported here so only the benchmark suite needs cryptography
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(
+            x509.SubjectAlternativeName([
+                x509.DNSName("localhost"),
+                x509.IPAddress(ipaddress.ip_address("127.0.0.1")),
+            ]),
+            critical=False,
+        )
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, "stand-in.crt")
+    key_path = os.path.join(directory, "stand-in.key")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ))
+    return cert_path, key_path
+
+async def serve(http_port: int, grpc_port: int, cert_path: str, key_path: str, stand_ins: Optional[StandIns] = None) -> None:
+    """Run the HTTP and gRPC stand-ins until the process is interrupted or terminated."""
+    stand_ins = stand_ins or StandIns(
+        FaultProfile.parse(STAND_IN_GEMINI),
+        FaultProfile.parse(STAND_IN_BRAVE),
+        FaultProfile.parse(STAND_IN_SUPABASE),
+        FaultProfile.parse(STAND_IN_OPENAI),
+    )
+    gemini_server = create_gemini_server(stand_ins, grpc_port, cert_path, key_path)
+    await gemini_server.start()
+    http_server = uvicorn.Server(uvicorn.Config(
+        create_http_app(stand_ins),
+        host="127.0.0.1",
+        port=http_port,
+        log_level="warning",
+        access_log=False,
+        lifespan="off",
+    ))
+    logger.info(f"Stand-ins listening: HTTP on {http_port}, Gemini gRPC on {grpc_port}")
+    # The gRPC server goes down with the process once the HTTP server exits
+    await http_server.serve()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run local stand-ins for Gemini, Brave Search, Supabase and an OpenAI-compatible model")
+    parser.add_argument("--http-port", type=int, default=8900)
+    parser.add_argument("--grpc-port", type=int, default=8901)
+    parser.add_argument("--cert", help="PEM certificate for the gRPC server; a self-signed one is written if omitted")
+    parser.add_argument("--key", help="PEM private key for --cert")
+    args = parser.parse_args()
+
+    cert_path, key_path = args.cert, args.key
+    if not cert_path:
+        directory = os.path.join("cache", "stand-ins")
+        os.makedirs(directory, exist_ok=True)
+        cert_path, key_path = write_self_signed_cert(directory)
+        logger.info(f"Trust {cert_path} in the app with GRPC_DEFAULT_SSL_ROOTS_FILE_PATH")
+    try:
+        asyncio.run(serve(args.http_port, args.grpc_port, cert_path, key_path))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
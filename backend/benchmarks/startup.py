@@ -0,0 +1,158 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+from loguru import logger
+from .run import (
+    RESULTS_VERSION,
+    ChildProcess,
+    _app_env,
+    _free_port,
+    _git_commit,
+    compare,
+    summarize_latencies,
+)
+
+# SDKs that should only be imported on first use, reported if importing the app loads them
+HEAVY_MODULES = ("google.generativeai", "langchain", "langchain_google_genai", "supabase", "grpc")
+
+# Run in a fresh interpreter: import the app, build the service container and report the timings
+IMPORT_PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+import backend.api.chat
+imported = time.perf_counter()
+from backend.api.dependencies import ServiceContainer
+ServiceContainer()
+built = time.perf_counter()
+print(json.dumps({{
+    "import": imported - started,
+    "container": built - imported,
+    "sdks_loaded": [name for name in {HEAVY_MODULES!r} if name in sys.modules],
+}}))
+"""
+
+def probe_import(env: Dict[str, str], workdir: str) -> Dict[str, Any]:
+    """Time importing the app and building its services in a fresh interpreter."""
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE], env=env, cwd=workdir, capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(f"Import probe failed:\n{completed.stderr[-2000:]}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["process"] = elapsed
+    return result
+
+async def probe_ready(env: Dict[str, str], workdir: str, trial: int) -> float:
+    """Start the app under uvicorn and return the seconds until it answers its first request."""
+    port = _free_port()
+    started = time.perf_counter()
+    app = ChildProcess(
+        "app",
+        [sys.executable, "-m", "uvicorn", "backend.api.chat:app",
+         "--host", "127.0.0.1", "--port", str(port), "--no-access-log", "--log-level", "warning"],
+        env,
+        workdir,
+        os.path.join(workdir, f"app-{trial}.log"),
+    )
+    try:
+        await app.wait_ready(f"http://127.0.0.1:{port}/api/model/stats", poll_interval=0.01)
+        return time.perf_counter() - started
+    finally:
+        app.stop()
+
+async def run_startup_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    """Measure cold import, service construction and time to ready over several fresh processes."""
+    workdir = tempfile.mkdtemp(prefix="greenie-startup-")
+    # Nothing listens on these ports; startup must not need the upstream services
+    env = _app_env(workdir, _free_port(), _free_port(), "", False, {})
+    commit, dirty = _git_commit()
+    samples: Dict[str, List[float]] = {"import": [], "container": [], "process": [], "ready": []}
+    sdks_loaded: List[str] = []
+    try:
+        for trial in range(args.trials):
+            probe = probe_import(env, workdir)
+            for phase in ("import", "container", "process"):
+                samples[phase].append(probe[phase])
+            sdks_loaded = sorted(set(sdks_loaded) | set(probe["sdks_loaded"]))
+            samples["ready"].append(await probe_ready(env, workdir, trial))
+            logger.info(
+                f"Trial {trial + 1}/{args.trials}: import {probe['import'] * 1000:.0f}ms, "
+                f"container {probe['container'] * 1000:.0f}ms, ready {samples['ready'][-1] * 1000:.0f}ms"
+            )
+    finally:
+        if args.keep_workdir:
+            logger.info(f"Kept logs and state in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    descriptions = {
+        "import": "Importing backend.api.chat in a fresh interpreter",
+        "container": "Building the service container after the import",
+        "process": "Interpreter start, import and container, as seen from outside",
+        "ready": "Starting uvicorn until the app answers its first request",
+    }
+    return {
+        "version": RESULTS_VERSION,
+        "commit": commit,
+        "dirty": dirty,
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "settings": {"trials": args.trials, "preload_sdks": env.get("PRELOAD_SDKS", "true")},
+        "sdks_loaded_at_import": sdks_loaded,
+        # Phases are reported as scenarios so run.compare() can diff them against a baseline
+        "scenarios": [
+            {"name": phase, "description": descriptions[phase], "trials": len(values), "latency_ms": summarize_latencies(values)}
+            for phase, values in samples.items()
+        ],
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure how quickly the chat API starts and becomes ready to serve")
+    parser.add_argument("--trials", type=int, default=5, help="Fresh processes started per phase")
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Relative change allowed before flagging a regression")
+    parser.add_argument("--keep-workdir", action="store_true", help="Keep app logs and state after the run")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_startup_benchmark(args))
+    for result in report["scenarios"]:
+        logger.info(f"{result['name']:<10} p50 {result['latency_ms']['p50']}ms, max {result['latency_ms']['max']}ms")
+    if report["sdks_loaded_at_import"]:
+        logger.warning(f"Imported at startup: {', '.join(report['sdks_loaded_at_import'])}")
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows = compare(baseline, report, args.tolerance)
+        report["comparison"] = {"baseline_commit": baseline.get("commit"), "tolerance": args.tolerance, "metrics": rows}
+        for row in rows:
+            change = f"{row['change']:+.1%}" if row["change"] is not None else "new"
+            flag = "  REGRESSION" if row["regression"] else ""
+            logger.info(f"{row['scenario']:<10} {row['metric']:<16} {row['baseline']:>10} -> {row['current']:>10} ({change}){flag}")
+        if any(row["regression"] for row in rows):
+            exit_code = 1
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        logger.info(f"Wrote {args.output}")
+    else:
+        print(output)
+    sys.exit(exit_code)
+
+if __name__ == "__main__":
+    main()
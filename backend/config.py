@@ -0,0 +1,58 @@
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional
+from dotenv import load_dotenv
+
+@lru_cache(maxsize=None)
+def load_environment() -> None:
+    """Read ``.env`` into the process environment once; later calls do nothing.
+
+    Every module calls this before reading its settings, so the file is
+    found and parsed once per process rather than once per module. Variables
+    already set in the environment take precedence over the file.
+    """
+    load_dotenv()
+
+@dataclass(frozen=True)
+class Settings:
+    """Credentials and service endpoints shared across the app.
+
+    Tuning knobs stay as module constants next to the code they tune and are
+    read from the same environment once ``load_environment()`` has run.
+    """
+    gemini_api_key: Optional[str]
+    gemini_api_endpoint: Optional[str]
+    brave_api_key: Optional[str]
+    brave_search_url: str
+    supabase_url: Optional[str]
+    supabase_key: Optional[str]
+    redis_url: str
+    preload_sdks: bool
+
+    @property
+    def gemini_client_options(self) -> Optional[Dict[str, str]]:
+        """Client options pointing Gemini clients at GEMINI_API_ENDPOINT (host:port), such as the benchmark stand-in."""
+        return {"api_endpoint": self.gemini_api_endpoint} if self.gemini_api_endpoint else None
+
+    @property
+    def supabase_configured(self) -> bool:
+        return bool(self.supabase_url and self.supabase_key)
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """Return the process-wide settings, loading ``.env`` on first use."""
+    load_environment()
+    return Settings(
+        gemini_api_key=os.getenv("GEMINI_API_KEY"),
+        # Host and port of another Gemini server, such as the benchmark stand-in; empty for the public API
+        gemini_api_endpoint=os.getenv("GEMINI_API_ENDPOINT") or None,
+        brave_api_key=os.getenv("BRAVE_API_KEY"),
+        brave_search_url=os.getenv("BRAVE_SEARCH_URL", "https://api.search.brave.com/res/v1/web/search"),
+        supabase_url=os.getenv("SUPABASE_URL"),
+        supabase_key=os.getenv("SUPABASE_KEY"),
+        redis_url=os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+        # The Gemini, LangChain and Supabase SDKs are imported on first use; with preloading
+        # they are imported on a background thread as soon as the app is serving
+        preload_sdks=os.getenv("PRELOAD_SDKS", "true").lower() == "true",
+    )
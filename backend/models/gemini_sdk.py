@@ -0,0 +1,26 @@
+import threading
+from typing import Any
+from loguru import logger
+from ..config import get_settings
+
+_genai: Any = None
+_lock = threading.Lock()
+
+def get_genai() -> Any:
+    """Return the ``google.generativeai`` module, importing and configuring it on first use.
+
+    The SDK and its gRPC stack take most of a second to import, so it is
+    loaded by the first model call (or the startup preload) rather than when
+    the app is imported.
+    """
+    global _genai
+    if _genai is None:
+        with _lock:
+            if _genai is None:
+                import google.generativeai as genai
+
+                settings = get_settings()
+                genai.configure(api_key=settings.gemini_api_key, client_options=settings.gemini_client_options)
+                logger.info("Gemini SDK loaded")
+                _genai = genai
+    return _genai
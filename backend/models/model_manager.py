@@ -1,36 +1,96 @@
-import google.generativeai as genai
-from langchain_google_genai import GoogleGenerativeAI
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, AsyncIterator
 import os
+import mimetypes
 from loguru import logger
-from dotenv import load_dotenv
+from ..config import load_environment, get_settings
+from ..utils.concurrency import run_blocking
+from ..services.image_preprocessing import PreparedImage
+from ..services.image_references import is_image_part
+from ..utils.tokens import estimate_tokens
+from ..utils.metrics import record_fallback
+from .scheduler import ModelScheduler, get_model_scheduler
+from .providers import GeminiBackend, ProviderPool, create_backends
 
 # Load environment variables
-load_dotenv()
+load_environment()
 
-# Configure Google Generative AI
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+# Output tokens assumed per call when reserving rate-limit budget
+MODEL_EXPECTED_OUTPUT_TOKENS = int(os.getenv("MODEL_EXPECTED_OUTPUT_TOKENS", 512))
+
+# Tokens Gemini charges for one image part
+IMAGE_PART_TOKENS = 258
+
+# Gemini models switch_model accepts even when MODEL_BACKENDS does not list them
+GEMINI_MODELS = ("gemini-1.5-flash", "gemini-1.5-pro")
 
 class ModelManager:
-    """Manager for handling different AI models and providing a unified interface."""
+    """Manager for handling different AI models and providing a unified interface.
+    
+    Calls are routed through a pool of model backends (see ``ProviderPool``),
+    which picks the fastest healthy one for each call and hedges slow calls.
+    """
     
-    def __init__(self):
-        """Initialize the model manager with available models."""
+    def __init__(self, scheduler: Optional[ModelScheduler] = None, pool: Optional[ProviderPool] = None):
+        """Initialize the model manager with available models.
+        
+        Args:
+            scheduler: Scheduler every model call is admitted through; the process-wide one if omitted
+            pool: Backends to route calls across; built from MODEL_BACKENDS if omitted
+        """
         try:
-            # Initialize the Gemini model directly
-            self.gemini_model = genai.GenerativeModel('gemini-1.5-flash')
+            # Every model call in the process shares one set of rate limits
+            self.scheduler = scheduler or get_model_scheduler()
+            
+            # Initialize the pool of model backends
+            self.pool = pool or ProviderPool(create_backends(), self.scheduler)
             
-            # Initialize the Langchain wrapper for Gemini
-            self.langchain_model = GoogleGenerativeAI(model="gemini-1.5-flash", 
-                                                     google_api_key=os.getenv("GEMINI_API_KEY"))
+            # The Langchain wrapper for Gemini is built on first use
+            self.langchain_model_name = "gemini-1.5-flash"
+            self._langchain_model = None
             
             logger.info("ModelManager initialized successfully")
         except Exception as e:
             logger.error(f"Error initializing ModelManager: {str(e)}")
             raise
     
+    def generate_content(self, contents: Any) -> str:
+        """Generate text from raw model contents without swallowing errors.
+        
+        Agents that need their own fallback behaviour (planner, evaluator)
+        call this instead of ``generate_text`` so failures reach them.
+        
+        Args:
+            contents: A prompt string or a list of prompt parts
+            
+        Returns:
+            The generated text response
+        """
+        return self.pool.generate(contents, self._estimate_tokens(contents)).text
+    
+    async def generate_content_async(self, contents: Any) -> str:
+        """Async counterpart of ``generate_content``; errors are raised to the caller.
+        
+        Args:
+            contents: A prompt string or a list of prompt parts
+            
+        Returns:
+            The generated text response
+        """
+        result = await self.pool.generate_async(contents, self._estimate_tokens(contents))
+        return result.text
+    
+    async def generate_content_stream(self, contents: Any) -> AsyncIterator[str]:
+        """Stream generated text chunks as the model produces them; errors are raised.
+        
+        Args:
+            contents: A prompt string or a list of prompt parts
+            
+        Yields:
+            Text chunks in generation order
+        """
+        async for chunk in self.pool.stream(contents, self._estimate_tokens(contents)):
+            yield chunk
+    
     def generate_text(self, prompt: str) -> str:
         """Generate text using the default Gemini model.
         
@@ -41,34 +101,124 @@ class ModelManager:
             The generated text response
         """
         try:
-            response = self.gemini_model.generate_content(prompt)
-            return response.text
+            return self.generate_content(prompt)
         except Exception as e:
             logger.error(f"Error generating text: {str(e)}")
+            record_fallback("model")
             return f"Error generating response: {str(e)}"
     
-    def generate_with_image(self, prompt: str, image_path: str) -> str:
+    def generate_with_image(self, prompt: str, image_path: str, image: Optional[PreparedImage] = None) -> str:
         """Generate text using the Gemini model with an image input.
         
         Args:
             prompt: The prompt text
             image_path: Path to the image file
+            image: The already prepared image, used instead of reading the file
+            
+        Returns:
+            The generated text response
+        """
+        try:
+            # Use the prepared image, or read the file
+            image_part = image.to_part() if image else self.load_image_part(image_path)
+            
+            # Generate content with the image
+            return self.generate_content([prompt, image_part])
+        except Exception as e:
+            logger.error(f"Error generating text with image: {str(e)}")
+            record_fallback("model")
+            return f"Error analyzing image: {str(e)}"
+    
+    async def generate_text_async(self, prompt: str) -> str:
+        """Async counterpart of ``generate_text``.
+        
+        Args:
+            prompt: The prompt text
+            
+        Returns:
+            The generated text response
+        """
+        try:
+            return await self.generate_content_async(prompt)
+        except Exception as e:
+            logger.error(f"Error generating text: {str(e)}")
+            record_fallback("model")
+            return f"Error generating response: {str(e)}"
+    
+    async def generate_text_stream(self, prompt: str) -> AsyncIterator[str]:
+        """Streaming counterpart of ``generate_text``.
+        
+        Args:
+            prompt: The prompt text
+            
+        Yields:
+            Text chunks in generation order
+        """
+        try:
+            async for chunk in self.generate_content_stream(prompt):
+                yield chunk
+        except Exception as e:
+            logger.error(f"Error streaming text: {str(e)}")
+            record_fallback("model")
+            yield f"Error generating response: {str(e)}"
+    
+    async def generate_with_image_async(
+        self,
+        prompt: str,
+        image_path: str,
+        image: Optional[PreparedImage] = None
+    ) -> str:
+        """Async counterpart of ``generate_with_image``.
+        
+        Args:
+            prompt: The prompt text
+            image_path: Path to the image file
+            image: The already prepared image, used instead of reading the file
             
         Returns:
             The generated text response
         """
         try:
-            # Read the image file
-            with open(image_path, "rb") as f:
-                image_data = f.read()
+            # Use the prepared image, or read the file off the event loop
+            if image:
+                image_part = image.to_part()
+            else:
+                image_part = await run_blocking(self.load_image_part, image_path)
             
             # Generate content with the image
-            response = self.gemini_model.generate_content([prompt, image_data])
-            return response.text
+            return await self.generate_content_async([prompt, image_part])
         except Exception as e:
             logger.error(f"Error generating text with image: {str(e)}")
+            record_fallback("model")
             return f"Error analyzing image: {str(e)}"
     
+    @staticmethod
+    def _estimate_tokens(contents: Any) -> int:
+        """Estimate prompt plus expected output tokens for rate limiting."""
+        image_parts = sum(1 for part in contents if is_image_part(part)) if isinstance(contents, list) else 0
+        return estimate_tokens(contents) + image_parts * IMAGE_PART_TOKENS + MODEL_EXPECTED_OUTPUT_TOKENS
+    
+    @staticmethod
+    def load_image_part(image_path: str) -> Dict[str, Any]:
+        """Read an image file as an inline-data part, without preprocessing."""
+        with open(image_path, "rb") as f:
+            data = f.read()
+        mime_type = mimetypes.guess_type(image_path)[0] or "image/jpeg"
+        return {"mime_type": mime_type, "data": data}
+    
+    @property
+    def langchain_model(self) -> Any:
+        """The Langchain wrapper for the current Gemini model, created on first use."""
+        if self._langchain_model is None:
+            # Imported here so startup does not pay for loading Langchain
+            from langchain_google_genai import GoogleGenerativeAI
+            
+            settings = get_settings()
+            self._langchain_model = GoogleGenerativeAI(model=self.langchain_model_name, 
+                                                      google_api_key=settings.gemini_api_key,
+                                                      client_options=settings.gemini_client_options)
+        return self._langchain_model
+    
     def run_langchain_chain(self, template: str, input_variables: Dict[str, Any]) -> str:
         """Run a Langchain chain with the specified template and input variables.
         
@@ -80,6 +230,9 @@ class ModelManager:
             The generated text response
         """
         try:
+            from langchain.prompts import PromptTemplate
+            from langchain.chains import LLMChain
+            
             # Create a prompt template
             prompt = PromptTemplate(
                 template=template,
@@ -88,33 +241,55 @@ class ModelManager:
             
             # Create and run the chain
             chain = LLMChain(llm=self.langchain_model, prompt=prompt)
-            response = chain.run(**input_variables)
+            estimated = estimate_tokens([template, *map(str, input_variables.values())]) + MODEL_EXPECTED_OUTPUT_TOKENS
+            with self.scheduler.slot_sync(estimated):
+                response = chain.run(**input_variables)
             
             return response
         except Exception as e:
             logger.error(f"Error running Langchain chain: {str(e)}")
             return f"Error generating response: {str(e)}"
     
+    async def run_langchain_chain_async(self, template: str, input_variables: Dict[str, Any]) -> str:
+        """Run a Langchain chain on the blocking thread pool.
+        
+        Args:
+            template: The prompt template string
+            input_variables: Dictionary of input variables for the template
+            
+        Returns:
+            The generated text response
+        """
+        return await run_blocking(self.run_langchain_chain, template, input_variables)
+    
     def switch_model(self, model_name: str) -> bool:
-        """Switch the active model to a different one.
+        """Switch the preferred model to a different one.
+        
+        The preferred backend is tried first while it is healthy; the pool
+        still fails over and hedges to the other backends. A Gemini model not
+        listed in MODEL_BACKENDS is registered on the first switch to it.
         
         Args:
-            model_name: The name of the model to switch to
+            model_name: The name of a registered backend, e.g. ``gemini-1.5-pro``
             
         Returns:
             Whether the switch was successful
         """
         try:
-            # Currently only supporting Gemini models
-            if model_name in ['gemini-1.5-flash', 'gemini-1.5-pro']:
-                self.gemini_model = genai.GenerativeModel(model_name)
-                self.langchain_model = GoogleGenerativeAI(model=model_name, 
-                                                         google_api_key=os.getenv("GEMINI_API_KEY"))
-                logger.info(f"Switched to model: {model_name}")
-                return True
-            else:
+            if model_name in GEMINI_MODELS and not any(backend.name == model_name for backend in self.pool.backends):
+                self.pool.add(GeminiBackend(model_name))
+            if not self.pool.prefer(model_name):
                 logger.warning(f"Unsupported model: {model_name}")
                 return False
+            if model_name.startswith("gemini"):
+                self.langchain_model_name = model_name
+                self._langchain_model = None
+            logger.info(f"Switched to model: {model_name}")
+            return True
         except Exception as e:
             logger.error(f"Error switching model: {str(e)}")
-            return False
\ No newline at end of file
+            return False
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Return scheduler admission counters and per-backend routing, health and latency."""
+        return {**self.scheduler.get_stats(), "providers": self.pool.get_stats()}
@@ -0,0 +1,621 @@
+import asyncio
+import base64
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional, Tuple
+from loguru import logger
+from ..config import load_environment
+from ..services.image_references import ImageHandle, is_image_part
+from ..utils.concurrency import run_blocking
+from ..utils.http import CircuitOpenError, get_circuit_breaker, get_http_client
+from ..utils.metrics import time_external_call, record_model_usage, record_hedge
+from .scheduler import ModelScheduler
+from .gemini_sdk import get_genai
+
+# Load environment variables
+load_environment()
+
+# Gemini models registered in the pool, in order of preference before latency is known. Hedges
+# and failovers go to the other backends, so listing a pricier model (e.g. gemini-1.5-pro) after
+# flash bills some calls at its rate
+MODEL_BACKENDS = os.getenv("MODEL_BACKENDS", "gemini-1.5-flash")
+
+# Optional OpenAI-compatible backend, e.g. a local inference server; empty base URL disables it
+OPENAI_COMPAT_BASE_URL = os.getenv("OPENAI_COMPAT_BASE_URL", "")
+OPENAI_COMPAT_MODEL = os.getenv("OPENAI_COMPAT_MODEL", "local-model")
+OPENAI_COMPAT_API_KEY = os.getenv("OPENAI_COMPAT_API_KEY", "")
+OPENAI_COMPAT_IMAGES = os.getenv("OPENAI_COMPAT_IMAGES", "false").lower() == "true"
+OPENAI_COMPAT_TIMEOUT = float(os.getenv("OPENAI_COMPAT_TIMEOUT", 60))
+
+# Hedging: once a call has run longer than the primary backend's MODEL_HEDGE_QUANTILE latency,
+# a duplicate goes to the next backend; at most MODEL_HEDGE_BUDGET of calls are hedged
+MODEL_HEDGING = os.getenv("MODEL_HEDGING", "true").lower() == "true"
+MODEL_HEDGE_QUANTILE = float(os.getenv("MODEL_HEDGE_QUANTILE", 0.95))
+MODEL_HEDGE_MIN_DELAY = float(os.getenv("MODEL_HEDGE_MIN_DELAY", 0.5))
+MODEL_HEDGE_DEFAULT_DELAY = float(os.getenv("MODEL_HEDGE_DEFAULT_DELAY", 8))
+MODEL_HEDGE_BUDGET = float(os.getenv("MODEL_HEDGE_BUDGET", 0.1))
+MODEL_LATENCY_WINDOW = int(os.getenv("MODEL_LATENCY_WINDOW", 200))
+MODEL_LATENCY_MIN_SAMPLES = int(os.getenv("MODEL_LATENCY_MIN_SAMPLES", 20))
+
+@dataclass
+class ModelResult:
+    """Text produced by a backend and the tokens it reports, if any."""
+    text: str
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> Optional[int]:
+        return (self.prompt_tokens + self.output_tokens) or None
+
+class ModelBackend(ABC):
+    """One model endpoint in the provider pool, with its own health and latency record.
+
+    Health is a circuit breaker opened by consecutive failures. Latency is a
+    window of recent call durations, from which the pool ranks backends and
+    derives the hedging deadline.
+    """
+
+    # Whether the backend accepts inline image parts
+    supports_images = True
+
+    # Whether the backend can read uploaded image handles by URI instead of inline bytes
+    supports_file_handles = False
+
+    def __init__(self, name: str, model_name: str, window: int = MODEL_LATENCY_WINDOW):
+        self.name = name
+        self.model_name = model_name
+        self.breaker = get_circuit_breaker(f"model:{name}")
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "failures": 0}
+
+    @abstractmethod
+    def generate(self, contents: Any) -> ModelResult:
+        """Generate a full response, blocking."""
+
+    @abstractmethod
+    async def generate_async(self, contents: Any) -> ModelResult:
+        """Generate a full response."""
+
+    @abstractmethod
+    def stream_async(self, contents: Any) -> AsyncIterator[ModelResult]:
+        """Yield response chunks; token counts, when reported, are cumulative."""
+
+    def load(self) -> None:
+        """Load the client library ahead of the first call; blocking."""
+
+    def render(self, contents: Any) -> Any:
+        """Replace image handles with file references this backend can read, or inline bytes; may read files."""
+        if not isinstance(contents, list):
+            return contents
+        return [self._render_part(part) if isinstance(part, ImageHandle) else part for part in contents]
+
+    def reads_files(self, contents: Any) -> bool:
+        """Whether rendering the contents reads local copies of image handles."""
+        return isinstance(contents, list) and any(
+            isinstance(part, ImageHandle) and not self._reads_uri(part) for part in contents
+        )
+
+    def _reads_uri(self, handle: ImageHandle) -> bool:
+        return self.supports_file_handles and handle.uri is not None
+
+    def _render_part(self, handle: ImageHandle) -> Dict[str, Any]:
+        return handle.to_part() if self._reads_uri(handle) else handle.inline_part()
+
+    @property
+    def healthy(self) -> bool:
+        """Whether the circuit is closed; open backends are still tried once their reset timeout passes."""
+        return self.breaker.state == "closed"
+
+    def record(self, latency: Optional[float], success: bool) -> None:
+        """Record the outcome of a call; ``latency`` is None for calls that do not measure a full response."""
+        with self._lock:
+            self._stats["calls"] += 1
+            if not success:
+                self._stats["failures"] += 1
+            elif latency is not None:
+                self._latencies.append(latency)
+        if success:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def observe_latency(self, latency: float) -> None:
+        """Add a latency sample without recording a call outcome."""
+        with self._lock:
+            self._latencies.append(latency)
+
+    def release(self) -> None:
+        """Give up a cancelled call without recording an outcome, freeing a half-open circuit's trial."""
+        self.breaker.release()
+
+    def latency_quantile(self, quantile: float, min_samples: int = MODEL_LATENCY_MIN_SAMPLES) -> Optional[float]:
+        """Return a quantile of recent latencies, or None while there are fewer than ``min_samples``."""
+        with self._lock:
+            if len(self._latencies) < min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(int(quantile * len(ordered)), len(ordered) - 1)]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return call counters, health and recent latency quantiles."""
+        with self._lock:
+            stats = {**self._stats, "samples": len(self._latencies)}
+        return {
+            **stats,
+            "model": self.model_name,
+            "state": self.breaker.state,
+            "p50_seconds": self.latency_quantile(0.5, min_samples=1),
+            "p95_seconds": self.latency_quantile(0.95, min_samples=1),
+        }
+
+class GeminiBackend(ModelBackend):
+    """A Gemini model called through the Google Generative AI SDK."""
+
+    supports_file_handles = True
+
+    def __init__(self, model_name: str):
+        super().__init__(model_name, model_name)
+        self._model: Any = None
+
+    @property
+    def model(self) -> Any:
+        """The SDK model, created on first use so building the pool does not import the SDK."""
+        if self._model is None:
+            self._model = get_genai().GenerativeModel(self.model_name)
+        return self._model
+
+    def load(self) -> None:
+        self.model
+
+    def generate(self, contents: Any) -> ModelResult:
+        return self._result(self.model.generate_content(contents))
+
+    async def generate_async(self, contents: Any) -> ModelResult:
+        model = await self._model_async()
+        return self._result(await model.generate_content_async(contents))
+
+    async def stream_async(self, contents: Any) -> AsyncIterator[ModelResult]:
+        model = await self._model_async()
+        response = await model.generate_content_async(contents, stream=True)
+        async for chunk in response:
+            yield self._result(chunk)
+
+    async def _model_async(self) -> Any:
+        """Return the SDK model, loading the SDK off the event loop if this is the first call."""
+        if self._model is not None:
+            return self._model
+        return await run_blocking(lambda: self.model)
+
+    @staticmethod
+    def _result(response: Any) -> ModelResult:
+        usage_metadata = getattr(response, "usage_metadata", None)
+        return ModelResult(
+            response.text,
+            getattr(usage_metadata, "prompt_token_count", 0) or 0,
+            getattr(usage_metadata, "candidates_token_count", 0) or 0,
+        )
+
+class OpenAICompatibleBackend(ModelBackend):
+    """A model served behind an OpenAI-compatible ``/chat/completions`` API, such as a local inference server."""
+
+    def __init__(
+        self,
+        base_url: str = OPENAI_COMPAT_BASE_URL,
+        model_name: str = OPENAI_COMPAT_MODEL,
+        api_key: str = OPENAI_COMPAT_API_KEY,
+        supports_images: bool = OPENAI_COMPAT_IMAGES
+    ):
+        super().__init__(f"openai:{model_name}", model_name)
+        self.url = f"{base_url.rstrip('/')}/chat/completions"
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.supports_images = supports_images
+        # The pool fails over and hedges across backends, so the client does not retry
+        self.http = get_http_client("openai_compat", read_timeout=OPENAI_COMPAT_TIMEOUT, max_retries=0)
+
+    def generate(self, contents: Any) -> ModelResult:
+        response = self.http.request("POST", self.url, json=self._payload(contents), headers=self.headers)
+        response.raise_for_status()
+        return self._result(response.json())
+
+    async def generate_async(self, contents: Any) -> ModelResult:
+        response = await self.http.request_async("POST", self.url, json=self._payload(contents), headers=self.headers)
+        response.raise_for_status()
+        return self._result(response.json())
+
+    async def stream_async(self, contents: Any) -> AsyncIterator[ModelResult]:
+        payload = {**self._payload(contents), "stream": True, "stream_options": {"include_usage": True}}
+        async with self.http.stream_async("POST", self.url, json=payload, headers=self.headers) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                yield self._result(json.loads(data), delta=True)
+
+    def _payload(self, contents: Any) -> Dict[str, Any]:
+        """Convert Gemini-style prompt parts into one OpenAI user message."""
+        parts = contents if isinstance(contents, list) else [contents]
+        content: List[Dict[str, Any]] = []
+        for part in parts:
+            if isinstance(part, str):
+                content.append({"type": "text", "text": part})
+            elif isinstance(part, dict) and "data" in part:
+                encoded = base64.b64encode(part["data"]).decode("ascii")
+                content.append({"type": "image_url", "image_url": {"url": f"data:{part['mime_type']};base64,{encoded}"}})
+        if all(item["type"] == "text" for item in content):
+            content = "\n".join(item["text"] for item in content)
+        return {"model": self.model_name, "messages": [{"role": "user", "content": content}]}
+
+    @staticmethod
+    def _result(body: Dict[str, Any], delta: bool = False) -> ModelResult:
+        choices = body.get("choices") or [{}]
+        message = choices[0].get("delta" if delta else "message") or {}
+        usage = body.get("usage") or {}
+        return ModelResult(
+            message.get("content") or "",
+            usage.get("prompt_tokens", 0) or 0,
+            usage.get("completion_tokens", 0) or 0,
+        )
+
+def create_backends() -> List[ModelBackend]:
+    """Build the backends configured by MODEL_BACKENDS and OPENAI_COMPAT_BASE_URL."""
+    backends: List[ModelBackend] = [
+        GeminiBackend(name.strip()) for name in MODEL_BACKENDS.split(",") if name.strip()
+    ]
+    if OPENAI_COMPAT_BASE_URL:
+        backends.append(OpenAICompatibleBackend())
+    return backends
+
+class ProviderPool:
+    """Routes model calls across several backends, hedging slow calls.
+
+    Each call goes to the fastest healthy backend: backends are ranked by
+    health, then median recent latency, then registration order (or the
+    preferred backend first). If the call is still running after the
+    primary's ``hedge_quantile`` latency, a duplicate is sent to the next
+    backend and the first answer wins; the other is cancelled. Hedges are
+    limited to a ``hedge_budget`` fraction of calls and skipped while the
+    scheduler is saturated, where they would only add load. A call that fails
+    is retried at once on the next backend.
+    """
+
+    def __init__(
+        self,
+        backends: List[ModelBackend],
+        scheduler: ModelScheduler,
+        hedging: bool = MODEL_HEDGING,
+        hedge_quantile: float = MODEL_HEDGE_QUANTILE,
+        hedge_min_delay: float = MODEL_HEDGE_MIN_DELAY,
+        hedge_default_delay: float = MODEL_HEDGE_DEFAULT_DELAY,
+        hedge_budget: float = MODEL_HEDGE_BUDGET
+    ):
+        """Initialize the pool.
+
+        Args:
+            backends: Backends in order of preference before latency is known
+            scheduler: Scheduler every attempt, hedges included, is admitted through
+            hedging: Whether slow calls are hedged
+            hedge_quantile: Latency quantile of the primary after which a call is hedged
+            hedge_min_delay: Shortest hedging deadline in seconds
+            hedge_default_delay: Deadline used until the primary has enough latency samples
+            hedge_budget: Largest fraction of calls that may be hedged
+        """
+        if not backends:
+            raise ValueError("At least one model backend is required")
+        self.backends = backends
+        self.scheduler = scheduler
+        self.hedging = hedging and len(backends) > 1
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_default_delay = hedge_default_delay
+        self.hedge_budget = hedge_budget
+        self.preferred: Optional[str] = None
+        # Each call earns ``hedge_budget`` credit and each hedge spends one; the cap bounds bursts
+        self._hedge_credit = 1.0
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "hedges": 0, "hedge_wins": 0, "failovers": 0}
+
+    def add(self, backend: ModelBackend) -> None:
+        """Register another backend, ranked after the existing ones until its latency is known."""
+        with self._lock:
+            self.backends = [*self.backends, backend]
+
+    def prefer(self, name: str) -> bool:
+        """Rank a backend first while it is healthy; returns False for unknown names."""
+        if not any(backend.name == name for backend in self.backends):
+            return False
+        self.preferred = name
+        return True
+
+    def ranked(self, images: bool = False) -> List[ModelBackend]:
+        """Return the backends able to take a call, best first."""
+        def key(item: Tuple[int, ModelBackend]) -> Tuple[bool, bool, float, int]:
+            order, backend = item
+            median = backend.latency_quantile(0.5)
+            return (
+                not backend.healthy,
+                backend.name != self.preferred,
+                median if median is not None else float("inf"),
+                order,
+            )
+        candidates = [
+            item for item in enumerate(self.backends) if item[1].supports_images or not images
+        ]
+        return [backend for _, backend in sorted(candidates, key=key)]
+
+    def hedge_delay(self, backend: ModelBackend) -> float:
+        """Seconds to wait on a backend before hedging."""
+        quantile = backend.latency_quantile(self.hedge_quantile)
+        if quantile is None:
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, quantile)
+
+    def generate(self, contents: Any, estimated_tokens: int) -> ModelResult:
+        """Generate a response, blocking, failing over to the next backend on errors.
+
+        Blocking calls are not hedged.
+
+        Raises:
+            The last backend's error if every backend failed
+        """
+        self._count("calls")
+        last_error: Optional[BaseException] = None
+        for backend in self._available(contents):
+            if last_error is not None:
+                self._count("failovers")
+            try:
+                return self._attempt(backend, contents, estimated_tokens)
+            except Exception as e:
+                logger.warning(f"Model backend {backend.name} failed: {str(e)}")
+                last_error = e
+        raise last_error or CircuitOpenError("model")
+
+    async def generate_async(self, contents: Any, estimated_tokens: int) -> ModelResult:
+        """Generate a response, hedging slow calls and failing over on errors.
+
+        Raises:
+            The last backend's error if every backend failed
+        """
+        self._count("calls")
+        candidates = self._available(contents)
+        primary = next(candidates, None)
+        if primary is None:
+            raise CircuitOpenError("model")
+
+        tasks = {asyncio.ensure_future(self._attempt_async(primary, contents, estimated_tokens)): primary}
+        deadline = time.monotonic() + self.hedge_delay(primary)
+        hedged = False
+        last_error: Optional[BaseException] = None
+        try:
+            while tasks:
+                timeout = None if hedged or not self.hedging else max(deadline - time.monotonic(), 0)
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    backup = self._next_hedge(candidates)
+                    if backup is not None:
+                        self._count("hedges")
+                        record_hedge(backup.name, "sent")
+                        tasks[asyncio.ensure_future(self._attempt_async(backup, contents, estimated_tokens))] = backup
+                    continue
+
+                for task in done:
+                    backend = tasks.pop(task)
+                    if task.exception() is None:
+                        if hedged and backend is not primary:
+                            self._count("hedge_wins")
+                            record_hedge(backend.name, "won")
+                        return task.result()
+                    last_error = task.exception()
+                    logger.warning(f"Model backend {backend.name} failed: {str(last_error)}")
+
+                # Fail over at once when nothing else is in flight
+                if not tasks:
+                    fallback = next(candidates, None)
+                    if fallback is not None:
+                        self._count("failovers")
+                        tasks[asyncio.ensure_future(self._attempt_async(fallback, contents, estimated_tokens))] = fallback
+        finally:
+            await self._cancel(tasks)
+        raise last_error or CircuitOpenError("model")
+
+    async def stream(self, contents: Any, estimated_tokens: int) -> AsyncIterator[str]:
+        """Stream a response, hedging a slow first chunk and failing over before anything is yielded.
+
+        Once a chunk has been yielded the stream is committed to its backend,
+        and later errors reach the caller.
+        """
+        self._count("calls")
+        candidates = self._available(contents)
+        primary = next(candidates, None)
+        if primary is None:
+            raise CircuitOpenError("model")
+
+        streams: Dict["asyncio.Future[Any]", Tuple[ModelBackend, AsyncIterator[str]]] = {}
+
+        def start(backend: ModelBackend) -> None:
+            stream = self._stream_attempt(backend, contents, estimated_tokens)
+            streams[asyncio.ensure_future(stream.__anext__())] = (backend, stream)
+
+        start(primary)
+        deadline = time.monotonic() + self.hedge_delay(primary)
+        hedged = False
+        last_error: Optional[BaseException] = None
+        winner: Optional[Tuple[ModelBackend, AsyncIterator[str]]] = None
+        first_chunk: Optional[str] = None
+        try:
+            while streams and winner is None:
+                timeout = None if hedged or not self.hedging else max(deadline - time.monotonic(), 0)
+                done, _ = await asyncio.wait(streams, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    backup = self._next_hedge(candidates)
+                    if backup is not None:
+                        self._count("hedges")
+                        record_hedge(backup.name, "sent")
+                        start(backup)
+                    continue
+
+                for task in done:
+                    backend, stream = streams.pop(task)
+                    error = task.exception()
+                    if error is None or isinstance(error, StopAsyncIteration):
+                        if winner is None:
+                            winner = (backend, stream)
+                            first_chunk = task.result() if error is None else None
+                            if hedged and backend is not primary:
+                                self._count("hedge_wins")
+                                record_hedge(backend.name, "won")
+                        else:
+                            await stream.aclose()
+                        continue
+                    last_error = error
+                    logger.warning(f"Model backend {backend.name} failed: {str(error)}")
+
+                if winner is None and not streams:
+                    fallback = next(candidates, None)
+                    if fallback is not None:
+                        self._count("failovers")
+                        start(fallback)
+        finally:
+            for task, (_, stream) in list(streams.items()):
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await stream.aclose()
+
+        if winner is None:
+            raise last_error or CircuitOpenError("model")
+        _, stream = winner
+        try:
+            if first_chunk is None:
+                return
+            yield first_chunk
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return routing and hedging counters and per-backend health and latency."""
+        with self._lock:
+            stats = dict(self._stats)
+        return {
+            **stats,
+            "hedging": self.hedging,
+            "preferred": self.preferred,
+            "backends": {backend.name: backend.get_stats() for backend in self.backends},
+        }
+
+    def _available(self, contents: Any) -> Iterator[ModelBackend]:
+        """Yield ranked backends whose circuit lets a call through, checked as each is reached."""
+        for backend in self.ranked(images=_has_images(contents)):
+            if backend.breaker.allow_request():
+                yield backend
+
+    def _next_hedge(self, candidates: Iterator[ModelBackend]) -> Optional[ModelBackend]:
+        """Return the backend to hedge with, or None when over budget or saturated."""
+        with self._lock:
+            if self._hedge_credit < 1 or not self.scheduler.has_capacity():
+                return None
+            backup = next(candidates, None)
+            if backup is not None:
+                self._hedge_credit -= 1
+            return backup
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+            if key == "calls":
+                self._hedge_credit = min(self._hedge_credit + self.hedge_budget, 1 + self.hedge_budget * 10)
+
+    def _attempt(self, backend: ModelBackend, contents: Any, estimated_tokens: int) -> ModelResult:
+        """Make one blocking call to a backend through the scheduler and record its outcome."""
+        started = time.monotonic()
+        try:
+            contents = backend.render(contents)
+            with self.scheduler.slot_sync(estimated_tokens) as usage:
+                with time_external_call(backend.name):
+                    result = backend.generate(contents)
+                usage.tokens = result.total_tokens
+        except Exception:
+            backend.record(None, False)
+            raise
+        backend.record(time.monotonic() - started, True)
+        record_model_usage(backend.model_name, result.prompt_tokens, result.output_tokens)
+        return result
+
+    async def _attempt_async(self, backend: ModelBackend, contents: Any, estimated_tokens: int) -> ModelResult:
+        """Make one call to a backend through the scheduler and record its outcome.
+
+        A cancelled attempt (the loser of a hedge) is not held against the
+        backend and frees its circuit's half-open trial, but the time it had
+        run counts as a latency sample, so a backend that keeps losing ranks lower.
+        """
+        started = time.monotonic()
+        try:
+            contents = await self._render(backend, contents)
+            async with self.scheduler.slot(estimated_tokens) as usage:
+                with time_external_call(backend.name):
+                    result = await backend.generate_async(contents)
+                usage.tokens = result.total_tokens
+        except asyncio.CancelledError:
+            backend.observe_latency(time.monotonic() - started)
+            backend.release()
+            raise
+        except Exception:
+            backend.record(None, False)
+            raise
+        backend.record(time.monotonic() - started, True)
+        record_model_usage(backend.model_name, result.prompt_tokens, result.output_tokens)
+        return result
+
+    async def _stream_attempt(self, backend: ModelBackend, contents: Any, estimated_tokens: int) -> AsyncIterator[str]:
+        """Stream one call from a backend through the scheduler, holding the slot until the stream ends."""
+        last: Optional[ModelResult] = None
+        try:
+            contents = await self._render(backend, contents)
+            async with self.scheduler.slot(estimated_tokens) as usage:
+                with time_external_call(f"{backend.name}_stream"):
+                    async for chunk in backend.stream_async(contents):
+                        last = chunk
+                        usage.tokens = chunk.total_tokens or usage.tokens
+                        if chunk.text:
+                            yield chunk.text
+        except (asyncio.CancelledError, GeneratorExit):
+            backend.release()
+            raise
+        except Exception:
+            backend.record(None, False)
+            raise
+        # Stream durations depend on output length, so they are not latency samples
+        backend.record(None, True)
+        # Usage is cumulative, so only the final chunk is counted
+        if last is not None:
+            record_model_usage(backend.model_name, last.prompt_tokens, last.output_tokens)
+
+    @staticmethod
+    async def _render(backend: ModelBackend, contents: Any) -> Any:
+        """Render image handles for a backend, reading local copies off the event loop."""
+        if backend.reads_files(contents):
+            return await run_blocking(backend.render, contents)
+        return backend.render(contents)
+
+    @staticmethod
+    async def _cancel(tasks: Dict["asyncio.Future[Any]", ModelBackend]) -> None:
+        """Cancel attempts still in flight and wait for them to release their slots."""
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+def _has_images(contents: Any) -> bool:
+    return isinstance(contents, list) and any(is_image_part(part) for part in contents)
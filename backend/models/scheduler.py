@@ -0,0 +1,375 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+from loguru import logger
+from ..config import load_environment
+from ..utils.metrics import record_model_scheduler
+
+# Load environment variables
+load_environment()
+
+# Configure the model call scheduler
+MODEL_REQUESTS_PER_SECOND = float(os.getenv("MODEL_REQUESTS_PER_SECOND", 10))
+MODEL_REQUEST_BURST = int(os.getenv("MODEL_REQUEST_BURST", 10))
+MODEL_TOKENS_PER_MINUTE = int(os.getenv("MODEL_TOKENS_PER_MINUTE", 1_000_000))
+MODEL_MIN_CONCURRENCY = int(os.getenv("MODEL_MIN_CONCURRENCY", 2))
+MODEL_MAX_CONCURRENCY = int(os.getenv("MODEL_MAX_CONCURRENCY", 32))
+MODEL_INITIAL_CONCURRENCY = int(os.getenv("MODEL_INITIAL_CONCURRENCY", 8))
+MODEL_TARGET_LATENCY = float(os.getenv("MODEL_TARGET_LATENCY", 10))
+MODEL_RATE_LIMIT_COOLDOWN = float(os.getenv("MODEL_RATE_LIMIT_COOLDOWN", 2))
+
+# Priority classes; lower values are admitted first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_BATCH: "batch",
+    PRIORITY_BACKGROUND: "background",
+}
+
+_priority: ContextVar[int] = ContextVar("model_priority", default=PRIORITY_INTERACTIVE)
+
+@contextmanager
+def model_priority(priority: int) -> Iterator[None]:
+    """Run model calls made in this context, and in tasks created from it, at ``priority``."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Return whether an exception is a provider rate-limit (HTTP 429) response."""
+    try:
+        from google.api_core.exceptions import ResourceExhausted
+        if isinstance(error, ResourceExhausted):
+            return True
+    except ImportError:
+        pass
+    response = getattr(error, "response", None)
+    return (
+        getattr(error, "code", None) == 429
+        or getattr(error, "status_code", None) == 429
+        or getattr(response, "status_code", None) == 429
+    )
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``rate`` per second up to ``capacity``; not thread-safe."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until ``amount`` tokens are available; amounts above capacity wait for a full bucket."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        """Take tokens; the balance may go negative, delaying later callers."""
+        self._refill()
+        self.tokens -= amount
+
+    def drain(self) -> None:
+        """Empty the bucket."""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+class _Waiter:
+    """A call waiting for admission."""
+
+    def __init__(self, priority: int, seq: int, tokens: int):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+        self.admitted = False
+        self.cancelled = False
+        self._event = threading.Event()
+        self._future: Optional[asyncio.Future] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> "asyncio.Future[None]":
+        """Attach a future on ``loop`` that completes on admission."""
+        self._loop = loop
+        self._future = loop.create_future()
+        return self._future
+
+    def wake(self) -> None:
+        """Signal admission; safe to call from any thread."""
+        if self._future is None:
+            self._event.set()
+        else:
+            self._loop.call_soon_threadsafe(self._resolve)
+
+    def wait(self) -> None:
+        """Block the calling thread until admitted."""
+        self._event.wait()
+
+    def _resolve(self) -> None:
+        if not self._future.done():
+            self._future.set_result(None)
+
+class CallUsage:
+    """Filled in by the caller with the tokens a call actually used, if the provider reports them."""
+
+    def __init__(self):
+        self.tokens: Optional[int] = None
+
+class ModelScheduler:
+    """Admits every model call through shared rate limits and an adaptive concurrency limit.
+
+    A call waits until a request-per-second bucket and a tokens-per-minute
+    bucket both have room and fewer than ``limit`` calls are in flight.
+    Waiting calls are admitted by priority class, then in arrival order. The
+    concurrency limit grows additively while calls finish under
+    ``target_latency`` and shrinks multiplicatively when they are slower or the
+    provider returns 429, which also pauses admission for a cooldown.
+    """
+
+    def __init__(
+        self,
+        requests_per_second: float = MODEL_REQUESTS_PER_SECOND,
+        request_burst: int = MODEL_REQUEST_BURST,
+        tokens_per_minute: int = MODEL_TOKENS_PER_MINUTE,
+        min_concurrency: int = MODEL_MIN_CONCURRENCY,
+        max_concurrency: int = MODEL_MAX_CONCURRENCY,
+        initial_concurrency: int = MODEL_INITIAL_CONCURRENCY,
+        target_latency: float = MODEL_TARGET_LATENCY,
+        rate_limit_cooldown: float = MODEL_RATE_LIMIT_COOLDOWN
+    ):
+        """Initialize the scheduler.
+
+        Args:
+            requests_per_second: Sustained request rate
+            request_burst: Requests allowed back to back after an idle period
+            tokens_per_minute: Sustained prompt plus output token rate
+            min_concurrency: Floor for the adaptive concurrency limit
+            max_concurrency: Ceiling for the adaptive concurrency limit
+            initial_concurrency: Starting concurrency limit
+            target_latency: Call latency in seconds above which concurrency is reduced
+            rate_limit_cooldown: Seconds to stop admitting calls after a 429
+        """
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.rate_limit_cooldown = rate_limit_cooldown
+        self.limit = float(min(max_concurrency, max(min_concurrency, initial_concurrency)))
+        self.in_flight = 0
+        self._requests = TokenBucket(requests_per_second, request_burst)
+        self._tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute)
+        self._cooldown_until = 0.0
+        self._waiters: List[_Waiter] = []
+        # Live (not cancelled) waiters per priority class
+        self._queued = {priority: 0 for priority in PRIORITY_NAMES}
+        self._seq = itertools.count()
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "admitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rate_limited": 0,
+            "wait_seconds": 0.0,
+        }
+        self._publish()
+
+    async def acquire(self, tokens: int) -> None:
+        """Wait for admission of a call estimated to use ``tokens`` tokens, at the context's priority."""
+        waiter = _Waiter(_priority.get(), next(self._seq), tokens)
+        future = waiter.bind(asyncio.get_running_loop())
+        with self._lock:
+            self._enqueue(waiter)
+            self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.admitted:
+                    self.in_flight -= 1
+                else:
+                    waiter.cancelled = True
+                    self._queued[waiter.priority] -= 1
+                self._dispatch()
+            raise
+
+    def acquire_sync(self, tokens: int) -> None:
+        """Blocking counterpart of ``acquire`` for calls made from worker threads."""
+        waiter = _Waiter(_priority.get(), next(self._seq), tokens)
+        with self._lock:
+            self._enqueue(waiter)
+            self._dispatch()
+        waiter.wait()
+
+    def release(self, latency: float, success: bool, rate_limited: bool = False, token_correction: int = 0) -> None:
+        """Finish an admitted call and adapt the concurrency limit.
+
+        Args:
+            latency: Seconds the call took
+            success: Whether the call succeeded
+            rate_limited: Whether the provider rejected the call with a 429
+            token_correction: Actual minus estimated tokens, charged to the token bucket
+        """
+        with self._lock:
+            self.in_flight -= 1
+            self._stats["completed" if success else "failed"] += 1
+            if token_correction:
+                self._tokens.consume(token_correction)
+
+            if rate_limited:
+                self._stats["rate_limited"] += 1
+                self.limit = max(self.min_concurrency, self.limit / 2)
+                self._cooldown_until = time.monotonic() + self.rate_limit_cooldown
+                self._requests.drain()
+                logger.warning(f"Model rate limited; concurrency limit reduced to {int(self.limit)}")
+            elif success and latency > self.target_latency:
+                self.limit = max(self.min_concurrency, self.limit * 0.9)
+            elif success:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, tokens: int) -> AsyncIterator[CallUsage]:
+        """Hold an admission slot for the duration of an async call."""
+        await self.acquire(tokens)
+        usage = CallUsage()
+        started = time.monotonic()
+        try:
+            yield usage
+        except BaseException as e:
+            self.release(time.monotonic() - started, False, rate_limited=is_rate_limit_error(e))
+            raise
+        self.release(time.monotonic() - started, True, token_correction=self._correction(usage, tokens))
+
+    @contextmanager
+    def slot_sync(self, tokens: int) -> Iterator[CallUsage]:
+        """Hold an admission slot for the duration of a blocking call."""
+        self.acquire_sync(tokens)
+        usage = CallUsage()
+        started = time.monotonic()
+        try:
+            yield usage
+        except BaseException as e:
+            self.release(time.monotonic() - started, False, rate_limited=is_rate_limit_error(e))
+            raise
+        self.release(time.monotonic() - started, True, token_correction=self._correction(usage, tokens))
+
+    def has_capacity(self) -> bool:
+        """Return whether a call would be admitted without queueing behind others or the concurrency limit."""
+        with self._lock:
+            queued = any(not waiter.cancelled for waiter in self._waiters)
+            return not queued and self.in_flight < max(1, int(self.limit))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return queue depth per priority class, the concurrency limit and admission counters."""
+        with self._lock:
+            queued = self._queue_depths()
+            stats = dict(self._stats)
+            admitted = stats.pop("admitted")
+            wait_seconds = stats.pop("wait_seconds")
+            return {
+                "queued": queued,
+                "in_flight": self.in_flight,
+                "concurrency_limit": int(self.limit),
+                "admitted": admitted,
+                "avg_wait_seconds": wait_seconds / admitted if admitted else 0.0,
+                **stats,
+            }
+
+    def _enqueue(self, waiter: _Waiter) -> None:
+        """Queue a call for admission; caller holds the lock."""
+        self._queued.setdefault(waiter.priority, 0)
+        self._queued[waiter.priority] += 1
+        heapq.heappush(self._waiters, waiter)
+
+    def _queue_depths(self) -> Dict[str, int]:
+        """Return the number of waiting calls per priority class name; caller holds the lock."""
+        return {PRIORITY_NAMES.get(priority, str(priority)): depth for priority, depth in self._queued.items()}
+
+    def _publish(self) -> None:
+        """Export queue depth, in-flight calls and the concurrency limit as gauges; caller holds the lock."""
+        record_model_scheduler(self._queue_depths(), self.in_flight, int(self.limit))
+
+    def _dispatch(self) -> None:
+        """Admit waiting calls while limits allow, then publish the scheduler gauges; caller holds the lock."""
+        self._admit()
+        self._publish()
+
+    def _admit(self) -> None:
+        """Admit waiting calls while limits allow; caller holds the lock."""
+        while self._waiters:
+            waiter = self._waiters[0]
+            if waiter.cancelled:
+                heapq.heappop(self._waiters)
+                continue
+            if self.in_flight >= max(1, int(self.limit)):
+                return
+            delay = max(
+                self._cooldown_until - time.monotonic(),
+                self._requests.time_until(1),
+                self._tokens.time_until(waiter.tokens)
+            )
+            if delay > 0:
+                self._schedule_dispatch(delay)
+                return
+
+            heapq.heappop(self._waiters)
+            self._queued[waiter.priority] -= 1
+            self._requests.consume(1)
+            self._tokens.consume(waiter.tokens)
+            self.in_flight += 1
+            self._stats["admitted"] += 1
+            self._stats["wait_seconds"] += time.monotonic() - waiter.enqueued_at
+            waiter.admitted = True
+            waiter.wake()
+
+    def _schedule_dispatch(self, delay: float) -> None:
+        """Re-run dispatch once the buckets have refilled; caller holds the lock."""
+        if self._timer is not None and self._timer.is_alive():
+            return
+
+        def run() -> None:
+            with self._lock:
+                self._timer = None
+                self._dispatch()
+
+        self._timer = threading.Timer(delay, run)
+        self._timer.daemon = True
+        self._timer.start()
+
+    @staticmethod
+    def _correction(usage: CallUsage, estimated: int) -> int:
+        """Return the difference between reported and estimated tokens."""
+        return usage.tokens - estimated if usage.tokens is not None else 0
+
+_scheduler: Optional[ModelScheduler] = None
+_scheduler_lock = threading.Lock()
+
+def get_model_scheduler() -> ModelScheduler:
+    """Return the process-wide model scheduler, creating it on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ModelScheduler()
+            logger.info("Model scheduler initialized")
+        return _scheduler
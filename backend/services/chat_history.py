@@ -0,0 +1,260 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional
+from loguru import logger
+from .database import (
+    DatabaseService,
+    SESSION_PAGE_SIZE,
+    MESSAGE_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    SESSION_PROJECTIONS,
+    MESSAGE_PROJECTIONS
+)
+from .write_behind import WriteBehindBuffer
+from .history_cache import HistoryCache, HISTORY_CACHE_MESSAGES
+from ..utils.cache import TTLCache
+from ..utils.concurrency import run_blocking
+from ..utils.error_handling import AppError
+
+# Sessions this worker has buffered a chat_sessions row for, and owners it has looked up
+KNOWN_SESSIONS_MAX = 10000
+
+# Length of the session title taken from its first message
+SESSION_TITLE_CHARS = 80
+
+class ChatHistoryService:
+    """Records chat sessions and messages without putting the database on the request path."""
+
+    def __init__(
+        self,
+        database: DatabaseService,
+        write_buffer: Optional[WriteBehindBuffer] = None,
+        cache: Optional[HistoryCache] = None
+    ):
+        """Initialize the chat history service.
+
+        Args:
+            database: The database service
+            write_buffer: Buffer for writes; history is not recorded if omitted
+            cache: Optional read-through cache of recent messages per session
+        """
+        self.database = database
+        self.write_buffer = write_buffer
+        self.cache = cache
+        self._created = TTLCache(max_entries=KNOWN_SESSIONS_MAX)
+        # Session id -> owning user id, as stored in the database
+        self._owners = TTLCache(max_entries=KNOWN_SESSIONS_MAX)
+        logger.info(
+            f"ChatHistoryService initialized (recording={'on' if write_buffer else 'off'}, "
+            f"cache={'on' if cache else 'off'})"
+        )
+
+    def record_turn(
+        self,
+        session_id: Optional[str],
+        message: str,
+        response: str,
+        user_id: Optional[str] = None
+    ) -> None:
+        """Buffer a user message and the assistant's response for a session.
+
+        The first turn this worker records for a session also buffers the
+        session row, owned by ``user_id`` and titled after the message; it is
+        skipped by the database if the session already exists.
+
+        Args:
+            session_id: The chat session; nothing is recorded without one
+            message: The user's message
+            response: The final response
+            user_id: The user the session belongs to
+        """
+        if not session_id:
+            return
+        # The response is stamped a microsecond after the message, so ordering by timestamp
+        # keeps each pair in order whatever ids the database assigns
+        sent_at = datetime.now(timezone.utc)
+        answered_at = sent_at + timedelta(microseconds=1)
+        if self._created.get(session_id) is None:
+            self._created.set(session_id, True)
+            self.save_session({
+                "id": session_id,
+                "user_id": user_id,
+                "title": message[:SESSION_TITLE_CHARS],
+                "created_at": sent_at.isoformat(timespec="microseconds"),
+            })
+        self.save_messages(session_id, [
+            {"session_id": session_id, "role": "user", "content": message,
+             "timestamp": sent_at.isoformat(timespec="microseconds")},
+            {"session_id": session_id, "role": "assistant", "content": response,
+             "timestamp": answered_at.isoformat(timespec="microseconds")}
+        ])
+
+    def save_messages(self, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        """Buffer message rows for a session and append them to its cached history.
+
+        Args:
+            session_id: The chat session
+            messages: ``chat_messages`` rows in chronological order
+        """
+        if self.write_buffer is None:
+            return
+        for row in messages:
+            self.write_buffer.add("chat_messages", row)
+        if self.cache is not None:
+            self.cache.append(session_id, messages)
+
+    async def recent_messages(self, session_id: str, limit: int = HISTORY_CACHE_MESSAGES) -> List[Dict[str, Any]]:
+        """Return a session's last ``limit`` messages in chronological order.
+
+        Served from the cache when the session is held there; otherwise read
+        from the database, merged with this worker's unflushed writes, and cached.
+        Returns an empty list if the history cannot be read.
+
+        Args:
+            session_id: The chat session
+            limit: Number of most recent messages to return
+        """
+        if self.cache is not None:
+            cached = self.cache.get(session_id, limit)
+            if cached is not None:
+                return cached
+        if not self.database.configured:
+            return []
+
+        fetch_limit = max(limit, self.cache.max_messages) if self.cache is not None else limit
+        token = self.cache.fill_token(session_id) if self.cache is not None else 0
+        result = await run_blocking(self.database.get_chat_messages, session_id, self._clamp(fetch_limit))
+        if not result.get("success"):
+            logger.warning(f"Could not load history for session {session_id}: {result.get('error')}")
+            return []
+
+        messages = self._merge_unflushed(session_id, result["messages"])
+        if self.cache is not None:
+            complete = result["next_cursor"] is None
+            self.cache.put(session_id, messages, complete, token)
+        return messages[-limit:]
+
+    def save_session(self, session_data: Dict[str, Any]) -> None:
+        """Buffer a chat session row.
+
+        Args:
+            session_data: Dictionary with session data
+        """
+        if self.write_buffer is None:
+            return
+        self.write_buffer.add("chat_sessions", session_data)
+
+    async def list_sessions(
+        self,
+        user_id: str,
+        limit: int = SESSION_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        fields: str = "summary"
+    ) -> Dict[str, Any]:
+        """Return one page of a user's sessions, newest first.
+
+        Args:
+            user_id: The user whose sessions are listed
+            limit: Page size, capped at ``MAX_PAGE_SIZE``
+            cursor: ``next_cursor`` from the previous page
+            fields: Column projection, one of ``SESSION_PROJECTIONS``
+
+        Returns:
+            Dictionary with ``sessions`` and ``next_cursor``
+
+        Raises:
+            AppError: If the request is invalid or the database is unavailable
+        """
+        if not user_id:
+            raise AppError("user_id is required", status_code=400)
+        self._validate_page(fields, SESSION_PROJECTIONS, cursor)
+        result = await run_blocking(
+            self.database.get_chat_sessions, user_id, self._clamp(limit), cursor, fields
+        )
+        return self._unwrap(result, "sessions")
+
+    async def get_messages(
+        self,
+        session_id: str,
+        user_id: str,
+        limit: int = MESSAGE_PAGE_SIZE,
+        before: Optional[str] = None,
+        fields: str = "summary"
+    ) -> Dict[str, Any]:
+        """Return one page of a session's messages in chronological order.
+
+        Args:
+            session_id: The session ID
+            user_id: The user the session must belong to
+            limit: Page size, capped at ``MAX_PAGE_SIZE``
+            before: ``next_cursor`` from the previous (newer) page
+            fields: Column projection, one of ``MESSAGE_PROJECTIONS``
+
+        Returns:
+            Dictionary with ``messages`` and ``next_cursor``
+
+        Raises:
+            AppError: If the request is invalid, the session is not the user's or the database is unavailable
+        """
+        self._validate_page(fields, MESSAGE_PROJECTIONS, before)
+        await self._check_owner(session_id, user_id)
+        result = await run_blocking(
+            self.database.get_chat_messages, session_id, self._clamp(limit), before, fields
+        )
+        return self._unwrap(result, "messages")
+
+    async def _check_owner(self, session_id: str, user_id: str) -> None:
+        """Raise unless the session belongs to the user; unknown sessions are reported the same way.
+
+        The stored session row decides; a session created by this worker whose
+        row is still waiting in the write buffer is owned by the user it was created for.
+        """
+        if not user_id:
+            raise AppError("user_id is required", status_code=400)
+        owner = self._owners.get(session_id)
+        if owner is None:
+            result = await run_blocking(self.database.get_chat_session, session_id)
+            if not result.get("success"):
+                raise AppError(result.get("error", "Database error"), status_code=502)
+            if result["session"] is not None:
+                owner = result["session"].get("user_id") or ""
+                self._owners.set(session_id, owner)
+            elif self.write_buffer is not None:
+                pending = self.write_buffer.pending_rows("chat_sessions", "id", session_id)
+                owner = pending[0].get("user_id") if pending else None
+        if owner != user_id:
+            raise AppError("Session not found", status_code=404)
+
+    def _merge_unflushed(self, session_id: str, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Append rows still waiting in the write buffer to messages read from the database."""
+        if self.write_buffer is None:
+            return messages
+        stored = {(m.get("role"), m.get("content"), m.get("timestamp")) for m in messages}
+        unflushed = [
+            row for row in self.write_buffer.pending_rows("chat_messages", "session_id", session_id)
+            if (row.get("role"), row.get("content"), row.get("timestamp")) not in stored
+        ]
+        return messages + unflushed
+
+    def _validate_page(self, fields: str, projections: Dict[str, str], cursor: Optional[str]) -> None:
+        """Reject page requests the database cannot serve before querying it."""
+        if not self.database.configured:
+            raise AppError("Database not configured", status_code=503)
+        if fields not in projections:
+            raise AppError(f"Unknown fields projection: {fields}", status_code=400)
+        if cursor:
+            try:
+                DatabaseService.decode_cursor(cursor)
+            except ValueError:
+                raise AppError("Invalid cursor", status_code=400)
+
+    @staticmethod
+    def _clamp(limit: int) -> int:
+        """Keep a requested page size between 1 and ``MAX_PAGE_SIZE``."""
+        return min(max(limit, 1), MAX_PAGE_SIZE)
+
+    @staticmethod
+    def _unwrap(result: Dict[str, Any], key: str) -> Dict[str, Any]:
+        """Turn a database result into a page, raising on failure."""
+        if not result.get("success"):
+            raise AppError(result.get("error", "Database error"), status_code=502)
+        return {key: result[key], "next_cursor": result["next_cursor"]}
@@ -1,31 +1,93 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
+import base64
+import json
 import os
+import threading
 from loguru import logger
-import supabase
-from dotenv import load_dotenv
+from ..config import load_environment, get_settings
+from ..utils.http import CircuitOpenError, get_circuit_breaker
+from ..utils.metrics import time_external_call
 
 # Load environment variables
-load_dotenv()
+load_environment()
 
-# Configure Supabase
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+# Configure Supabase; the URL and key come from the shared settings
+SUPABASE_TIMEOUT = int(os.getenv("SUPABASE_TIMEOUT", 10))
+
+# Configure pagination
+SESSION_PAGE_SIZE = int(os.getenv("SESSION_PAGE_SIZE", 20))
+MESSAGE_PAGE_SIZE = int(os.getenv("MESSAGE_PAGE_SIZE", 50))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 100))
+
+# Named column projections; each includes the keyset columns used for paging
+SESSION_PROJECTIONS = {
+    "summary": "id,title,created_at",
+    "full": "*",
+}
+MESSAGE_PROJECTIONS = {
+    "summary": "id,role,content,timestamp",
+    "full": "*",
+}
+
+# Error codes no retry can fix: PostgreSQL data exceptions (22, e.g. a malformed uuid), integrity
+# constraint violations (23, e.g. a message for a missing session) and PostgREST request and
+# schema errors (PGRST1xx, PGRST2xx)
+PERMANENT_ERROR_PREFIXES = ("22", "23", "PGRST1", "PGRST2")
+
+def is_permanent_error(error: Exception) -> bool:
+    """Return whether Supabase rejected a request itself, so retrying it would fail the same way.
+
+    Network errors, timeouts, 5xx, 408 and 429 responses and an open
+    circuit are transient.
+    """
+    code = str(getattr(error, "code", "") or "")
+    if code.startswith(PERMANENT_ERROR_PREFIXES):
+        return True
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return isinstance(status, int) and 400 <= status < 500 and status not in (408, 429)
+
+# Tables whose rows may already exist, e.g. sessions the frontend created with its own client;
+# buffered inserts of an existing key are skipped rather than rejected
+UPSERT_KEYS = {"chat_sessions": "id"}
 
 class DatabaseService:
     """Service for handling database operations for the Greenie app."""
     
     def __init__(self):
-        """Initialize the database service."""
-        try:
-            if not SUPABASE_URL or not SUPABASE_KEY:
-                logger.warning("Supabase credentials not found. Database functionality will be limited.")
-                self.client = None
-            else:
-                self.client = supabase.create_client(SUPABASE_URL, SUPABASE_KEY)
-                logger.info("DatabaseService initialized successfully")
-        except Exception as e:
-            logger.error(f"Error initializing DatabaseService: {str(e)}")
-            self.client = None
+        """Initialize the database service; the Supabase client is created on first use."""
+        # Fail fast while Supabase is degraded
+        self.breaker = get_circuit_breaker("supabase")
+        settings = get_settings()
+        self.configured = settings.supabase_configured
+        self._client = None
+        self._client_failed = False
+        self._client_lock = threading.Lock()
+        if not self.configured:
+            logger.warning("Supabase credentials not found. Database functionality will be limited.")
+    
+    @property
+    def client(self) -> Optional[Any]:
+        """The Supabase client, or None if Supabase is not configured or the client could not be created."""
+        if self._client is not None or not self.configured or self._client_failed:
+            return self._client
+        with self._client_lock:
+            if self._client is None and not self._client_failed:
+                try:
+                    # Imported here so startup does not pay for loading the SDK
+                    import supabase
+                    from supabase.lib.client_options import ClientOptions
+                    
+                    settings = get_settings()
+                    self._client = supabase.create_client(
+                        settings.supabase_url,
+                        settings.supabase_key,
+                        options=ClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT)
+                    )
+                    logger.info("DatabaseService initialized successfully")
+                except Exception as e:
+                    logger.error(f"Error initializing DatabaseService: {str(e)}")
+                    self._client_failed = True
+        return self._client
     
     def save_chat_session(self, session_data: Dict[str, Any]) -> Dict[str, Any]:
         """Save a chat session to the database.
@@ -44,19 +106,12 @@ class DatabaseService:
                 }
             
             # Insert the session data into the chat_sessions table
-            response = self.client.table('chat_sessions').insert(session_data).execute()
-            
-            # Check for errors
-            if response.get('error'):
-                logger.error(f"Error saving chat session: {response.get('error')}")
-                return {
-                    "error": f"Error saving chat session: {response.get('error')}",
-                    "success": False
-                }
+            response = self._execute(self.client.table('chat_sessions').insert(session_data))
             
+            # Failed requests raise and are reported below
             return {
                 "success": True,
-                "data": response.get('data', [])
+                "data": response.data
             }
             
         except Exception as e:
@@ -66,45 +121,57 @@ class DatabaseService:
                 "success": False
             }
     
-    def get_chat_sessions(self, user_id: Optional[str] = None) -> Dict[str, Any]:
-        """Get all chat sessions for a user.
+    def get_chat_sessions(
+        self,
+        user_id: Optional[str] = None,
+        limit: int = SESSION_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        fields: str = "summary"
+    ) -> Dict[str, Any]:
+        """Get one page of chat sessions, newest first.
+        
+        Pages are read by keyset on ``(created_at, id)``, so every page costs
+        the same however many sessions a user has.
         
         Args:
             user_id: Optional user ID to filter sessions
+            limit: Maximum number of sessions to return
+            cursor: ``next_cursor`` from the previous page, or None for the first page
+            fields: Column projection, one of ``SESSION_PROJECTIONS``
             
         Returns:
-            Dictionary with operation result
+            Dictionary with operation result, the sessions and ``next_cursor`` (None on the last page)
         """
         try:
             if not self.client:
                 return {
                     "error": "Database not configured",
                     "success": False,
-                    "sessions": []
+                    "sessions": [],
+                    "next_cursor": None
                 }
             
             # Query the chat_sessions table
-            query = self.client.table('chat_sessions')
+            query = self.client.table('chat_sessions').select(self._projection(SESSION_PROJECTIONS, fields))
             
             # Filter by user_id if provided
             if user_id:
                 query = query.eq('user_id', user_id)
             
-            # Execute the query
-            response = query.order('created_at', {'ascending': False}).execute()
+            # Continue after the last session of the previous page
+            if cursor:
+                query = query.or_(self._keyset_filter('created_at', cursor, 'lt'))
             
-            # Check for errors
-            if response.get('error'):
-                logger.error(f"Error getting chat sessions: {response.get('error')}")
-                return {
-                    "error": f"Error getting chat sessions: {response.get('error')}",
-                    "success": False,
-                    "sessions": []
-                }
+            # Fetch one extra row to learn whether another page follows
+            response = self._execute(
+                query.order('created_at', desc=True).order('id', desc=True).limit(limit + 1)
+            )
+            sessions, next_cursor = self._page(response.data, limit, 'created_at')
             
             return {
                 "success": True,
-                "sessions": response.get('data', [])
+                "sessions": sessions,
+                "next_cursor": next_cursor
             }
             
         except Exception as e:
@@ -112,44 +179,99 @@ class DatabaseService:
             return {
                 "error": f"Error getting chat sessions: {str(e)}",
                 "success": False,
-                "sessions": []
+                "sessions": [],
+                "next_cursor": None
             }
     
-    def get_chat_messages(self, session_id: str) -> Dict[str, Any]:
-        """Get all messages for a chat session.
+    def get_chat_session(self, session_id: str) -> Dict[str, Any]:
+        """Get a chat session by id, with the ``summary`` projection and its ``user_id``.
         
         Args:
             session_id: The session ID
             
         Returns:
-            Dictionary with operation result
+            Dictionary with operation result and the session, None if there is no session with that id
         """
         try:
             if not self.client:
                 return {
                     "error": "Database not configured",
                     "success": False,
-                    "messages": []
+                    "session": None
                 }
             
-            # Query the chat_messages table
-            response = self.client.table('chat_messages')\
-                .eq('session_id', session_id)\
-                .order('timestamp', {'ascending': True})\
-                .execute()
-            
-            # Check for errors
-            if response.get('error'):
-                logger.error(f"Error getting chat messages: {response.get('error')}")
+            response = self._execute(
+                self.client.table('chat_sessions')
+                .select(f"{SESSION_PROJECTIONS['summary']},user_id")
+                .eq('id', session_id)
+                .limit(1)
+            )
+            
+            return {
+                "success": True,
+                "session": response.data[0] if response.data else None
+            }
+            
+        except Exception as e:
+            logger.error(f"Error getting chat session: {str(e)}")
+            return {
+                "error": f"Error getting chat session: {str(e)}",
+                "success": False,
+                "session": None
+            }
+    
+    def get_chat_messages(
+        self,
+        session_id: str,
+        limit: int = MESSAGE_PAGE_SIZE,
+        before: Optional[str] = None,
+        fields: str = "summary"
+    ) -> Dict[str, Any]:
+        """Get one page of a session's messages in chronological order.
+        
+        The first page holds the newest messages; pass its ``next_cursor`` as
+        ``before`` to read the page of messages preceding it.
+        
+        Args:
+            session_id: The session ID
+            limit: Maximum number of messages to return
+            before: ``next_cursor`` from the previous page, or None for the newest messages
+            fields: Column projection, one of ``MESSAGE_PROJECTIONS``
+            
+        Returns:
+            Dictionary with operation result, the messages and ``next_cursor`` (None when no older messages remain)
+        """
+        try:
+            if not self.client:
                 return {
-                    "error": f"Error getting chat messages: {response.get('error')}",
+                    "error": "Database not configured",
                     "success": False,
-                    "messages": []
+                    "messages": [],
+                    "next_cursor": None
                 }
             
+            # Query the chat_messages table
+            query = (
+                self.client.table('chat_messages')
+                .select(self._projection(MESSAGE_PROJECTIONS, fields))
+                .eq('session_id', session_id)
+            )
+            
+            # Continue before the oldest message of the previous page
+            if before:
+                query = query.or_(self._keyset_filter('timestamp', before, 'lt'))
+            
+            # Read newest first so the page is bounded, then return it oldest first
+            response = self._execute(
+                query.order('timestamp', desc=True).order('id', desc=True).limit(limit + 1)
+            )
+            messages, next_cursor = self._page(response.data, limit, 'timestamp')
+            messages.reverse()
+            
             return {
                 "success": True,
-                "messages": response.get('data', [])
+                "messages": messages,
+                "next_cursor": next_cursor
             }
             
         except Exception as e:
@@ -157,7 +279,8 @@ class DatabaseService:
             return {
                 "error": f"Error getting chat messages: {str(e)}",
                 "success": False,
-                "messages": []
+                "messages": [],
+                "next_cursor": None
             }
     
     def save_chat_message(self, message_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -177,19 +300,12 @@ class DatabaseService:
                 }
             
             # Insert the message data into the chat_messages table
-            response = self.client.table('chat_messages').insert(message_data).execute()
-            
-            # Check for errors
-            if response.get('error'):
-                logger.error(f"Error saving chat message: {response.get('error')}")
-                return {
-                    "error": f"Error saving chat message: {response.get('error')}",
-                    "success": False
-                }
+            response = self._execute(self.client.table('chat_messages').insert(message_data))
             
+            # Failed requests raise and are reported below
             return {
                 "success": True,
-                "data": response.get('data', [])
+                "data": response.data
             }
             
         except Exception as e:
@@ -197,4 +313,108 @@ class DatabaseService:
             return {
                 "error": f"Error saving chat message: {str(e)}",
                 "success": False
-            }
\ No newline at end of file
+            }
+    
+    def insert_rows(self, table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert several rows into a table with one request.
+        
+        Unlike the single-row helpers this raises on failure, so callers
+        such as the write-behind buffer can keep the rows and retry. Rows for
+        tables in ``UPSERT_KEYS`` whose key already exists are skipped.
+        
+        Args:
+            table: Target table
+            rows: Rows to insert
+            
+        Returns:
+            The inserted rows
+        """
+        if not self.client:
+            raise RuntimeError("Database not configured")
+        key = UPSERT_KEYS.get(table)
+        query = self.client.table(table)
+        if key:
+            query = query.upsert(rows, on_conflict=key, ignore_duplicates=True)
+        else:
+            query = query.insert(rows)
+        response = self._execute(query)
+        return response.data
+    
+    @staticmethod
+    def encode_cursor(row: Dict[str, Any], sort_column: str) -> str:
+        """Encode a row's keyset position as an opaque cursor."""
+        payload = json.dumps([row[sort_column], row['id']]).encode('utf-8')
+        return base64.urlsafe_b64encode(payload).decode('ascii')
+    
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[str, Any]:
+        """Decode a cursor into its ``(sort value, id)`` pair.
+        
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        try:
+            sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        except Exception:
+            raise ValueError("Invalid cursor")
+        return sort_value, row_id
+    
+    def _keyset_filter(self, sort_column: str, cursor: str, operator: str) -> str:
+        """Build the PostgREST ``or`` filter selecting rows past a cursor, with ``id`` as tiebreaker."""
+        sort_value, row_id = self.decode_cursor(cursor)
+        sort_value = json.dumps(str(sort_value))
+        row_id = json.dumps(str(row_id))
+        return (
+            f"{sort_column}.{operator}.{sort_value},"
+            f"and({sort_column}.eq.{sort_value},id.{operator}.{row_id})"
+        )
+    
+    def _page(self, rows: List[Dict[str, Any]], limit: int, sort_column: str) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Trim the extra look-ahead row and return the page with the cursor for the next one."""
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, self.encode_cursor(rows[-1], sort_column)
+    
+    @staticmethod
+    def _projection(projections: Dict[str, str], fields: str) -> str:
+        """Return the column list for a named projection.
+        
+        Raises:
+            ValueError: If the projection is unknown
+        """
+        if fields not in projections:
+            raise ValueError(f"Unknown fields projection: {fields}")
+        return projections[fields]
+    
+    def _execute(self, query: Any) -> Any:
+        """Execute a Supabase query under the circuit breaker.
+        
+        A request Supabase rejects as invalid (see ``is_permanent_error``)
+        does not count against the breaker, since Supabase itself answered.
+        
+        Args:
+            query: A Supabase query builder
+            
+        Returns:
+            The query response
+            
+        Raises:
+            CircuitOpenError: If the circuit is open
+        """
+        if not self.breaker.allow_request():
+            raise CircuitOpenError("supabase")
+        try:
+            with time_external_call("supabase"):
+                response = query.execute()
+        except Exception as e:
+            if is_permanent_error(e):
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+        return response
\ No newline at end of file
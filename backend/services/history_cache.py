@@ -0,0 +1,288 @@
+import json
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+from loguru import logger
+from ..config import load_environment, get_settings
+from ..utils.metrics import record_cache_lookup
+
+# Load environment variables
+load_environment()
+
+# Configure the chat history cache
+HISTORY_CACHE_MAX_SESSIONS = int(os.getenv("HISTORY_CACHE_MAX_SESSIONS", 1000))
+HISTORY_CACHE_MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+HISTORY_CACHE_MESSAGES = int(os.getenv("HISTORY_CACHE_MESSAGES", 50))
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", 900))
+HISTORY_INVALIDATION_BACKEND = os.getenv("HISTORY_INVALIDATION_BACKEND", "local")
+HISTORY_INVALIDATION_CHANNEL = os.getenv("HISTORY_INVALIDATION_CHANNEL", "greenie:history")
+
+# Rough per-message bookkeeping cost on top of its string values
+MESSAGE_OVERHEAD_BYTES = 200
+
+# Receives one decoded update: {"origin", "session_id", "messages"}
+UpdateHandler = Callable[[Dict[str, Any]], None]
+
+class InvalidationChannel(ABC):
+    """Pub/sub interface that carries history updates between workers."""
+
+    @abstractmethod
+    def publish(self, update: Dict[str, Any]) -> None:
+        """Send an update to every subscriber."""
+
+    @abstractmethod
+    def subscribe(self, handler: UpdateHandler) -> None:
+        """Register a handler called with each published update."""
+
+    def close(self) -> None:
+        """Release any resources held by the channel."""
+
+class LocalInvalidationChannel(InvalidationChannel):
+    """In-process stand-in for a pub/sub server.
+
+    Every cache in the process that subscribes shares one hub, so updates
+    reach them synchronously without a broker. Use the Redis channel to reach
+    workers in other processes.
+    """
+
+    _handlers: List[UpdateHandler] = []
+    _handlers_lock = threading.Lock()
+
+    def publish(self, update: Dict[str, Any]) -> None:
+        with self._handlers_lock:
+            handlers = list(self._handlers)
+        for handler in handlers:
+            handler(update)
+
+    def subscribe(self, handler: UpdateHandler) -> None:
+        with self._handlers_lock:
+            self._handlers.append(handler)
+
+    def unsubscribe(self, handler: UpdateHandler) -> None:
+        """Stop delivering updates to a handler."""
+        with self._handlers_lock:
+            if handler in self._handlers:
+                self._handlers.remove(handler)
+
+class RedisInvalidationChannel(InvalidationChannel):
+    """Channel over Redis pub/sub, reaching every worker connected to the same server."""
+
+    def __init__(self, url: Optional[str] = None, channel: str = HISTORY_INVALIDATION_CHANNEL):
+        # Imported here so the redis client is only required when this channel is selected
+        import redis
+
+        self._client = redis.from_url(url or get_settings().redis_url, decode_responses=True)
+        self.channel = channel
+        self._pubsub = None
+        self._thread = None
+
+    def publish(self, update: Dict[str, Any]) -> None:
+        self._client.publish(self.channel, json.dumps(update))
+
+    def subscribe(self, handler: UpdateHandler) -> None:
+        def on_message(message: Dict[str, Any]) -> None:
+            try:
+                handler(json.loads(message["data"]))
+            except Exception as e:
+                logger.error(f"Error applying history update: {str(e)}")
+
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{self.channel: on_message})
+        self._thread = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._thread.stop()
+        if self._pubsub is not None:
+            self._pubsub.close()
+        self._client.close()
+
+def create_invalidation_channel() -> Optional[InvalidationChannel]:
+    """Build the channel selected by HISTORY_INVALIDATION_BACKEND (local, redis or none)."""
+    backend_name = HISTORY_INVALIDATION_BACKEND.lower()
+    if backend_name == "none":
+        return None
+    if backend_name == "redis":
+        return RedisInvalidationChannel()
+    return LocalInvalidationChannel()
+
+@dataclass
+class _Entry:
+    messages: List[Dict[str, Any]]
+    size: int
+    # Whether ``messages`` reaches back to the start of the session
+    complete: bool
+    expires_at: float
+
+class HistoryCache:
+    """Per-worker read-through cache of each session's most recent messages.
+
+    Sessions are evicted least recently used first once more than
+    ``max_sessions`` are held or their messages exceed ``max_bytes``. Writes
+    made through this worker are appended to the cached session, and are
+    published on the optional invalidation channel so other workers append
+    them too. Entries expire after ``ttl`` seconds as a bound on staleness
+    when writes come from elsewhere.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = HISTORY_CACHE_MAX_SESSIONS,
+        max_bytes: int = HISTORY_CACHE_MAX_BYTES,
+        max_messages: int = HISTORY_CACHE_MESSAGES,
+        ttl: float = HISTORY_CACHE_TTL,
+        channel: Optional[InvalidationChannel] = None
+    ):
+        """Initialize the cache.
+
+        Args:
+            max_sessions: Maximum number of sessions held
+            max_bytes: Approximate memory cap for all cached messages
+            max_messages: Most recent messages kept per session
+            ttl: Seconds before a cached session is read again from the database
+            channel: Optional channel sharing writes with other workers
+        """
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self.channel = channel
+        self.origin = uuid.uuid4().hex
+
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        # Write sequence per recently written session, to discard fills that raced a write
+        self._write_seq = 0
+        self._written: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "remote_updates": 0}
+
+        if channel is not None:
+            channel.subscribe(self._on_update)
+
+    def get(self, session_id: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        """Return the last ``limit`` cached messages of a session, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._remove(session_id)
+                entry = None
+            if entry is None or (len(entry.messages) < limit and not entry.complete):
+                self._stats["misses"] += 1
+                record_cache_lookup("history", False)
+                return None
+            self._entries.move_to_end(session_id)
+            self._stats["hits"] += 1
+            record_cache_lookup("history", True)
+            return [dict(message) for message in entry.messages[-limit:]]
+
+    def fill_token(self, session_id: str) -> int:
+        """Return a token to pass to ``put`` for a fill about to read the database."""
+        with self._lock:
+            return self._written.get(session_id, 0)
+
+    def put(self, session_id: str, messages: List[Dict[str, Any]], complete: bool, token: int) -> None:
+        """Cache messages read from the database, unless a write to the session raced the read.
+
+        Args:
+            session_id: The session
+            messages: Its most recent messages in chronological order
+            complete: Whether the messages reach back to the start of the session
+            token: Value returned by ``fill_token`` before the read
+        """
+        with self._lock:
+            if self._written.get(session_id, 0) != token:
+                return
+            self._store(session_id, list(messages), complete)
+
+    def append(self, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        """Append messages written by this worker and share them with other workers."""
+        self._apply(session_id, messages)
+        self._publish({"origin": self.origin, "session_id": session_id, "messages": messages})
+
+    def invalidate(self, session_id: str) -> None:
+        """Drop a session here and on other workers."""
+        self._apply(session_id, None)
+        self._publish({"origin": self.origin, "session_id": session_id, "messages": None})
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current size."""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "sessions": len(self._entries),
+                "bytes": self._bytes,
+                "channel": type(self.channel).__name__ if self.channel else None
+            }
+
+    def close(self) -> None:
+        """Stop receiving updates and close the channel."""
+        if isinstance(self.channel, LocalInvalidationChannel):
+            self.channel.unsubscribe(self._on_update)
+        elif self.channel is not None:
+            self.channel.close()
+
+    def _apply(self, session_id: str, messages: Optional[List[Dict[str, Any]]]) -> None:
+        """Append to a cached session, or drop it when ``messages`` is None."""
+        with self._lock:
+            self._write_seq += 1
+            self._written[session_id] = self._write_seq
+            self._written.move_to_end(session_id)
+            while len(self._written) > self.max_sessions * 4:
+                self._written.popitem(last=False)
+
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return
+            if messages is None:
+                self._remove(session_id)
+                return
+            self._store(session_id, entry.messages + [dict(message) for message in messages], entry.complete)
+
+    def _on_update(self, update: Dict[str, Any]) -> None:
+        """Apply an update published by another worker."""
+        if update.get("origin") == self.origin:
+            return
+        with self._lock:
+            self._stats["remote_updates"] += 1
+        self._apply(update["session_id"], update.get("messages"))
+
+    def _publish(self, update: Dict[str, Any]) -> None:
+        if self.channel is None:
+            return
+        try:
+            self.channel.publish(update)
+        except Exception as e:
+            logger.error(f"Error publishing history update: {str(e)}")
+
+    def _store(self, session_id: str, messages: List[Dict[str, Any]], complete: bool) -> None:
+        """Insert or replace an entry and evict down to the caps; caller holds the lock."""
+        if len(messages) > self.max_messages:
+            messages = messages[-self.max_messages:]
+            complete = False
+        size = sum(self._message_size(message) for message in messages)
+        self._remove(session_id)
+        self._entries[session_id] = _Entry(messages, size, complete, time.monotonic() + self.ttl)
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_sessions or self._bytes > self.max_bytes):
+            evicted, _ = next(iter(self._entries.items()))
+            self._remove(evicted)
+            self._stats["evictions"] += 1
+
+    def _remove(self, session_id: str) -> None:
+        """Remove an entry if present; caller holds the lock."""
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    @staticmethod
+    def _message_size(message: Dict[str, Any]) -> int:
+        """Approximate the memory held by one message."""
+        return MESSAGE_OVERHEAD_BYTES + sum(len(value) for value in message.values() if isinstance(value, str))
@@ -1,51 +1,130 @@
 from typing import Dict, Any, Optional
 import os
 from loguru import logger
-from PIL import Image
 from ..models.model_manager import ModelManager
+from .image_preprocessing import PreparedImage, compute_dhash_file
+from .image_analysis_cache import ImageAnalysisCache
+from ..utils.concurrency import run_blocking
 
 class ImageAnalysisService:
     """Service for analyzing images of plants, soil, and ecological subjects."""
     
-    def __init__(self):
-        """Initialize the image analysis service."""
+    def __init__(
+        self,
+        model_manager: Optional[ModelManager] = None,
+        analysis_cache: Optional[ImageAnalysisCache] = None
+    ):
+        """Initialize the image analysis service.
+        
+        Args:
+            model_manager: Shared model manager; a private one is created if omitted
+            analysis_cache: Optional cache of analyses keyed by perceptual hash and prompt
+        """
         try:
-            self.model_manager = ModelManager()
+            self.model_manager = model_manager or ModelManager()
+            self.analysis_cache = analysis_cache
             logger.info("ImageAnalysisService initialized successfully")
         except Exception as e:
             logger.error(f"Error initializing ImageAnalysisService: {str(e)}")
             raise
     
-    def analyze_image(self, image_path: str, query: str = None) -> Dict[str, Any]:
+    def analyze_image(
+        self,
+        image_path: str,
+        query: str = None,
+        image: Optional[PreparedImage] = None
+    ) -> Dict[str, Any]:
         """Analyze an image and return information about it.
         
         Args:
             image_path: Path to the image file
             query: Optional specific query about the image
+            image: The already prepared image, used instead of reading the file
             
         Returns:
             Dictionary with analysis results
         """
         try:
             # Validate image file
-            if not os.path.exists(image_path):
+            if image is None and not os.path.exists(image_path):
                 return {"error": "Image file not found"}
             
-            # Prepare the prompt based on the query
-            if query:
-                prompt = f"Analyze this image and answer the following question: {query}"
-            else:
-                prompt = """Analyze this image and provide the following information:
-                1. Plant identification (species name, common name)
-                2. Plant health assessment
-                3. Any visible issues or diseases
-                4. Care recommendations
-                
-                Format your response as detailed information that would be helpful for a gardener or plant enthusiast.
-                """
+            prompt = self._build_prompt(query)
+            
+            # Reuse the analysis of the same or a near-identical image
+            perceptual_hash = None
+            if self.analysis_cache is not None:
+                perceptual_hash = image.perceptual_hash if image else compute_dhash_file(image_path)
+                cached_analysis = self.analysis_cache.get(perceptual_hash, prompt)
+                if cached_analysis is not None:
+                    return {
+                        "analysis": cached_analysis,
+                        "success": True,
+                        "cached": True
+                    }
+            
+            # Generate analysis using the model manager
+            analysis = self.model_manager.generate_with_image(prompt, image_path, image=image)
+            
+            if perceptual_hash is not None and not analysis.startswith("Error analyzing image"):
+                self.analysis_cache.set(perceptual_hash, prompt, analysis)
+            
+            # Return the analysis results
+            return {
+                "analysis": analysis,
+                "success": True
+            }
+            
+        except Exception as e:
+            logger.error(f"Error analyzing image: {str(e)}")
+            return {
+                "error": f"Error analyzing image: {str(e)}",
+                "success": False
+            }
+    
+    async def analyze_image_async(
+        self,
+        image_path: str,
+        query: str = None,
+        image: Optional[PreparedImage] = None
+    ) -> Dict[str, Any]:
+        """Async counterpart of ``analyze_image``.
+        
+        Args:
+            image_path: Path to the image file
+            query: Optional specific query about the image
+            image: The already prepared image, used instead of reading the file
+            
+        Returns:
+            Dictionary with analysis results
+        """
+        try:
+            # Validate image file
+            if image is None and not os.path.exists(image_path):
+                return {"error": "Image file not found"}
+            
+            prompt = self._build_prompt(query)
+            
+            # Reuse the analysis of the same or a near-identical image
+            perceptual_hash = None
+            if self.analysis_cache is not None:
+                if image:
+                    perceptual_hash = image.perceptual_hash
+                else:
+                    perceptual_hash = await run_blocking(compute_dhash_file, image_path)
+                cached_analysis = await run_blocking(self.analysis_cache.get, perceptual_hash, prompt)
+                if cached_analysis is not None:
+                    return {
+                        "analysis": cached_analysis,
+                        "success": True,
+                        "cached": True
+                    }
             
             # Generate analysis using the model manager
-            analysis = self.model_manager.generate_with_image(prompt, image_path)
+            analysis = await self.model_manager.generate_with_image_async(prompt, image_path, image=image)
+            
+            if perceptual_hash is not None and not analysis.startswith("Error analyzing image"):
+                await run_blocking(self.analysis_cache.set, perceptual_hash, prompt, analysis)
             
             # Return the analysis results
             return {
@@ -60,6 +139,19 @@ class ImageAnalysisService:
                 "success": False
             }
     
+    def _build_prompt(self, query: Optional[str]) -> str:
+        """Build the analysis prompt based on the optional query."""
+        if query:
+            return f"Analyze this image and answer the following question: {query}"
+        return """Analyze this image and provide the following information:
+                1. Plant identification (species name, common name)
+                2. Plant health assessment
+                3. Any visible issues or diseases
+                4. Care recommendations
+                
+                Format your response as detailed information that would be helpful for a gardener or plant enthusiast.
+                """
+    
     def identify_plant(self, image_path: str) -> Dict[str, Any]:
         """Identify a plant from an image.
         
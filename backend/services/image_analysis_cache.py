@@ -0,0 +1,191 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+from loguru import logger
+from ..config import load_environment
+from ..utils.cache import SQLiteCache
+from ..utils.metrics import record_cache_lookup
+
+# Load environment variables
+load_environment()
+
+# Configure the image analysis cache
+IMAGE_ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("IMAGE_ANALYSIS_CACHE_MAX_ENTRIES", 2048))
+IMAGE_ANALYSIS_CACHE_MAX_DISTANCE = int(os.getenv("IMAGE_ANALYSIS_CACHE_MAX_DISTANCE", 6))
+IMAGE_ANALYSIS_CACHE_TTL = int(os.getenv("IMAGE_ANALYSIS_CACHE_TTL", 7 * 24 * 3600))
+IMAGE_ANALYSIS_CACHE_PATH = os.getenv("IMAGE_ANALYSIS_CACHE_PATH", "cache/image_analysis.sqlite3")
+
+# Width of the perceptual hashes (an 8x8 dHash)
+HASH_BITS = 64
+
+def hamming_distance(a: int, b: int) -> int:
+    """Return the number of differing bits between two hashes."""
+    return bin(a ^ b).count("1")
+
+def hash_bands(max_distance: int, bits: int = HASH_BITS) -> List[Tuple[int, int]]:
+    """Split a hash into ``max_distance + 1`` bands, returned as ``(shift, mask)`` pairs.
+
+    Two hashes within ``max_distance`` bits of each other differ in at most
+    that many bands, so they agree exactly on at least one.
+    """
+    count = max(1, min(max_distance + 1, bits))
+    bands = []
+    shift = 0
+    for band in range(count):
+        width = bits // count + (1 if band < bits % count else 0)
+        bands.append((shift, (1 << width) - 1))
+        shift += width
+    return bands
+
+class ImageAnalysisCache:
+    """Cache of vision-model analyses keyed by perceptual image hash and prompt.
+
+    A lookup matches any cached image for the same prompt whose perceptual hash
+    is within ``max_distance`` bits, so re-uploads, crops and recompressions of
+    a photo reuse the earlier analysis. Hashes are indexed by band (see
+    ``hash_bands``), so a lookup compares only against entries sharing a band
+    with it rather than scanning the cache. Entries are evicted least recently
+    used and persisted to SQLite so they survive restarts.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = IMAGE_ANALYSIS_CACHE_MAX_ENTRIES,
+        max_distance: int = IMAGE_ANALYSIS_CACHE_MAX_DISTANCE,
+        ttl: int = IMAGE_ANALYSIS_CACHE_TTL,
+        path: Optional[str] = IMAGE_ANALYSIS_CACHE_PATH
+    ):
+        """Initialize the cache and load recent entries from disk.
+
+        Args:
+            max_entries: Entries kept in memory before the least recently used is evicted
+            max_distance: Largest Hamming distance still treated as the same image
+            ttl: Age in seconds after which persisted entries are discarded
+            path: SQLite file for persistence, or None/empty to keep the cache in memory only
+        """
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, int], str]" = OrderedDict()
+        self._bands = hash_bands(max_distance)
+        # (prompt hash, band index, band value) -> perceptual hashes of the entries in that bucket
+        self._buckets: Dict[Tuple[str, int, int], Set[int]] = {}
+        self._lock = threading.Lock()
+        self._store: Optional[SQLiteCache] = None
+
+        if path:
+            try:
+                self._store = SQLiteCache(path, table="image_analysis")
+                self._store.purge_older_than(ttl)
+                self._load()
+            except Exception as e:
+                logger.error(f"Error opening image analysis cache: {str(e)}")
+                self._store = None
+
+    @staticmethod
+    def hash_prompt(prompt: str) -> str:
+        """Return a short stable hash of an analysis prompt."""
+        return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+    def get(self, perceptual_hash: int, prompt: str) -> Optional[str]:
+        """Return the cached analysis for the closest matching image, or None.
+
+        Args:
+            perceptual_hash: Perceptual hash of the image
+            prompt: The analysis prompt
+
+        Returns:
+            The cached analysis, or None on a miss
+        """
+        prompt_hash = self.hash_prompt(prompt)
+        with self._lock:
+            key = (prompt_hash, perceptual_hash)
+            if key not in self._entries:
+                key = self._nearest(prompt_hash, perceptual_hash)
+
+            if key is None:
+                self.misses += 1
+                record_cache_lookup("image_analysis", False)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            record_cache_lookup("image_analysis", True)
+            return self._entries[key]
+
+    def set(self, perceptual_hash: int, prompt: str, analysis: str) -> None:
+        """Cache an analysis in memory and on disk.
+
+        Args:
+            perceptual_hash: Perceptual hash of the image
+            prompt: The analysis prompt
+            analysis: The analysis text
+        """
+        prompt_hash = self.hash_prompt(prompt)
+        with self._lock:
+            self._remember((prompt_hash, perceptual_hash), analysis)
+        if self._store is not None:
+            try:
+                self._store.set(self._store_key(prompt_hash, perceptual_hash), analysis)
+            except Exception as e:
+                logger.error(f"Error persisting image analysis: {str(e)}")
+
+    def close(self) -> None:
+        """Close the persistent store."""
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    def _nearest(self, prompt_hash: str, perceptual_hash: int) -> Optional[Tuple[str, int]]:
+        """Return the key of the nearest cached image for a prompt within the threshold; caller holds the lock."""
+        best_distance = self.max_distance + 1
+        best = None
+        for band, (shift, mask) in enumerate(self._bands):
+            for candidate in self._buckets.get((prompt_hash, band, (perceptual_hash >> shift) & mask), ()):
+                distance = hamming_distance(candidate, perceptual_hash)
+                if distance < best_distance:
+                    best_distance = distance
+                    best = candidate
+        return (prompt_hash, best) if best is not None else None
+
+    def _remember(self, key: Tuple[str, int], analysis: str) -> None:
+        """Insert an entry and evict the least recently used; caller holds the lock."""
+        if key not in self._entries:
+            self._index(key, add=True)
+        self._entries[key] = analysis
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self._index(evicted, add=False)
+
+    def _index(self, key: Tuple[str, int], add: bool) -> None:
+        """Add an entry to, or remove it from, its band buckets; caller holds the lock."""
+        prompt_hash, perceptual_hash = key
+        for band, (shift, mask) in enumerate(self._bands):
+            bucket_key = (prompt_hash, band, (perceptual_hash >> shift) & mask)
+            if add:
+                self._buckets.setdefault(bucket_key, set()).add(perceptual_hash)
+            else:
+                bucket = self._buckets.get(bucket_key)
+                if bucket is not None:
+                    bucket.discard(perceptual_hash)
+                    if not bucket:
+                        del self._buckets[bucket_key]
+
+    def _load(self) -> None:
+        """Load the most recent persisted entries into memory."""
+        rows = self._store.recent(self.ttl, self.max_entries)
+        with self._lock:
+            # Oldest first so the newest end up most recently used
+            for store_key, analysis, _ in reversed(rows):
+                prompt_hash, hash_hex = store_key.split(":", 1)
+                self._remember((prompt_hash, int(hash_hex, 16)), analysis)
+        logger.info(f"Loaded {len(rows)} cached image analyses")
+
+    @staticmethod
+    def _store_key(prompt_hash: str, perceptual_hash: int) -> str:
+        """Return the persistent key for an entry."""
+        return f"{prompt_hash}:{perceptual_hash:016x}"
@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, Optional, Union
+from loguru import logger
+from ..config import load_environment
+from PIL import Image, ImageOps
+
+if TYPE_CHECKING:
+    from .image_references import ImageHandle
+
+# Load environment variables
+load_environment()
+
+# Configure image preprocessing
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", 1024))
+IMAGE_OUTPUT_FORMAT = os.getenv("IMAGE_OUTPUT_FORMAT", "JPEG").upper()
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", 85))
+IMAGE_PROCESS_POOL_SIZE = int(os.getenv("IMAGE_PROCESS_POOL_SIZE", 2))
+
+# MIME types for the supported output formats
+OUTPUT_MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+}
+
+@dataclass(frozen=True)
+class PreparedImage:
+    """A decoded, oriented and downscaled image ready to send to the model."""
+    data: bytes = field(repr=False)
+    mime_type: str
+    width: int
+    height: int
+    sha256: str
+    perceptual_hash: int
+    # Set once the image is stored for reuse; model calls then refer to it instead of sending the bytes
+    handle: Optional["ImageHandle"] = field(default=None, compare=False)
+
+    def to_part(self) -> Union[Dict[str, Any], "ImageHandle"]:
+        """Return the image as a prompt part: its handle if the provider holds a copy, otherwise inline data.
+
+        Handles without a provider file reference would only be read back from
+        disk, so the bytes already in memory are sent instead.
+        """
+        if self.handle is not None and self.handle.uri is not None:
+            return self.handle
+        return {"mime_type": self.mime_type, "data": self.data}
+
+def compute_dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """Compute a 64-bit difference hash that is stable across rescaling and recompression.
+
+    Args:
+        image: A decoded image
+        hash_size: Hash grid size; the hash has ``hash_size ** 2`` bits
+
+    Returns:
+        The hash as an integer
+    """
+    grayscale = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(grayscale.getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+def compute_dhash_file(image_path: str) -> int:
+    """Compute the difference hash of an image file, applying EXIF orientation first."""
+    with Image.open(image_path) as image:
+        image.draft("L", (256, 256))
+        return compute_dhash(ImageOps.exif_transpose(image))
+
+def preprocess_image_file(
+    image_path: str,
+    max_edge: int = IMAGE_MAX_EDGE,
+    output_format: str = IMAGE_OUTPUT_FORMAT,
+    quality: int = IMAGE_QUALITY
+) -> PreparedImage:
+    """Decode an image once, apply EXIF orientation, downscale and re-encode it.
+
+    Module-level so it can run in a worker process.
+
+    Args:
+        image_path: Path to the uploaded image
+        max_edge: Maximum length in pixels of the longer edge
+        output_format: ``JPEG`` or ``WEBP``
+        quality: Encoder quality (1-100)
+
+    Returns:
+        The prepared image
+    """
+    with Image.open(image_path) as image:
+        # Let JPEG decoding skip detail we are about to throw away
+        image.draft("RGB", (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        buffer = io.BytesIO()
+        image.save(buffer, format=output_format, quality=quality, optimize=True)
+        data = buffer.getvalue()
+
+        return PreparedImage(
+            data=data,
+            mime_type=OUTPUT_MIME_TYPES[output_format],
+            width=image.width,
+            height=image.height,
+            sha256=hashlib.sha256(data).hexdigest(),
+            perceptual_hash=compute_dhash(image)
+        )
+
+class ImagePreprocessor:
+    """Prepares uploads once per request on a process pool so CPU work stays off the event loop."""
+
+    def __init__(
+        self,
+        max_edge: int = IMAGE_MAX_EDGE,
+        output_format: str = IMAGE_OUTPUT_FORMAT,
+        quality: int = IMAGE_QUALITY,
+        pool_size: int = IMAGE_PROCESS_POOL_SIZE
+    ):
+        """Initialize the preprocessor.
+
+        Args:
+            max_edge: Maximum length in pixels of the longer edge
+            output_format: ``JPEG`` or ``WEBP``
+            quality: Encoder quality (1-100)
+            pool_size: Number of worker processes
+        """
+        if output_format not in OUTPUT_MIME_TYPES:
+            raise ValueError(f"Unsupported image output format: {output_format}")
+        self.max_edge = max_edge
+        self.output_format = output_format
+        self.quality = quality
+        self.pool_size = pool_size
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    async def prepare(self, image_path: str) -> PreparedImage:
+        """Prepare an image on the process pool.
+
+        Args:
+            image_path: Path to the uploaded image
+
+        Returns:
+            The prepared image
+        """
+        loop = asyncio.get_running_loop()
+        prepared = await loop.run_in_executor(
+            self._get_pool(),
+            preprocess_image_file,
+            image_path,
+            self.max_edge,
+            self.output_format,
+            self.quality
+        )
+        logger.info(
+            f"Prepared image {image_path}: {prepared.width}x{prepared.height} "
+            f"{prepared.mime_type}, {len(prepared.data)} bytes"
+        )
+        return prepared
+
+    def prepare_sync(self, image_path: str) -> PreparedImage:
+        """Prepare an image in the calling thread."""
+        return preprocess_image_file(image_path, self.max_edge, self.output_format, self.quality)
+
+    def close(self) -> None:
+        """Shut down the worker processes."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """Return the process pool, starting it on first use."""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.pool_size)
+            logger.info(f"Image preprocessing pool started with {self.pool_size} processes")
+        return self._pool
@@ -0,0 +1,239 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional
+from loguru import logger
+from ..config import load_environment
+from .image_preprocessing import PreparedImage
+from ..models.gemini_sdk import get_genai
+from ..utils.cache import SQLiteCache, TTLCache
+from ..utils.concurrency import run_blocking
+from ..utils.http import CircuitOpenError, get_circuit_breaker
+from ..utils.metrics import record_cache_lookup, time_external_call
+
+# Load environment variables
+load_environment()
+
+# Configure image handles (backend: local keeps a content-addressed copy on disk for other workers
+# and still sends the bytes inline, so it saves no bandwidth; gemini also uploads it to the Gemini
+# Files API, where Google keeps it for up to 48 hours, so it is opt-in; none disables handles)
+IMAGE_HANDLE_BACKEND = os.getenv("IMAGE_HANDLE_BACKEND", "local")
+IMAGE_HANDLE_DIR = os.getenv("IMAGE_HANDLE_DIR", "cache/image_handles")
+IMAGE_HANDLE_MAX_ENTRIES = int(os.getenv("IMAGE_HANDLE_MAX_ENTRIES", 1024))
+IMAGE_HANDLE_CACHE_PATH = os.getenv("IMAGE_HANDLE_CACHE_PATH", "cache/image_handles.sqlite3")
+
+# Gemini deletes uploaded files after 48 hours, so handles are dropped well before that
+IMAGE_HANDLE_TTL = int(os.getenv("IMAGE_HANDLE_TTL", 46 * 3600))
+
+# Handles this close to expiry are uploaded again rather than risk expiring mid-request
+EXPIRY_MARGIN = 600
+
+# File extensions for the stored copies
+EXTENSIONS = {
+    "image/jpeg": "jpg",
+    "image/webp": "webp",
+}
+
+@dataclass(frozen=True)
+class ImageHandle:
+    """A prepared image stored once, passed to model calls in place of its bytes.
+
+    ``uri`` is the provider's file reference; backends that cannot read it,
+    and handles without one, get the bytes of the local copy at ``path``.
+    """
+    sha256: str
+    mime_type: str
+    size: int
+    path: str
+    expires_at: float
+    uri: Optional[str] = None
+
+    def to_part(self) -> Dict[str, Any]:
+        """Return the handle as a file-reference part for Gemini."""
+        return {"file_data": {"mime_type": self.mime_type, "file_uri": self.uri}}
+
+    def inline_part(self) -> Dict[str, Any]:
+        """Read the local copy as an inline-data part."""
+        with open(self.path, "rb") as f:
+            return {"mime_type": self.mime_type, "data": f.read()}
+
+    def usable(self) -> bool:
+        """Whether the handle is far enough from expiry and its local copy still exists."""
+        return self.expires_at - EXPIRY_MARGIN > time.time() and os.path.exists(self.path)
+
+def is_image_part(part: Any) -> bool:
+    """Return whether a prompt part is an image, inline or by handle."""
+    return isinstance(part, (dict, ImageHandle))
+
+class ImageReferenceStore:
+    """Stores each prepared image once and hands out handles to it by content hash.
+
+    The first request for an image writes it to disk (and, with the opt-in
+    ``gemini`` backend, uploads it to the Files API); with ``gemini`` the
+    planner, image analysis and any later turn that sends the same photo then
+    refer to the handle instead of re-sending the bytes. With ``local`` the
+    bytes are still sent inline from memory. Concurrent requests for one image share a single upload. Handles
+    are kept in memory and in SQLite, so every worker on a host reuses them,
+    and expire before the provider deletes the file.
+    """
+
+    def __init__(
+        self,
+        backend: str = IMAGE_HANDLE_BACKEND,
+        directory: str = IMAGE_HANDLE_DIR,
+        ttl: int = IMAGE_HANDLE_TTL,
+        max_entries: int = IMAGE_HANDLE_MAX_ENTRIES,
+        path: Optional[str] = IMAGE_HANDLE_CACHE_PATH
+    ):
+        """Initialize the store.
+
+        Args:
+            backend: ``local`` or ``gemini``
+            directory: Directory holding the local copies
+            ttl: Seconds a handle is used after its upload
+            max_entries: Handles kept in memory before the least recently used is evicted
+            path: SQLite file sharing handles between workers, or None/empty to keep them in memory only
+        """
+        if backend not in ("gemini", "local"):
+            raise ValueError(f"Unsupported image handle backend: {backend}")
+        self.backend = backend
+        self.directory = directory
+        self.ttl = ttl
+        self.breaker = get_circuit_breaker("gemini_files")
+        self._handles = TTLCache(max_entries=max_entries)
+        self._uploads: Dict[str, "asyncio.Future[ImageHandle]"] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "uploads": 0, "failures": 0, "uploaded_bytes": 0, "reused_bytes": 0}
+        self._store: Optional[SQLiteCache] = None
+        os.makedirs(directory, exist_ok=True)
+
+        if path:
+            try:
+                self._store = SQLiteCache(path, table="image_handles")
+                self._store.purge_older_than(ttl)
+            except Exception as e:
+                logger.error(f"Error opening image handle cache: {str(e)}")
+                self._store = None
+
+    async def get_or_upload(self, image: PreparedImage) -> Optional[ImageHandle]:
+        """Return the handle for an image, uploading it if no usable handle exists.
+
+        Args:
+            image: The prepared image
+
+        Returns:
+            The handle, or None if the upload failed and the image should be sent inline
+        """
+        handle = self._handles.get(image.sha256)
+        if handle is None and self._store is not None:
+            handle = await run_blocking(self._load, image.sha256)
+        if handle is not None and handle.usable():
+            # Only a provider-side copy spares re-sending the bytes
+            self._count("hits", reused_bytes=handle.size if handle.uri else 0)
+            record_cache_lookup("image_handle", True)
+            return handle
+        self._count("misses")
+        record_cache_lookup("image_handle", False)
+
+        # Requests racing on the same image wait for one upload
+        upload = self._uploads.get(image.sha256)
+        if upload is None:
+            upload = asyncio.ensure_future(run_blocking(self._upload, image))
+            self._uploads[image.sha256] = upload
+            upload.add_done_callback(lambda _: self._uploads.pop(image.sha256, None))
+        try:
+            return await asyncio.shield(upload)
+        except Exception as e:
+            logger.error(f"Error uploading image {image.sha256}: {str(e)}")
+            self._count("failures")
+            return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return reuse and upload counters."""
+        with self._lock:
+            stats = dict(self._stats)
+        return {**stats, "backend": self.backend, "entries": len(self._handles)}
+
+    def close(self) -> None:
+        """Close the persistent store."""
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    def _upload(self, image: PreparedImage) -> ImageHandle:
+        """Write the local copy and, for the gemini backend, upload it; blocking."""
+        path = self._write(image)
+        expires_at = time.time() + self.ttl
+        uri = None
+        if self.backend == "gemini":
+            if not self.breaker.allow_request():
+                raise CircuitOpenError("gemini_files")
+            try:
+                with time_external_call("gemini_files"):
+                    uploaded = get_genai().upload_file(path, mime_type=image.mime_type, display_name=image.sha256)
+            except Exception:
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+            uri = uploaded.uri
+            expires_at = min(expires_at, uploaded.expiration_time.timestamp())
+
+        handle = ImageHandle(image.sha256, image.mime_type, len(image.data), path, expires_at, uri)
+        self._remember(handle)
+        if self._store is not None:
+            try:
+                self._store.set(handle.sha256, json.dumps(asdict(handle)))
+            except Exception as e:
+                logger.error(f"Error persisting image handle: {str(e)}")
+        self._count("uploads", uploaded_bytes=handle.size)
+        logger.info(f"Stored image {image.sha256} ({handle.size} bytes) as {uri or path}")
+        return handle
+
+    def _write(self, image: PreparedImage) -> str:
+        """Write the image under its content hash unless it is already there, and return the path."""
+        path = os.path.join(
+            self.directory, image.sha256[:2], f"{image.sha256}.{EXTENSIONS.get(image.mime_type, 'bin')}"
+        )
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(image.data)
+            os.replace(temp_path, path)
+        return path
+
+    def _load(self, sha256: str) -> Optional[ImageHandle]:
+        """Return a handle another worker stored, or None; blocking."""
+        try:
+            entry = self._store.get(sha256)
+        except Exception as e:
+            logger.error(f"Error reading image handle cache: {str(e)}")
+            return None
+        if entry is None:
+            return None
+        handle = ImageHandle(**json.loads(entry[0]))
+        if handle.usable():
+            self._remember(handle)
+        return handle
+
+    def _remember(self, handle: ImageHandle) -> None:
+        """Keep a handle in memory until it nears expiry."""
+        self._handles.set(handle.sha256, handle, ttl=max(handle.expires_at - EXPIRY_MARGIN - time.time(), 0))
+
+    def _count(self, key: str, **amounts: int) -> None:
+        with self._lock:
+            self._stats[key] += 1
+            for name, amount in amounts.items():
+                self._stats[name] += amount
+
+def create_image_reference_store() -> Optional[ImageReferenceStore]:
+    """Build the image handle store selected by IMAGE_HANDLE_BACKEND (gemini, local or none)."""
+    backend_name = IMAGE_HANDLE_BACKEND.lower()
+    if backend_name == "none":
+        logger.info("Image handles disabled")
+        return None
+    logger.info(f"Image handles enabled with the {backend_name} backend")
+    return ImageReferenceStore(backend_name)
@@ -0,0 +1,201 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Any, Optional
+from loguru import logger
+from ..config import load_environment
+
+# Load environment variables
+load_environment()
+
+# Configure the job queue
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "cache/jobs.sqlite3")
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 2))
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", 300))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", 24 * 3600))
+
+# Job states; ``completed`` and ``failed`` are final
+JOB_STATUSES = ("queued", "running", "completed", "failed")
+
+class JobQueue:
+    """Durable FIFO queue of chat jobs in a SQLite file.
+
+    The API process enqueues jobs and workers in any process on the same host
+    claim them. A claim is an atomic update, so each job runs on exactly one
+    worker; jobs whose worker died are requeued once they go stale. Workers
+    heartbeat the jobs they run, and only the worker holding a running job
+    can finish it, so a requeued job cannot be overwritten by its old worker.
+    """
+
+    def __init__(self, path: str = JOB_QUEUE_PATH, max_attempts: int = JOB_MAX_ATTEMPTS):
+        """Open (and create if needed) the queue database.
+
+        Args:
+            path: Path to the SQLite file
+            max_attempts: Claims allowed per job before a stale job is failed instead of requeued
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            # WAL lets the API poll job status while workers write results
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, payload TEXT NOT NULL, "
+                "result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+
+    def enqueue(self, payload: Dict[str, Any]) -> str:
+        """Add a job and return its id.
+
+        Args:
+            payload: JSON-serializable job arguments
+
+        Returns:
+            The new job id
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, payload, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, json.dumps(payload), now, now)
+            )
+        return job_id
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Claim the oldest queued job for a worker.
+
+        Args:
+            worker_id: Identifier of the claiming worker
+
+        Returns:
+            ``{"id", "payload", "attempts"}`` for the claimed job, or None if the queue is empty
+        """
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock so two processes cannot claim the same job
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, payload, attempts FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, updated_at = ? "
+                    "WHERE id = ?",
+                    (worker_id, time.time(), row[0])
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return {"id": row[0], "payload": json.loads(row[1]), "attempts": row[2] + 1}
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """Mark a running job as still alive so it is not requeued as stale.
+
+        Returns:
+            Whether the worker still holds the job
+        """
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE jobs SET updated_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time(), job_id, worker_id)
+            ).rowcount > 0
+
+    def complete(self, job_id: str, worker_id: str, result: str) -> bool:
+        """Mark a job as completed with its result; returns False if the worker no longer holds it."""
+        return self._finish(job_id, worker_id, "completed", result=result)
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        """Mark a job as failed with an error message; returns False if the worker no longer holds it."""
+        return self._finish(job_id, worker_id, "failed", error=error)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a job's status and outcome, or None if the id is unknown."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, result, error, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row[0],
+            "status": row[1],
+            "result": row[2],
+            "error": row[3],
+            "created_at": row[4],
+            "updated_at": row[5],
+        }
+
+    def requeue_stale(self, stale_after: float = JOB_STALE_AFTER) -> int:
+        """Requeue running jobs not updated for ``stale_after`` seconds, failing those out of attempts.
+
+        Returns:
+            The number of jobs requeued or failed
+        """
+        cutoff = time.time() - stale_after
+        with self._lock:
+            failed = self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Worker stopped responding', updated_at = ? "
+                "WHERE status = 'running' AND updated_at < ? AND attempts >= ?",
+                (time.time(), cutoff, self.max_attempts)
+            ).rowcount
+            requeued = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL, updated_at = ? "
+                "WHERE status = 'running' AND updated_at < ?",
+                (time.time(), cutoff)
+            ).rowcount
+        if failed or requeued:
+            logger.warning(f"Requeued {requeued} and failed {failed} stale jobs")
+        return failed + requeued
+
+    def purge_finished(self, max_age: float = JOB_RETENTION) -> int:
+        """Delete completed and failed jobs older than ``max_age`` seconds and return how many were removed."""
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('completed', 'failed') AND updated_at < ?",
+                (time.time() - max_age,)
+            ).rowcount
+
+    def get_stats(self) -> Dict[str, int]:
+        """Return the number of jobs in each state."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        stats = {status: 0 for status in JOB_STATUSES}
+        stats.update(dict(rows))
+        return stats
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def _finish(
+        self,
+        job_id: str,
+        worker_id: str,
+        status: str,
+        result: Optional[str] = None,
+        error: Optional[str] = None
+    ) -> bool:
+        """Move a job the worker is running to a final state, and return whether it did."""
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (status, result, error, time.time(), job_id, worker_id)
+            ).rowcount > 0
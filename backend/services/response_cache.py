@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import re
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+from loguru import logger
+from ..config import load_environment, get_settings
+from ..utils.cache import TTLCache
+from ..utils.metrics import record_cache_lookup
+
+# Load environment variables
+load_environment()
+
+# Configure the response cache
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 3600))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1024))
+
+# Prefixes of responses that signal a failure and must never be cached
+UNCACHEABLE_PREFIXES = (
+    "Error generating response",
+    "Error analyzing image",
+    "I'm sorry, I encountered an issue",
+)
+
+class CacheBackend(ABC):
+    """Storage interface for cached responses."""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        """Return the cached value for a key, or None."""
+
+    @abstractmethod
+    async def set(self, key: str, value: str) -> None:
+        """Store a value under a key."""
+
+    async def close(self) -> None:
+        """Release any resources held by the backend."""
+
+class InMemoryCacheBackend(CacheBackend):
+    """Per-process backend with TTL expiry and LRU eviction."""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, ttl: int = RESPONSE_CACHE_TTL):
+        self._cache = TTLCache(max_entries=max_entries, ttl=ttl)
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: str) -> None:
+        self._cache.set(key, value)
+
+class RedisCacheBackend(CacheBackend):
+    """Backend for a local Redis-compatible server shared by all workers.
+
+    Entries expire through Redis TTLs; LRU eviction is left to the server,
+    which should run with ``maxmemory-policy allkeys-lru``.
+    """
+
+    def __init__(self, url: Optional[str] = None, ttl: int = RESPONSE_CACHE_TTL, prefix: str = "greenie:response:"):
+        # Imported here so the redis client is only required when this backend is selected
+        import redis.asyncio as redis
+
+        self._client = redis.from_url(url or get_settings().redis_url, decode_responses=True)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._client.get(self.prefix + key)
+
+    async def set(self, key: str, value: str) -> None:
+        await self._client.set(self.prefix + key, value, ex=self.ttl)
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+class ResponseCache:
+    """Exact-match cache for final pipeline responses with hit/miss counters."""
+
+    def __init__(self, backend: CacheBackend):
+        """Initialize the response cache.
+
+        Args:
+            backend: Storage backend for cached responses
+        """
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize_message(message: str) -> str:
+        """Normalize a message so trivially different phrasings share a key."""
+        normalized = re.sub(r"\s+", " ", message.strip().lower())
+        return normalized.rstrip("?!. ")
+
+    def make_key(self, message: str, image_hash: Optional[str] = None) -> str:
+        """Build the cache key from the normalized message and optional image content hash."""
+        payload = json.dumps([self.normalize_message(message), image_hash or ""])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        """Look up a cached response, recording a hit or a miss."""
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            logger.error(f"Error reading response cache: {str(e)}")
+            value = None
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        record_cache_lookup("response", value is not None)
+        return value
+
+    async def set(self, key: str, response: str) -> None:
+        """Cache a response unless it is empty or an error message."""
+        if not response or response.startswith(UNCACHEABLE_PREFIXES):
+            return
+        try:
+            await self.backend.set(key, response)
+        except Exception as e:
+            logger.error(f"Error writing response cache: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters for monitoring."""
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    async def close(self) -> None:
+        """Close the underlying backend."""
+        await self.backend.close()
+
+def create_response_cache() -> Optional[ResponseCache]:
+    """Build the response cache selected by RESPONSE_CACHE_BACKEND (memory, redis or none)."""
+    backend_name = RESPONSE_CACHE_BACKEND.lower()
+    if backend_name == "none":
+        logger.info("Response cache disabled")
+        return None
+    if backend_name == "redis":
+        backend: CacheBackend = RedisCacheBackend()
+    else:
+        backend = InMemoryCacheBackend()
+    logger.info(f"Response cache enabled with {type(backend).__name__}")
+    return ResponseCache(backend)
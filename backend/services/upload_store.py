@@ -0,0 +1,153 @@
+import glob
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import IO, Optional, Tuple
+from fastapi import UploadFile
+from loguru import logger
+from ..config import load_environment
+from PIL import Image
+from ..utils.concurrency import run_blocking
+from ..utils.error_handling import AppError
+
+# Load environment variables
+load_environment()
+
+# Configure the upload store
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 15 * 1024 * 1024))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", 50_000_000))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# PIL formats accepted as uploads, mapped to the stored file extension
+ACCEPTED_FORMATS = {
+    "JPEG": "jpg",
+    "PNG": "png",
+    "WEBP": "webp",
+    "GIF": "gif",
+}
+
+@dataclass(frozen=True)
+class StoredUpload:
+    """An upload stored under its content hash."""
+    path: str
+    sha256: str
+    size: int
+
+def _sniff_image(head: bytes) -> bool:
+    """Return whether the leading bytes look like an accepted image format."""
+    return (
+        head.startswith(b"\xff\xd8\xff")
+        or head.startswith(b"\x89PNG\r\n\x1a\n")
+        or head.startswith((b"GIF87a", b"GIF89a"))
+        or (head[:4] == b"RIFF" and head[8:12] == b"WEBP")
+    )
+
+def _read_image_header(path: str) -> Tuple[str, int, int]:
+    """Parse only the image header and return ``(format, width, height)``."""
+    with Image.open(path) as image:
+        return image.format, image.width, image.height
+
+class UploadStore:
+    """Content-addressed store for uploaded images.
+
+    Uploads are copied to disk in fixed-size chunks while being hashed, so memory
+    use per upload is constant, and are stored as ``<root>/<aa>/<sha256>.<ext>``.
+    Identical uploads share one file, and concurrent uploads with the same
+    filename can no longer overwrite each other.
+    """
+
+    def __init__(self, root: str = UPLOAD_DIR, max_bytes: int = MAX_UPLOAD_BYTES):
+        """Initialize the upload store.
+
+        Args:
+            root: Directory holding stored uploads
+            max_bytes: Largest accepted upload in bytes
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(root, "tmp"), exist_ok=True)
+
+    async def save(self, upload: UploadFile) -> StoredUpload:
+        """Stream an upload to disk, validate it and store it under its content hash.
+
+        Args:
+            upload: The uploaded file
+
+        Returns:
+            The stored upload
+
+        Raises:
+            AppError: 413 if the upload is too large, 415 if it is not a supported image
+        """
+        hasher = hashlib.sha256()
+        size = 0
+        temp_file: IO[bytes] = await run_blocking(
+            tempfile.NamedTemporaryFile, dir=os.path.join(self.root, "tmp"), delete=False
+        )
+        try:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+
+                # Reject non-images on the first chunk and oversized uploads as soon as they cross the limit
+                if size == 0 and not _sniff_image(chunk[:16]):
+                    raise AppError("Uploaded file is not a supported image", status_code=415)
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise AppError(
+                        f"Uploaded image exceeds the {self.max_bytes} byte limit",
+                        status_code=413
+                    )
+
+                hasher.update(chunk)
+                await run_blocking(temp_file.write, chunk)
+            await run_blocking(temp_file.close)
+
+            if size == 0:
+                raise AppError("Uploaded image is empty", status_code=400)
+
+            # Header-only validity check; the pixels are decoded later by the preprocessor
+            try:
+                image_format, width, height = await run_blocking(_read_image_header, temp_file.name)
+            except Exception:
+                raise AppError("Uploaded file is not a valid image", status_code=415)
+            if image_format not in ACCEPTED_FORMATS:
+                raise AppError(f"Unsupported image format: {image_format}", status_code=415)
+            if width * height > MAX_IMAGE_PIXELS:
+                raise AppError("Uploaded image dimensions are too large", status_code=413)
+
+            sha256 = hasher.hexdigest()
+            path = self._path_for(sha256, ACCEPTED_FORMATS[image_format])
+            await run_blocking(self._commit, temp_file.name, path)
+            logger.info(f"Stored upload {sha256} ({size} bytes) at {path}")
+            return StoredUpload(path=path, sha256=sha256, size=size)
+        finally:
+            if not temp_file.closed:
+                await run_blocking(temp_file.close)
+            if os.path.exists(temp_file.name):
+                await run_blocking(os.remove, temp_file.name)
+
+    def find(self, sha256: str) -> Optional[StoredUpload]:
+        """Return a previously stored upload by content hash, or None if unknown."""
+        if len(sha256) != 64 or not all(c in "0123456789abcdef" for c in sha256):
+            return None
+        matches = glob.glob(os.path.join(self.root, sha256[:2], f"{sha256}.*"))
+        if not matches:
+            return None
+        return StoredUpload(path=matches[0], sha256=sha256, size=os.path.getsize(matches[0]))
+
+    def _path_for(self, sha256: str, extension: str) -> str:
+        """Return the storage path for a content hash."""
+        return os.path.join(self.root, sha256[:2], f"{sha256}.{extension}")
+
+    @staticmethod
+    def _commit(temp_path: str, path: str) -> None:
+        """Move a validated temp file into place, or drop it if the content is already stored."""
+        if os.path.exists(path):
+            os.remove(temp_path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
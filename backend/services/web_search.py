@@ -1,24 +1,61 @@
-import requests
-from typing import Dict, Any, List, Optional
+import asyncio
+import json
+import time
+from typing import Dict, Any, List, Optional, Tuple, Set
 import os
 from loguru import logger
-from dotenv import load_dotenv
+from ..config import load_environment, get_settings
+from ..utils.cache import TTLCache, SQLiteCache
+from ..utils.concurrency import run_blocking, get_blocking_pool
+from ..utils.http import get_http_client
+from ..utils.metrics import record_cache_lookup
 
 # Load environment variables
-load_dotenv()
+load_environment()
 
-# Configure Brave Search API
-BRAVE_API_KEY = os.getenv("BRAVE_API_KEY")
-BRAVE_SEARCH_URL = "https://api.search.brave.com/res/v1/web/search"
+# Configure Brave Search API; the key and URL come from the shared settings
+WEB_SEARCH_TIMEOUT = float(os.getenv("WEB_SEARCH_TIMEOUT", 10))
+WEB_SEARCH_MAX_RETRIES = int(os.getenv("WEB_SEARCH_MAX_RETRIES", 2))
+
+# Configure the search result cache: results are fresh for WEB_SEARCH_CACHE_TTL seconds,
+# then served stale for up to WEB_SEARCH_CACHE_STALE_TTL more while refreshed in the background
+WEB_SEARCH_CACHE_TTL = int(os.getenv("WEB_SEARCH_CACHE_TTL", 3600))
+WEB_SEARCH_CACHE_STALE_TTL = int(os.getenv("WEB_SEARCH_CACHE_STALE_TTL", 86400))
+WEB_SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("WEB_SEARCH_CACHE_MAX_ENTRIES", 512))
+WEB_SEARCH_CACHE_PATH = os.getenv("WEB_SEARCH_CACHE_PATH", "cache/web_search.sqlite3")
 
 class WebSearchService:
     """Service for performing web searches for ecological information."""
     
     def __init__(self):
         """Initialize the web search service."""
-        self.api_key = BRAVE_API_KEY
+        settings = get_settings()
+        self.api_key = settings.brave_api_key
+        self.search_url = settings.brave_search_url
+        self.http = get_http_client(
+            "brave_search",
+            read_timeout=WEB_SEARCH_TIMEOUT,
+            max_retries=WEB_SEARCH_MAX_RETRIES
+        )
         if not self.api_key:
             logger.warning("Brave Search API key not found. Web search functionality will be limited.")
+        
+        # Two-tier result cache: per-process LRU in front of a SQLite file shared across workers
+        self.fresh_ttl = WEB_SEARCH_CACHE_TTL
+        self.stale_ttl = WEB_SEARCH_CACHE_STALE_TTL
+        self._memory_cache = TTLCache(
+            max_entries=WEB_SEARCH_CACHE_MAX_ENTRIES,
+            ttl=self.fresh_ttl + self.stale_ttl
+        )
+        self._disk_cache: Optional[SQLiteCache] = None
+        if WEB_SEARCH_CACHE_PATH:
+            try:
+                self._disk_cache = SQLiteCache(WEB_SEARCH_CACHE_PATH, table="web_search")
+                self._disk_cache.purge_older_than(self.fresh_ttl + self.stale_ttl)
+            except Exception as e:
+                logger.error(f"Error opening web search disk cache: {str(e)}")
+        self._refreshing: Set[str] = set()
+        self._refresh_tasks: Set["asyncio.Future[None]"] = set()
     
     def search(self, query: str, count: int = 5) -> Dict[str, Any]:
         """Perform a web search for the given query.
@@ -37,46 +74,61 @@ class WebSearchService:
                     "results": []
                 }
             
-            # Add ecological context to the query if not present
-            search_query = query.strip()
-            if not any(term in search_query.lower() for term in ["plant", "ecology", "garden", "farm", "soil", "crop"]):
-                search_query = f"ecology {search_query}"
+            headers, params = self._build_request(query, count)
+            cache_key = self._cache_key(params)
             
-            # Make the API request
-            headers = {
-                "X-Subscription-Token": self.api_key,
-                "Accept": "application/json"
-            }
+            # Serve fresh results from cache; refresh stale ones in the background
+            cached = self._cache_lookup(cache_key)
+            if cached is not None:
+                result, age = cached
+                if age > self.fresh_ttl and cache_key not in self._refreshing:
+                    self._refreshing.add(cache_key)
+                    get_blocking_pool().submit(self._refresh, cache_key, headers, params)
+                return result
             
-            params = {
-                "q": search_query,
-                "count": count
+            # Make the API request
+            return self._fetch(cache_key, headers, params)
+                
+        except Exception as e:
+            logger.error(f"Error performing web search: {str(e)}")
+            return {
+                "error": f"Error performing web search: {str(e)}",
+                "results": []
             }
+    
+    async def search_async(self, query: str, count: int = 5) -> Dict[str, Any]:
+        """Async counterpart of ``search`` using a shared HTTP client.
+        
+        Args:
+            query: The search query
+            count: Number of results to return
             
-            response = requests.get(BRAVE_SEARCH_URL, headers=headers, params=params)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                # Extract relevant information from the response
-                results = []
-                for web_result in data.get("web", {}).get("results", []):
-                    results.append({
-                        "title": web_result.get("title", ""),
-                        "url": web_result.get("url", ""),
-                        "description": web_result.get("description", "")
-                    })
-                
-                return {
-                    "success": True,
-                    "results": results
-                }
-            else:
-                logger.error(f"Search API error: {response.status_code} - {response.text}")
+        Returns:
+            Dictionary with search results
+        """
+        try:
+            if not self.api_key:
                 return {
-                    "error": f"Search API error: {response.status_code}",
+                    "error": "Search API key not configured",
                     "results": []
                 }
+            
+            headers, params = self._build_request(query, count)
+            cache_key = self._cache_key(params)
+            
+            # Serve fresh results from cache; refresh stale ones in the background
+            cached = await run_blocking(self._cache_lookup, cache_key)
+            if cached is not None:
+                result, age = cached
+                if age > self.fresh_ttl and cache_key not in self._refreshing:
+                    self._refreshing.add(cache_key)
+                    task = asyncio.ensure_future(self._refresh_async(cache_key, headers, params))
+                    self._refresh_tasks.add(task)
+                    task.add_done_callback(self._refresh_tasks.discard)
+                return result
+            
+            # Make the API request
+            return await self._fetch_async(cache_key, headers, params)
                 
         except Exception as e:
             logger.error(f"Error performing web search: {str(e)}")
@@ -85,6 +137,128 @@ class WebSearchService:
                 "results": []
             }
     
+    def _fetch(self, cache_key: str, headers: Dict[str, str], params: Dict[str, Any]) -> Dict[str, Any]:
+        """Call the Brave API and cache a successful result."""
+        response = self.http.get(self.search_url, headers=headers, params=params)
+        result = self._parse_response(response)
+        if result.get("success", False):
+            self._cache_store(cache_key, result)
+        return result
+    
+    async def _fetch_async(self, cache_key: str, headers: Dict[str, str], params: Dict[str, Any]) -> Dict[str, Any]:
+        """Async counterpart of ``_fetch``."""
+        response = await self.http.get_async(self.search_url, headers=headers, params=params)
+        result = self._parse_response(response)
+        if result.get("success", False):
+            await run_blocking(self._cache_store, cache_key, result)
+        return result
+    
+    def _refresh(self, cache_key: str, headers: Dict[str, str], params: Dict[str, Any]) -> None:
+        """Revalidate a stale cache entry; runs on the blocking thread pool."""
+        try:
+            self._fetch(cache_key, headers, params)
+        except Exception as e:
+            logger.error(f"Error refreshing cached web search: {str(e)}")
+        finally:
+            self._refreshing.discard(cache_key)
+    
+    async def _refresh_async(self, cache_key: str, headers: Dict[str, str], params: Dict[str, Any]) -> None:
+        """Revalidate a stale cache entry in a background task."""
+        try:
+            await self._fetch_async(cache_key, headers, params)
+        except Exception as e:
+            logger.error(f"Error refreshing cached web search: {str(e)}")
+        finally:
+            self._refreshing.discard(cache_key)
+    
+    def _cache_key(self, params: Dict[str, Any]) -> str:
+        """Build the cache key from the final search query and result count."""
+        return json.dumps([params["q"], params["count"]])
+    
+    def _cache_lookup(self, cache_key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Return ``(result, age_seconds)`` from the memory or disk tier, or None if absent or expired."""
+        entry = self._memory_cache.get(cache_key)
+        if entry is None and self._disk_cache is not None:
+            try:
+                row = self._disk_cache.get(cache_key)
+                if row is not None:
+                    entry = (json.loads(row[0]), row[1])
+                    # Promote to the memory tier
+                    self._memory_cache.set(cache_key, entry)
+            except Exception as e:
+                logger.error(f"Error reading web search disk cache: {str(e)}")
+        
+        if entry is None:
+            record_cache_lookup("web_search", False)
+            return None
+        result, stored_at = entry
+        age = time.time() - stored_at
+        if age > self.fresh_ttl + self.stale_ttl:
+            record_cache_lookup("web_search", False)
+            return None
+        record_cache_lookup("web_search", True)
+        return result, age
+    
+    def _cache_store(self, cache_key: str, result: Dict[str, Any]) -> None:
+        """Write a result to both cache tiers."""
+        stored_at = time.time()
+        self._memory_cache.set(cache_key, (result, stored_at))
+        if self._disk_cache is not None:
+            try:
+                self._disk_cache.set(cache_key, json.dumps(result), stored_at=stored_at)
+            except Exception as e:
+                logger.error(f"Error writing web search disk cache: {str(e)}")
+    
+    async def aclose(self) -> None:
+        """Close the disk cache; the shared HTTP client is closed with the others on shutdown."""
+        if self._disk_cache is not None:
+            self._disk_cache.close()
+            self._disk_cache = None
+    
+    def _build_request(self, query: str, count: int) -> Tuple[Dict[str, str], Dict[str, Any]]:
+        """Build the headers and query parameters for a Brave search request."""
+        # Add ecological context to the query if not present
+        search_query = query.strip()
+        if not any(term in search_query.lower() for term in ["plant", "ecology", "garden", "farm", "soil", "crop"]):
+            search_query = f"ecology {search_query}"
+        
+        headers = {
+            "X-Subscription-Token": self.api_key,
+            "Accept": "application/json"
+        }
+        
+        params = {
+            "q": search_query,
+            "count": count
+        }
+        
+        return headers, params
+    
+    def _parse_response(self, response: Any) -> Dict[str, Any]:
+        """Convert a Brave search HTTP response (requests or httpx) into a result dictionary."""
+        if response.status_code == 200:
+            data = response.json()
+            
+            # Extract relevant information from the response
+            results = []
+            for web_result in data.get("web", {}).get("results", []):
+                results.append({
+                    "title": web_result.get("title", ""),
+                    "url": web_result.get("url", ""),
+                    "description": web_result.get("description", "")
+                })
+            
+            return {
+                "success": True,
+                "results": results
+            }
+        else:
+            logger.error(f"Search API error: {response.status_code} - {response.text}")
+            return {
+                "error": f"Search API error: {response.status_code}",
+                "results": []
+            }
+    
     def format_search_results(self, results: List[Dict[str, str]]) -> str:
         """Format search results into a readable string.
         
@@ -0,0 +1,399 @@
+import asyncio
+import fcntl
+import glob
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from loguru import logger
+from ..config import load_environment
+from .database import DatabaseService, is_permanent_error
+from ..utils.concurrency import run_blocking
+
+# Load environment variables
+load_environment()
+
+# Configure write-behind persistence (each process spills to its own file named after
+# WRITE_BEHIND_SPILL_PATH, e.g. cache/write_behind.<host>-<pid>-<id>.jsonl)
+WRITE_BEHIND_SPILL_PATH = os.getenv("WRITE_BEHIND_SPILL_PATH", "cache/write_behind.jsonl")
+WRITE_BEHIND_MAX_ROWS = int(os.getenv("WRITE_BEHIND_MAX_ROWS", 10000))
+WRITE_BEHIND_FLUSH_ROWS = int(os.getenv("WRITE_BEHIND_FLUSH_ROWS", 100))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", 2))
+WRITE_BEHIND_MAX_BACKOFF = float(os.getenv("WRITE_BEHIND_MAX_BACKOFF", 60))
+
+# Rows the database rejects permanently (a malformed value, a constraint violation) are
+# appended here, shared by every process, instead of being retried
+WRITE_BEHIND_DEAD_LETTER_PATH = os.getenv("WRITE_BEHIND_DEAD_LETTER_PATH", "cache/write_behind-dead-letter.jsonl")
+
+# A pending row: (spill file offset just past its line, table, row)
+PendingRow = Tuple[int, str, Dict[str, Any]]
+
+class WriteBehindBuffer:
+    """Buffers database inserts and writes them to Supabase in bulk, off the request path.
+
+    ``add`` appends the row to a local append-only spill file and to an
+    in-memory queue, then returns. A background task flushes the queue as
+    bulk inserts once ``flush_rows`` rows are waiting or every
+    ``flush_interval`` seconds, and records the spill file offset it has
+    flushed up to in a checkpoint file. At most ``max_rows`` rows are held in
+    memory; beyond that new rows wait only in the spill file and are read back
+    as the queue drains.
+
+    Only transient errors (network, 5xx, 429, an open circuit) are retried.
+    A batch the database rejects outright is split in half until the
+    offending rows are found; those go to a dead-letter file and the rest
+    are inserted, so one bad row cannot block the buffer.
+
+    Every process (each uvicorn worker and the job worker) spills to its own
+    file and holds an exclusive ``flock`` on it while it runs, so offsets and
+    compaction only ever concern its own rows. A spill file whose lock is free
+    belongs to a process that has stopped: the next buffer to start copies
+    its unflushed rows into its own file and removes it, so delivery is at
+    least once.
+    """
+
+    def __init__(
+        self,
+        database: DatabaseService,
+        spill_path: str = WRITE_BEHIND_SPILL_PATH,
+        max_rows: int = WRITE_BEHIND_MAX_ROWS,
+        flush_rows: int = WRITE_BEHIND_FLUSH_ROWS,
+        flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL,
+        dead_letter_path: str = WRITE_BEHIND_DEAD_LETTER_PATH
+    ):
+        """Open the spill file and recover rows left by a previous run.
+
+        Args:
+            database: Database service performing the bulk inserts
+            spill_path: Base path of the spill files; this process appends to its own file next to it
+            max_rows: Rows held in memory before new rows wait on disk only
+            flush_rows: Queue length that triggers an immediate flush
+            flush_interval: Seconds between flushes of a partially filled queue
+            dead_letter_path: File receiving rows the database rejects permanently
+        """
+        directory = os.path.dirname(spill_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.database = database
+        root, ext = os.path.splitext(spill_path)
+        self.spill_pattern = f"{glob.escape(root)}.*{ext}"
+        self.spill_path = f"{root}.{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}{ext}"
+        self.checkpoint_path = f"{self.spill_path}.checkpoint"
+        self.dead_letter_path = dead_letter_path
+        dead_letter_directory = os.path.dirname(dead_letter_path)
+        if dead_letter_directory:
+            os.makedirs(dead_letter_directory, exist_ok=True)
+        self.max_rows = max_rows
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+
+        self._pending: Deque[PendingRow] = deque()
+        self._overflow = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._spill = open(self.spill_path, "ab")
+        fcntl.flock(self._spill.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        claimed = self._claim_orphans(spill_path)
+        self._spill_size = self._spill.tell()
+        self._checkpoint = 0
+        self._stats = {"added": 0, "flushed": 0, "flush_errors": 0, "dead_lettered": 0, "claimed": claimed}
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._closing = False
+        self._task: Optional["asyncio.Task[None]"] = None
+
+        with self._lock:
+            self._reload()
+        if self._pending:
+            logger.info(f"Recovered {len(self._pending)} unflushed rows from stopped processes")
+
+    def start(self) -> None:
+        """Start the background flush task on the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.ensure_future(self._flush_loop())
+
+    def add(self, table: str, row: Dict[str, Any]) -> None:
+        """Buffer a row for insertion without waiting for the database.
+
+        Args:
+            table: Target table
+            row: Column values
+        """
+        line = json.dumps({"table": table, "row": row}).encode("utf-8") + b"\n"
+        with self._lock:
+            self._spill.write(line)
+            self._spill.flush()
+            self._spill_size += len(line)
+            self._stats["added"] += 1
+            if self._overflow or len(self._pending) >= self.max_rows:
+                # Keep order: once rows spill, later rows also wait on disk until the queue drains
+                self._overflow = True
+            else:
+                self._pending.append((self._spill_size, table, row))
+            should_wake = len(self._pending) >= self.flush_rows or self._overflow
+        if should_wake and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def flush(self) -> int:
+        """Flush every buffered row; raises on a transient database error.
+
+        Returns:
+            The number of rows written or dead-lettered
+        """
+        return await run_blocking(self.flush_sync)
+
+    def flush_sync(self) -> int:
+        """Blocking counterpart of ``flush``."""
+        flushed = 0
+        with self._flush_lock:
+            # Make buffered rows durable before acknowledging them as flushed; disk I/O here and
+            # below happens outside ``_lock`` so ``add`` on the event loop never waits for it
+            os.fsync(self._spill.fileno())
+            while True:
+                with self._lock:
+                    if not self._pending and self._overflow:
+                        self._reload()
+                    batch = [self._pending[i] for i in range(min(self.flush_rows, len(self._pending)))]
+                if not batch:
+                    break
+
+                # Consecutive rows for the same table go in one insert, preserving order across tables
+                for table, rows in self._runs(batch):
+                    self._deliver(table, rows)
+                flushed += len(batch)
+        if flushed:
+            logger.info(f"Flushed {flushed} buffered rows")
+        return flushed
+
+    async def close(self) -> None:
+        """Stop the flush task, flush what remains and close the spill file.
+
+        The spill file is removed once everything in it is flushed; otherwise
+        it is left for the next process to claim.
+        """
+        self._closing = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Error flushing buffered rows on shutdown; they will be replayed on restart: {str(e)}")
+        with self._lock:
+            if not self._pending and not self._overflow and self._checkpoint >= self._spill_size:
+                # Removed while still locked so no other process can claim it in between
+                os.remove(self.spill_path)
+                if os.path.exists(self.checkpoint_path):
+                    os.remove(self.checkpoint_path)
+            self._spill.close()
+
+    def pending_rows(self, table: str, column: str, value: Any) -> List[Dict[str, Any]]:
+        """Return unflushed rows held in memory for ``table`` whose ``column`` equals ``value``.
+
+        Lets readers see their own writes before they reach the database.
+        Rows overflowed to the spill file are not included.
+        """
+        with self._lock:
+            return [dict(row) for _, row_table, row in self._pending if row_table == table and row.get(column) == value]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return buffer counters and the number of rows waiting."""
+        with self._lock:
+            return {
+                **self._stats,
+                "pending_in_memory": len(self._pending),
+                "overflowed_to_disk": self._overflow,
+                "spill_bytes": self._spill_size - self._checkpoint,
+            }
+
+    async def _flush_loop(self) -> None:
+        """Flush on size or time thresholds, backing off while the database is failing."""
+        backoff = self.flush_interval
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._closing:
+                break
+            try:
+                await self.flush()
+                backoff = self.flush_interval
+            except Exception as e:
+                backoff = min(backoff * 2, WRITE_BEHIND_MAX_BACKOFF)
+                logger.error(f"Error flushing buffered rows; retrying in {backoff:.1f}s: {str(e)}")
+                # Ignore size wake-ups while backing off; only shutdown cuts the wait short
+                deadline = asyncio.get_running_loop().time() + backoff
+                while not self._closing and asyncio.get_running_loop().time() < deadline:
+                    await asyncio.sleep(min(0.5, self.flush_interval))
+
+    def _deliver(self, table: str, rows: List[PendingRow]) -> None:
+        """Insert rows at the head of the queue and mark them flushed; called by the flushing thread.
+
+        A permanently rejected insert is split in half until the rejected rows
+        are isolated and dead-lettered. Transient errors propagate, leaving
+        the rows queued for the next attempt.
+        """
+        try:
+            self.database.insert_rows(table, [row for _, _, row in rows])
+        except Exception as e:
+            if not is_permanent_error(e):
+                with self._lock:
+                    self._stats["flush_errors"] += 1
+                raise
+            if len(rows) > 1:
+                middle = len(rows) // 2
+                self._deliver(table, rows[:middle])
+                self._deliver(table, rows[middle:])
+                return
+            self._dead_letter(table, rows[0][2], e)
+            self._commit(rows, "dead_lettered")
+            return
+        self._commit(rows, "flushed")
+
+    def _commit(self, rows: List[PendingRow], counter: str) -> None:
+        """Drop delivered rows from the head of the queue and record the checkpoint past them."""
+        with self._lock:
+            for _ in rows:
+                self._pending.popleft()
+            self._checkpoint = rows[-1][0]
+            self._stats[counter] += len(rows)
+        # Only the flushing thread writes the checkpoint file
+        self._write_checkpoint(rows[-1][0])
+        self._compact()
+
+    def _dead_letter(self, table: str, row: Dict[str, Any], error: Exception) -> None:
+        """Append a row the database rejected permanently to the dead-letter file."""
+        logger.error(f"Error inserting buffered row into {table}; moved to {self.dead_letter_path}: {str(error)}")
+        entry = {"table": table, "row": row, "error": str(error), "failed_at": time.time()}
+        with open(self.dead_letter_path, "ab") as f:
+            f.write(json.dumps(entry).encode("utf-8") + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _reload(self) -> None:
+        """Refill the in-memory queue from the spill file past the checkpoint; caller holds the lock."""
+        offset = self._pending[-1][0] if self._pending else self._checkpoint
+        self._overflow = False
+        with open(self.spill_path, "rb") as f:
+            f.seek(offset)
+            while offset < self._spill_size:
+                if len(self._pending) >= self.max_rows:
+                    self._overflow = True
+                    return
+                line = f.readline()
+                if not line:
+                    break
+                offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line torn by a crash mid-write
+                    logger.warning(f"Skipping unreadable line in {self.spill_path}")
+                    continue
+                self._pending.append((offset, entry["table"], entry["row"]))
+
+    def _compact(self) -> None:
+        """Truncate the spill file once everything in it is flushed; called by the flushing thread.
+
+        The checkpoint is reset on disk before the truncate, so a crash in
+        between only replays flushed rows. The reset is written without
+        holding ``_lock``; if rows were added meanwhile the truncate is
+        skipped and the real checkpoint is written back.
+        """
+        with self._lock:
+            if self._pending or self._overflow or self._checkpoint < self._spill_size:
+                return
+            size = self._spill_size
+        self._write_checkpoint(0)
+        with self._lock:
+            if self._spill_size == size:
+                self._spill.truncate(0)
+                self._spill_size = 0
+                self._checkpoint = 0
+                return
+        self._write_checkpoint(self._checkpoint)
+
+    def _claim_orphans(self, legacy_path: str) -> int:
+        """Copy unflushed rows from the spill files of stopped processes into this one, then remove them.
+
+        Args:
+            legacy_path: The single shared spill file used before per-process files, claimed like the others
+
+        Returns:
+            The number of rows claimed
+        """
+        claimed = 0
+        for path in [legacy_path] + sorted(glob.glob(self.spill_pattern)):
+            if path == self.spill_path or path.endswith((".checkpoint", ".tmp")):
+                continue
+            try:
+                orphan = open(path, "rb")
+            except FileNotFoundError:
+                continue
+            with orphan:
+                try:
+                    fcntl.flock(orphan.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Its process is still running
+                    continue
+                try:
+                    if os.stat(path).st_ino != os.fstat(orphan.fileno()).st_ino:
+                        continue
+                except FileNotFoundError:
+                    # Another process claimed it between our open and lock
+                    continue
+                checkpoint_path = f"{path}.checkpoint"
+                orphan.seek(self._read_checkpoint(checkpoint_path))
+                data = orphan.read()
+                # Drop a line torn by a crash mid-write so it cannot merge with the next row
+                data = data[:data.rfind(b"\n") + 1]
+                if data:
+                    self._spill.write(data)
+                    self._spill.flush()
+                    os.fsync(self._spill.fileno())
+                    rows = data.count(b"\n")
+                    claimed += rows
+                    logger.info(f"Claimed {rows} unflushed rows from {path}")
+                # The rows are durable here now; remove the file while still holding its lock
+                os.remove(path)
+                if os.path.exists(checkpoint_path):
+                    os.remove(checkpoint_path)
+        return claimed
+
+    @staticmethod
+    def _read_checkpoint(checkpoint_path: str) -> int:
+        """Return the flushed offset recorded in a checkpoint file, or 0."""
+        try:
+            with open(checkpoint_path, "r") as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_checkpoint(self, checkpoint: int) -> None:
+        """Atomically record the flushed offset; called by the flushing thread only."""
+        temp_path = f"{self.checkpoint_path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(str(checkpoint))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.checkpoint_path)
+
+    @staticmethod
+    def _runs(batch: List[PendingRow]) -> List[Tuple[str, List[PendingRow]]]:
+        """Group a batch into consecutive runs of rows for the same table."""
+        runs: List[Tuple[str, List[PendingRow]]] = []
+        for pending in batch:
+            if runs and runs[-1][0] == pending[1]:
+                runs[-1][1].append(pending)
+            else:
+                runs.append((pending[1], [pending]))
+        return runs
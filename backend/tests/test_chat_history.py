@@ -0,0 +1,68 @@
+import asyncio
+from typing import Any, Dict, List, Tuple
+
+import pytest
+
+from backend.services.chat_history import ChatHistoryService
+from backend.utils.error_handling import AppError
+
+class RecordingBuffer:
+    def __init__(self):
+        self.rows: List[Tuple[str, Dict[str, Any]]] = []
+
+    def add(self, table: str, row: Dict[str, Any]) -> None:
+        self.rows.append((table, row))
+
+    def pending_rows(self, table: str, column: str, value: Any) -> List[Dict[str, Any]]:
+        return [row for row_table, row in self.rows if row_table == table and row.get(column) == value]
+
+class UnconfiguredDatabase:
+    configured = False
+
+class SessionDatabase:
+    configured = True
+
+    def __init__(self, sessions: Dict[str, str]):
+        self.sessions = sessions
+
+    def get_chat_session(self, session_id: str) -> Dict[str, Any]:
+        if session_id not in self.sessions:
+            return {"success": True, "session": None}
+        return {"success": True, "session": {"id": session_id, "user_id": self.sessions[session_id]}}
+
+    def get_chat_messages(self, session_id: str, *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        return {"success": True, "messages": [], "next_cursor": None}
+
+def test_first_turn_creates_the_session_row_before_its_messages():
+    buffer = RecordingBuffer()
+    history = ChatHistoryService(UnconfiguredDatabase(), buffer)
+    history.record_turn("s1", "How do I prune roses?", "In late winter.", "u1")
+    history.record_turn("s1", "And apples?", "Also in winter.", "u1")
+
+    tables = [table for table, _ in buffer.rows]
+    assert tables == ["chat_sessions"] + ["chat_messages"] * 4
+    session = buffer.rows[0][1]
+    assert (session["id"], session["user_id"], session["title"]) == ("s1", "u1", "How do I prune roses?")
+
+    # The assistant row sorts strictly after the user row it answers
+    user, assistant = buffer.rows[1][1], buffer.rows[2][1]
+    assert (user["role"], assistant["role"]) == ("user", "assistant")
+    assert user["timestamp"] < assistant["timestamp"]
+
+def test_messages_are_only_listed_for_the_session_owner():
+    buffer = RecordingBuffer()
+    history = ChatHistoryService(SessionDatabase({"s1": "u1"}), buffer)
+
+    asyncio.run(history.get_messages("s1", "u1"))
+    for session_id, user_id in [("s1", "u2"), ("missing", "u1")]:
+        with pytest.raises(AppError) as error:
+            asyncio.run(history.get_messages(session_id, user_id))
+        assert error.value.status_code == 404
+
+    # A session whose row is still buffered belongs to the user it was created for,
+    # and recording a turn on someone else's session does not make it yours
+    history.record_turn("s2", "Hi", "Hello", "u1")
+    history.record_turn("s1", "Hi", "Hello", "u2")
+    asyncio.run(history.get_messages("s2", "u1"))
+    with pytest.raises(AppError):
+        asyncio.run(history.get_messages("s1", "u2"))
@@ -0,0 +1,45 @@
+import asyncio
+from typing import Any, Dict, List
+
+from backend.agents.conversation import ConversationMemory
+
+class FakeHistory:
+    def __init__(self, messages: List[Dict[str, Any]]):
+        self.messages = messages
+
+    async def recent_messages(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        return self.messages[-limit:]
+
+def conversation(turns: int, words: int) -> List[Dict[str, Any]]:
+    messages = []
+    for turn in range(turns):
+        for offset, role in enumerate(("user", "assistant")):
+            messages.append({
+                "role": role,
+                "content": " ".join([f"{role}{turn}"] * words),
+                "timestamp": f"2026-10-18T06:00:{turn:02d}.00000{offset}+00:00",
+            })
+    return messages
+
+def build(memory: ConversationMemory):
+    return asyncio.run(memory.build_context("s1"))
+
+def test_recent_turns_are_kept_newest_first_within_the_budget():
+    # Each turn is about 40 tokens, so two of the four recent turns fit
+    history = FakeHistory(conversation(turns=6, words=10))
+    memory = ConversationMemory(history, None, recent_turns=4, token_budget=90, summary_batch_turns=99, path=None)
+
+    context = build(memory)
+    assert [m["content"].split()[0] for m in context.messages] == ["user4", "assistant4", "user5", "assistant5"]
+    assert context.tokens <= 90
+    assert memory.get_stats()["truncated_turns"] == 2
+
+def test_the_summary_is_spent_first_and_hides_the_turns_it_covers():
+    history = FakeHistory(conversation(turns=3, words=10))
+    memory = ConversationMemory(history, None, recent_turns=4, token_budget=30, summary_batch_turns=99, path=None)
+    asyncio.run(memory._save("s1", {"summary": "x" * 400, "through": history.messages[1]["timestamp"]}))
+
+    context = build(memory)
+    assert context.summary.endswith("…") and len(context.summary) <= 30 * 4 + 1
+    assert context.messages == []
+    assert "Summary of earlier conversation" in context.render()
@@ -0,0 +1,28 @@
+import pytest
+
+from backend.services.database import DatabaseService
+
+def test_cursor_round_trip_and_keyset_filter():
+    database = DatabaseService()
+    row = {"id": "7f1c", "timestamp": "2026-10-18T06:00:00.000001+00:00", "content": "Water weekly."}
+
+    cursor = database.encode_cursor(row, "timestamp")
+    assert database.decode_cursor(cursor) == (row["timestamp"], row["id"])
+    assert database._keyset_filter("timestamp", cursor, "lt") == (
+        'timestamp.lt."2026-10-18T06:00:00.000001+00:00",'
+        'and(timestamp.eq."2026-10-18T06:00:00.000001+00:00",id.lt."7f1c")'
+    )
+
+def test_page_returns_a_cursor_only_when_more_rows_exist():
+    database = DatabaseService()
+    rows = [{"id": str(i), "created_at": f"2026-10-1{i}"} for i in range(3, 0, -1)]
+
+    page, cursor = database._page(rows, 2, "created_at")
+    assert [row["id"] for row in page] == ["3", "2"]
+    assert database.decode_cursor(cursor) == ("2026-10-12", "2")
+    assert database._page(rows, 3, "created_at") == (rows, None)
+
+@pytest.mark.parametrize("cursor", ["not base64!", "bm90IGpzb24=", "WzFd"])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        DatabaseService.decode_cursor(cursor)
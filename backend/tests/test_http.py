@@ -0,0 +1,35 @@
+import asyncio
+import time
+import httpx
+from backend.utils.http import CircuitBreaker, HttpClient
+
+def _half_open(reset_timeout: float) -> CircuitBreaker:
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=reset_timeout)
+    breaker.record_failure()
+    time.sleep(reset_timeout * 1.5)
+    return breaker
+
+def test_abandoned_half_open_trial_expires():
+    breaker = _half_open(0.05)
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    time.sleep(0.075)
+    assert breaker.allow_request()
+
+def test_cancelled_trial_frees_the_breaker():
+    async def slow(request):
+        await asyncio.sleep(5)
+        return httpx.Response(200)
+
+    async def main():
+        client = HttpClient("test", breaker=_half_open(10 ** -2))
+        client._async_client = httpx.AsyncClient(transport=httpx.MockTransport(slow))
+        try:
+            await asyncio.wait_for(client.request_async("GET", "http://upstream/"), 0.05)
+        except asyncio.TimeoutError:
+            pass
+        assert client.breaker.state == "half_open"
+        assert client.breaker.allow_request()
+        await client.aclose()
+
+    asyncio.run(main())
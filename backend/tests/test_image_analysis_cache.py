@@ -0,0 +1,28 @@
+import random
+from backend.services.image_analysis_cache import ImageAnalysisCache, hamming_distance
+
+def test_band_index_finds_the_nearest_match_a_full_scan_would():
+    rng = random.Random(7)
+    cache = ImageAnalysisCache(max_entries=2000, max_distance=6, path=None)
+    hashes = [rng.getrandbits(64) for _ in range(2000)]
+    for perceptual_hash in hashes:
+        cache.set(perceptual_hash, "prompt", str(perceptual_hash))
+
+    for _ in range(500):
+        query = rng.choice(hashes)
+        for bit in rng.sample(range(64), rng.randint(0, 9)):
+            query ^= 1 << bit
+        nearest = min(hamming_distance(h, query) for h in hashes)
+        found = cache.get(query, "prompt")
+        if nearest <= 6:
+            assert found is not None and hamming_distance(int(found), query) == nearest
+        else:
+            assert found is None
+    assert cache.get(hashes[0], "another prompt") is None
+
+def test_evicted_entries_leave_the_index():
+    cache = ImageAnalysisCache(max_entries=2, path=None)
+    for perceptual_hash in (0x0F0F0F0F0F0F0F0F, 0xF0F0F0F0F0F0F0F0, 0x00FF00FF00FF00FF):
+        cache.set(perceptual_hash, "prompt", "analysis")
+    assert cache.get(0x0F0F0F0F0F0F0F0F, "prompt") is None
+    assert sum(len(bucket) for bucket in cache._buckets.values()) == 2 * len(cache._bands)
@@ -0,0 +1,33 @@
+import time
+
+from backend.services.job_queue import JobQueue
+
+def test_a_requeued_job_cannot_be_finished_by_its_old_worker(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), max_attempts=3)
+    job_id = queue.enqueue({"message": "How do I repot a cactus?"})
+    assert queue.claim("old")["id"] == job_id
+
+    # The old worker looks dead, so its job goes back on the queue and another worker takes it
+    assert queue.requeue_stale(stale_after=-1) == 1
+    assert queue.claim("new")["attempts"] == 2
+
+    assert not queue.heartbeat(job_id, "old")
+    assert not queue.complete(job_id, "old", "stale answer")
+    assert queue.get(job_id)["status"] == "running"
+
+    assert queue.complete(job_id, "new", "fresh answer")
+    assert not queue.fail(job_id, "new", "too late")
+    job = queue.get(job_id)
+    assert (job["status"], job["result"], job["error"]) == ("completed", "fresh answer", None)
+    queue.close()
+
+def test_heartbeats_keep_a_long_running_job_from_going_stale(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    job_id = queue.enqueue({"message": "Why are my tomato leaves yellow?"})
+    queue.claim("worker")
+    time.sleep(0.05)
+
+    assert queue.heartbeat(job_id, "worker")
+    assert queue.requeue_stale(stale_after=0.04) == 0
+    assert queue.get(job_id)["status"] == "running"
+    queue.close()
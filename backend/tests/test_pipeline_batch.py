@@ -0,0 +1,27 @@
+import asyncio
+from typing import List
+
+from backend.agents.pipeline import BatchItem, BatchResult, ChatPipeline
+
+class DyingGroupPipeline(ChatPipeline):
+    """Answers the first item of each group, then dies on groups holding a "die" message."""
+
+    def __init__(self):
+        pass
+
+    async def _run_batch_group(self, group, semaphore, results) -> None:
+        await results.put(BatchResult(group[0].index, response="ok"))
+        if any(item.message == "die" for item in group):
+            raise asyncio.CancelledError()
+
+async def collect(pipeline: ChatPipeline, items: List[BatchItem]) -> List[BatchResult]:
+    return [result async for result in pipeline.run_batch(items, concurrency=2, group_size=2)]
+
+def test_items_owed_by_a_dead_group_get_error_rows():
+    items = [BatchItem(0, "a"), BatchItem(1, "die"), BatchItem(2, "b")]
+    results = asyncio.run(asyncio.wait_for(collect(DyingGroupPipeline(), items), timeout=5))
+
+    by_index = {result.index: result for result in results}
+    assert sorted(by_index) == [0, 1, 2]
+    assert by_index[0].response == "ok" and by_index[2].response == "ok"
+    assert by_index[1].response is None and by_index[1].error
@@ -0,0 +1,39 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator
+from backend.models.providers import ModelBackend, ModelResult, ProviderPool
+from backend.models.scheduler import ModelScheduler
+from backend.utils.http import CircuitBreaker
+
+class SlowBackend(ModelBackend):
+    def generate(self, contents: Any) -> ModelResult:
+        time.sleep(5)
+        return ModelResult("slow")
+
+    async def generate_async(self, contents: Any) -> ModelResult:
+        await asyncio.sleep(5)
+        return ModelResult("slow")
+
+    async def stream_async(self, contents: Any) -> AsyncIterator[ModelResult]:
+        await asyncio.sleep(5)
+        yield ModelResult("slow")
+
+def test_cancelled_attempt_frees_half_open_trial():
+    backend = SlowBackend("slow", "slow-model")
+    backend.breaker = CircuitBreaker("model:slow", failure_threshold=1, reset_timeout=0.01)
+    backend.breaker.record_failure()
+    time.sleep(0.02)
+    pool = ProviderPool([backend], ModelScheduler())
+
+    async def main():
+        # The pool takes the half-open trial before each attempt, as when routing a call
+        assert backend.breaker.allow_request()
+        attempt = asyncio.ensure_future(pool._attempt_async(backend, "hello", 10))
+        await asyncio.sleep(0.05)
+        attempt.cancel()
+        await asyncio.gather(attempt, return_exceptions=True)
+
+    asyncio.run(main())
+    assert backend.breaker.state == "half_open"
+    assert backend.get_stats()["failures"] == 0
+    assert backend.breaker.allow_request()
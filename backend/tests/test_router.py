@@ -0,0 +1,32 @@
+import json
+
+from backend.agents.router import QueryRouter, extract_features
+
+def write_model(tmp_path, model):
+    path = tmp_path / "router_model.json"
+    path.write_text(json.dumps(model))
+    return str(path)
+
+def test_rules_take_precedence_over_the_model(tmp_path):
+    # A model that would send everything direct
+    router = QueryRouter(write_model(tmp_path, {"bias": 10.0}), threshold=0.6)
+
+    assert router.route("What is wrong with this leaf?", "/tmp/leaf.jpg").reason == "image attached"
+    assert router.route("Find information on native bees").reason == "web search needed"
+    assert router.route(" ".join(["word"] * 31)).reason == "long query"
+    assert router.route("Thanks!").reason == "small talk"
+    assert router.route("How often should I water basil?").is_direct
+    assert router.get_stats() == {"direct": 2, "full": 3}
+
+def test_model_score_decides_the_rest(tmp_path):
+    model = {"bias": 0.0, "features": {"extra_questions": -3.0}, "tokens": {"water": 2.0}}
+    router = QueryRouter(write_model(tmp_path, model), threshold=0.6)
+
+    assert router.route("When should I water ferns").is_direct
+    decision = router.route("When should I water ferns? And repot them? And feed them?")
+    assert (decision.route, decision.reason) == ("full", "model")
+    assert extract_features("Hi. Is it ok? And now?")["extra_questions"] == 1.0
+
+def test_without_a_model_or_when_disabled_everything_takes_the_full_pipeline(tmp_path):
+    assert QueryRouter(str(tmp_path / "missing.json")).route("How tall do sunflowers grow?").reason == "no router model"
+    assert QueryRouter(None, enabled=False).route("Hello").reason == "router disabled"
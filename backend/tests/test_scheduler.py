@@ -0,0 +1,67 @@
+import asyncio
+
+from prometheus_client import REGISTRY
+
+from backend.models.scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, ModelScheduler, model_priority
+
+def gauge(name: str, **labels: str) -> float:
+    return REGISTRY.get_sample_value(name, labels)
+
+def test_interactive_calls_jump_the_queue_and_gauges_follow():
+    async def scenario():
+        scheduler = ModelScheduler(
+            requests_per_second=1000, request_burst=1000, min_concurrency=1, max_concurrency=4, initial_concurrency=1
+        )
+        admitted = []
+
+        async def call(name: str, priority: int) -> None:
+            with model_priority(priority):
+                await scheduler.acquire(10)
+            admitted.append(name)
+
+        await scheduler.acquire(10)
+        batch = asyncio.ensure_future(call("batch", PRIORITY_BATCH))
+        await asyncio.sleep(0)
+        interactive = asyncio.ensure_future(call("interactive", PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0)
+
+        assert scheduler.get_stats()["queued"] == {"interactive": 1, "batch": 1, "background": 0}
+        assert gauge("greenie_model_queue_depth", priority="batch") == 1
+        assert gauge("greenie_model_calls_in_flight") == 1
+        assert gauge("greenie_model_concurrency_limit") == 1
+
+        # A slow call keeps the limit at its floor; the freed slot goes to the interactive call
+        scheduler.release(60, True)
+        await interactive
+        assert admitted == ["interactive"]
+        assert gauge("greenie_model_queue_depth", priority="interactive") == 0
+
+        # A fast call raises the limit
+        scheduler.release(0.1, True)
+        await batch
+        assert admitted == ["interactive", "batch"]
+        assert scheduler.limit == 2
+        assert gauge("greenie_model_concurrency_limit") == 2
+        assert gauge("greenie_model_calls_in_flight") == 1
+
+        # A 429 halves the limit
+        limit = scheduler.limit
+        scheduler.release(0.1, False, rate_limited=True)
+        assert scheduler.limit == max(1, limit / 2)
+        assert gauge("greenie_model_concurrency_limit") == int(scheduler.limit)
+
+    asyncio.run(scenario())
+
+def test_cancelled_waiters_leave_the_queue_depth():
+    async def scenario():
+        scheduler = ModelScheduler(min_concurrency=1, max_concurrency=1, initial_concurrency=1)
+        await scheduler.acquire(10)
+        waiting = asyncio.ensure_future(scheduler.acquire(10))
+        await asyncio.sleep(0)
+        assert scheduler.get_stats()["queued"]["interactive"] == 1
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert scheduler.get_stats()["queued"]["interactive"] == 0
+        assert gauge("greenie_model_queue_depth", priority="interactive") == 0
+
+    asyncio.run(scenario())
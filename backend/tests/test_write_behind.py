@@ -0,0 +1,148 @@
+import asyncio
+import fcntl
+import json
+import multiprocessing
+import os
+import threading
+import time
+from typing import Any, Dict, List
+import pytest
+from backend.services.write_behind import WriteBehindBuffer
+
+# Forked children inherit the imported module, matching uvicorn workers sharing one host
+mp = multiprocessing.get_context("fork")
+
+class SinkDatabase:
+    """Stands in for Supabase: appends inserted rows to a file shared by every process."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def insert_rows(self, table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        with open(self.path, "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+        return rows
+
+def _delivered(sink: str) -> List[str]:
+    with open(sink) as f:
+        return [json.loads(line)["id"] for line in f]
+
+def _spill_rows(spill_path, sink, prefix, count, flush_after, started, release):
+    """Add rows, flush the first ``flush_after`` of them, then stop without flushing the rest."""
+    buffer = WriteBehindBuffer(SinkDatabase(sink), spill_path=spill_path, flush_rows=1000)
+    for i in range(count):
+        buffer.add("chat_messages", {"id": f"{prefix}{i}"})
+        if i + 1 == flush_after:
+            buffer.flush_sync()
+    started.set()
+    release.wait(10)
+    # Exit without closing the buffer, as a killed worker would
+    os._exit(0)
+
+def test_two_processes_lose_and_duplicate_no_rows(tmp_path):
+    spill_path = str(tmp_path / "write_behind.jsonl")
+    sink = str(tmp_path / "sink.jsonl")
+    release = mp.Event()
+
+    # b buffers rows it never flushes; a then flushes (and compacts) its own rows and buffers more
+    b_started = mp.Event()
+    b = mp.Process(target=_spill_rows, args=(spill_path, sink, "b", 10, 0, b_started, release))
+    b.start()
+    assert b_started.wait(10)
+    a_started = mp.Event()
+    a = mp.Process(target=_spill_rows, args=(spill_path, sink, "a", 15, 10, a_started, release))
+    a.start()
+    assert a_started.wait(10)
+
+    # Files of running processes are left alone
+    live = WriteBehindBuffer(SinkDatabase(sink), spill_path=spill_path)
+    assert live.get_stats()["claimed"] == 0
+    asyncio.run(live.close())
+
+    release.set()
+    for process in (a, b):
+        process.join(10)
+        assert process.exitcode == 0
+    assert sorted(_delivered(sink)) == sorted(f"a{i}" for i in range(10))
+
+    # The next process to start claims both stopped processes' unflushed rows
+    recovered = WriteBehindBuffer(SinkDatabase(sink), spill_path=spill_path)
+    assert recovered.get_stats()["claimed"] == 15
+    asyncio.run(recovered.close())
+
+    delivered = _delivered(sink)
+    assert len(delivered) == len(set(delivered))
+    assert set(delivered) == {f"a{i}" for i in range(15)} | {f"b{i}" for i in range(10)}
+    assert sorted(os.listdir(tmp_path)) == ["sink.jsonl"]
+
+    # A later start has nothing left to replay
+    restarted = WriteBehindBuffer(SinkDatabase(sink), spill_path=spill_path)
+    assert restarted.get_stats()["claimed"] == 0
+    asyncio.run(restarted.close())
+    assert len(_delivered(sink)) == 25
+
+def test_add_does_not_wait_for_flush_fsync(tmp_path, monkeypatch):
+    buffer = WriteBehindBuffer(SinkDatabase(str(tmp_path / "sink.jsonl")), spill_path=str(tmp_path / "wb.jsonl"))
+    buffer.add("chat_messages", {"id": "first"})
+    in_fsync, release = threading.Event(), threading.Event()
+    real_fsync = os.fsync
+
+    def slow_fsync(fd):
+        in_fsync.set()
+        release.wait(5)
+        real_fsync(fd)
+
+    monkeypatch.setattr("backend.services.write_behind.os.fsync", slow_fsync)
+    flusher = threading.Thread(target=buffer.flush_sync)
+    flusher.start()
+    assert in_fsync.wait(5)
+    started = time.monotonic()
+    buffer.add("chat_messages", {"id": "second"})
+    assert time.monotonic() - started < 1
+    release.set()
+    flusher.join(5)
+    monkeypatch.undo()
+    asyncio.run(buffer.close())
+    assert sorted(_delivered(str(tmp_path / "sink.jsonl"))) == ["first", "second"]
+
+class RejectingDatabase(SinkDatabase):
+    """Rejects rows marked bad the way PostgREST reports a malformed uuid, and can fail transiently."""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.outages = 0
+        self.calls = 0
+
+    def insert_rows(self, table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        self.calls += 1
+        if self.outages:
+            self.outages -= 1
+            raise ConnectionError("connection reset")
+        if any(row.get("bad") for row in rows):
+            error = Exception("invalid input syntax for type uuid")
+            error.code = "22P02"
+            raise error
+        return super().insert_rows(table, rows)
+
+def test_rejected_rows_are_dead_lettered_and_transient_errors_retried(tmp_path):
+    sink = str(tmp_path / "sink.jsonl")
+    dead_letter = str(tmp_path / "dead.jsonl")
+    database = RejectingDatabase(sink)
+    buffer = WriteBehindBuffer(database, spill_path=str(tmp_path / "wb.jsonl"), dead_letter_path=dead_letter)
+    for i in range(8):
+        buffer.add("chat_messages", {"id": f"m{i}", "bad": i == 5})
+
+    database.outages = 1
+    with pytest.raises(ConnectionError):
+        buffer.flush_sync()
+    assert buffer.get_stats()["pending_in_memory"] == 8
+
+    assert buffer.flush_sync() == 8
+    assert _delivered(sink) == [f"m{i}" for i in range(8) if i != 5]
+    with open(dead_letter) as f:
+        assert [json.loads(line)["row"]["id"] for line in f] == ["m5"]
+    stats = buffer.get_stats()
+    assert (stats["flushed"], stats["dead_lettered"], stats["flush_errors"]) == (7, 1, 1)
+    asyncio.run(buffer.close())
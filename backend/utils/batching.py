@@ -0,0 +1,30 @@
+import json
+import re
+from typing import Any, Iterator, List, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+CODE_FENCE_PATTERN = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+def chunked(items: Sequence[T], size: int) -> Iterator[Sequence[T]]:
+    """Yield consecutive slices of at most ``size`` items."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def parse_json_array(text: str, expected_length: int) -> Optional[List[str]]:
+    """Parse a packed model response into one string per prompt.
+
+    Args:
+        text: The model output, optionally wrapped in a Markdown code fence
+        expected_length: Number of prompts that were packed into the call
+
+    Returns:
+        The strings in prompt order, or None if the output is not a JSON array of that length
+    """
+    try:
+        parsed: Any = json.loads(CODE_FENCE_PATTERN.sub("", text.strip()))
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(parsed, list) or len(parsed) != expected_length:
+        return None
+    return [item if isinstance(item, str) else json.dumps(item) for item in parsed]
@@ -0,0 +1,135 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional, Tuple
+
+class TTLCache:
+    """Thread-safe in-memory cache with per-entry expiry and LRU eviction."""
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None):
+        """Initialize the cache.
+
+        Args:
+            max_entries: Maximum number of entries kept before the least recently used is evicted
+            ttl: Default time-to-live in seconds, or None for entries that never expire
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for a key, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a value, evicting the least recently used entry if the cache is full.
+
+        Args:
+            key: The cache key
+            value: The value to store
+            ttl: Time-to-live in seconds for this entry; defaults to the cache's ttl
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        """Remove a key if present."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+class SQLiteCache:
+    """Persistent key/value cache in a SQLite file, shared by every worker on a host.
+
+    Each value is stored with the wall-clock time it was written so callers
+    can apply their own freshness rules.
+    """
+
+    def __init__(self, path: str, table: str = "cache"):
+        """Open (and create if needed) the cache database.
+
+        Args:
+            path: Path to the SQLite file
+            table: Table name, letting several caches share one file
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        with self._lock:
+            # WAL lets several worker processes read while one writes
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """Return ``(value, stored_at)`` for a key, or None if it is missing."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, stored_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set(self, key: str, value: str, stored_at: Optional[float] = None) -> None:
+        """Store a value, replacing any previous entry for the key."""
+        stored_at = time.time() if stored_at is None else stored_at
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, value, stored_at)
+            )
+            self._conn.commit()
+
+    def recent(self, max_age: float, limit: int) -> List[Tuple[str, str, float]]:
+        """Return up to ``limit`` of the newest ``(key, value, stored_at)`` rows younger than ``max_age`` seconds."""
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT key, value, stored_at FROM {self.table} WHERE stored_at >= ? "
+                "ORDER BY stored_at DESC LIMIT ?",
+                (time.time() - max_age, limit)
+            ).fetchall()
+
+    def purge_older_than(self, max_age: float) -> int:
+        """Delete entries older than ``max_age`` seconds and return how many were removed."""
+        with self._lock:
+            cursor = self._conn.execute(
+                f"DELETE FROM {self.table} WHERE stored_at < ?", (time.time() - max_age,)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,46 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+from loguru import logger
+
+# Upper bound on threads used for work that cannot be made async
+BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", 16))
+
+_blocking_pool: Optional[ThreadPoolExecutor] = None
+
+def get_blocking_pool() -> ThreadPoolExecutor:
+    """Return the shared thread pool for blocking calls, creating it on first use."""
+    global _blocking_pool
+    if _blocking_pool is None:
+        _blocking_pool = ThreadPoolExecutor(
+            max_workers=BLOCKING_POOL_SIZE,
+            thread_name_prefix="greenie-blocking"
+        )
+        logger.info(f"Blocking thread pool started with {BLOCKING_POOL_SIZE} workers")
+    return _blocking_pool
+
+async def run_blocking(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run a synchronous callable on the bounded thread pool.
+
+    Args:
+        func: The blocking callable
+        *args: Positional arguments for the callable
+        **kwargs: Keyword arguments for the callable
+
+    Returns:
+        The callable's return value
+    """
+    loop = asyncio.get_running_loop()
+    # Carry context variables, such as the model call priority, into the worker thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_blocking_pool(), functools.partial(context.run, func, *args, **kwargs))
+
+def shutdown_blocking_pool() -> None:
+    """Shut down the shared thread pool, waiting for queued work to finish."""
+    global _blocking_pool
+    if _blocking_pool is not None:
+        _blocking_pool.shutdown(wait=True)
+        _blocking_pool = None
@@ -0,0 +1,343 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from loguru import logger
+from ..config import load_environment
+from .metrics import time_external_call
+
+# Load environment variables
+load_environment()
+
+# Configure outbound HTTP defaults
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 3.05))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 10))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 2))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", 0.25))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", 4))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 20))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", 30))
+
+# Status codes worth retrying; anything else is returned to the caller as-is
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit breaker is open."""
+    def __init__(self, name: str):
+        self.name = name
+        super().__init__(f"Circuit breaker for {name} is open")
+
+class CircuitBreaker:
+    """Fails fast while a dependency is degraded.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and calls
+    are rejected for ``reset_timeout`` seconds. A single trial call is then let
+    through; success closes the circuit, failure opens it again. A trial that
+    is cancelled should be given back with ``release``; one that never reports
+    an outcome is abandoned after ``reset_timeout`` and another is let through.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_TIMEOUT
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.state = "closed"
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._trial_started_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """Return whether a call may be made now."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "open":
+                if now - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = "half_open"
+            if self.state == "half_open":
+                # Let one trial call through at a time
+                if self._trial_in_flight and now - self._trial_started_at < self.reset_timeout:
+                    return False
+                self._trial_in_flight = True
+                self._trial_started_at = now
+            return True
+
+    def release(self) -> None:
+        """Give up a call without an outcome, such as one that was cancelled.
+
+        A half-open trial is freed for the next call without counting a failure.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        """Record a successful call and close the circuit."""
+        with self._lock:
+            if self.state != "closed":
+                logger.info(f"Circuit breaker for {self.name} closed")
+            self.failures = 0
+            self.state = "closed"
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        """Record a failed call, opening the circuit once the threshold is reached."""
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(f"Circuit breaker for {self.name} opened after {self.failures} failures")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def call(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Invoke a synchronous callable under the breaker.
+
+        Raises:
+            CircuitOpenError: If the circuit is open
+        """
+        if not self.allow_request():
+            raise CircuitOpenError(self.name)
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.record_success()
+        return result
+
+class HttpClient:
+    """Pooled sync and async HTTP client for one outbound dependency.
+
+    Connections are kept alive and reused, every request has connect and read
+    timeouts, transient failures are retried with jittered exponential backoff,
+    and a circuit breaker rejects calls while the dependency keeps failing.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+        read_timeout: float = HTTP_READ_TIMEOUT,
+        max_retries: int = HTTP_MAX_RETRIES,
+        pool_size: int = HTTP_POOL_SIZE,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        """Initialize the client.
+
+        Args:
+            name: Dependency name used in logs and for the circuit breaker
+            connect_timeout: Seconds to wait for a connection
+            read_timeout: Seconds to wait for response data
+            max_retries: Retries after the first attempt for transient failures
+            pool_size: Keep-alive connections held per host
+            breaker: Circuit breaker; a shared one for ``name`` is used if omitted
+        """
+        self.name = name
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self.breaker = breaker or get_circuit_breaker(name)
+
+        # Sync session with a keep-alive connection pool
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._async_client: Optional[httpx.AsyncClient] = None
+
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """Send a request with retries, returning the final response.
+
+        Raises:
+            CircuitOpenError: If the dependency's circuit is open
+            requests.RequestException: If every attempt failed at the transport level
+        """
+        kwargs.setdefault("timeout", (self.connect_timeout, self.read_timeout))
+        attempt = 0
+        while True:
+            if not self.breaker.allow_request():
+                raise CircuitOpenError(self.name)
+            try:
+                with time_external_call(self.name) as call:
+                    response = self.session.request(method, url, **kwargs)
+                    if response.status_code >= 400:
+                        call["outcome"] = "error"
+            except requests.RequestException as e:
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning(f"{self.name} request failed ({str(e)}); retrying")
+            except Exception:
+                self.breaker.record_failure()
+                raise
+            except BaseException:
+                self.breaker.release()
+                raise
+            else:
+                if response.status_code not in RETRYABLE_STATUSES:
+                    self.breaker.record_success()
+                    return response
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    return response
+                logger.warning(f"{self.name} returned {response.status_code}; retrying")
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def request_async(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """Async counterpart of ``request``.
+
+        Raises:
+            CircuitOpenError: If the dependency's circuit is open
+            httpx.HTTPError: If every attempt failed at the transport level
+        """
+        client = self._get_async_client()
+        attempt = 0
+        while True:
+            if not self.breaker.allow_request():
+                raise CircuitOpenError(self.name)
+            try:
+                with time_external_call(self.name) as call:
+                    response = await client.request(method, url, **kwargs)
+                    if response.status_code >= 400:
+                        call["outcome"] = "error"
+            except httpx.TransportError as e:
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning(f"{self.name} request failed ({str(e)}); retrying")
+            except Exception:
+                self.breaker.record_failure()
+                raise
+            except BaseException:
+                # Cancelled, e.g. by the caller's timeout: free a half-open trial for the next call
+                self.breaker.release()
+                raise
+            else:
+                if response.status_code not in RETRYABLE_STATUSES:
+                    self.breaker.record_success()
+                    return response
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    return response
+                logger.warning(f"{self.name} returned {response.status_code}; retrying")
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    @asynccontextmanager
+    async def stream_async(self, method: str, url: str, **kwargs: Any) -> AsyncIterator[httpx.Response]:
+        """Send a request and stream its response body.
+
+        Streamed requests are not retried, since the caller may already have
+        consumed part of the body.
+
+        Raises:
+            CircuitOpenError: If the dependency's circuit is open
+            httpx.HTTPError: If the request failed at the transport level
+        """
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(self.name)
+        client = self._get_async_client()
+        try:
+            with time_external_call(self.name) as call:
+                async with client.stream(method, url, **kwargs) as response:
+                    if response.status_code >= 400:
+                        call["outcome"] = "error"
+                    if response.status_code in RETRYABLE_STATUSES:
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.record_success()
+                    yield response
+        except httpx.TransportError:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        """Send a GET request."""
+        return self.request("GET", url, **kwargs)
+
+    async def get_async(self, url: str, **kwargs: Any) -> httpx.Response:
+        """Send an async GET request."""
+        return await self.request_async("GET", url, **kwargs)
+
+    def close(self) -> None:
+        """Close the sync session."""
+        self.session.close()
+
+    async def aclose(self) -> None:
+        """Close both the sync session and the async client."""
+        self.close()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """Return the async client, creating it on first use."""
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size
+                )
+            )
+        return self._async_client
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        """Full-jitter exponential backoff delay for a retry attempt."""
+        return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_clients: Dict[str, HttpClient] = {}
+_registry_lock = threading.RLock()
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Return the process-wide circuit breaker for a dependency."""
+    with _registry_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+def get_http_client(name: str, **kwargs: Any) -> HttpClient:
+    """Return the process-wide HTTP client for a dependency, creating it on first use.
+
+    Args:
+        name: Dependency name, e.g. ``"brave_search"``
+        **kwargs: ``HttpClient`` options applied when the client is first created
+    """
+    with _registry_lock:
+        if name not in _clients:
+            _clients[name] = HttpClient(name, **kwargs)
+        return _clients[name]
+
+async def close_http_clients() -> None:
+    """Close every shared HTTP client; called on application shutdown."""
+    with _registry_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        await client.aclose()
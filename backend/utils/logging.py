@@ -1,51 +1,140 @@
-import logging
+import json
 import sys
+from typing import Any, Dict
 from loguru import logger
 import os
+from ..config import load_environment
+from .metrics import count_logged_error
+from .request_context import current_request
+
+# Load environment variables
+load_environment()
+
+# Configure logging: LOG_FORMAT is "text" or "json"; payloads such as messages,
+# plans and responses are truncated to LOG_PAYLOAD_MAX_CHARS and only logged
+# for a LOG_PAYLOAD_SAMPLE_RATE fraction of requests
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_DIR = os.getenv("LOG_DIR", "logs")
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", 500))
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", 0.01))
+
+TEXT_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | "
+    "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> | {extra[request_id]} - <level>{message}</level>"
+)
+FILE_FORMAT = "{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} | {extra[request_id]} - {message}"
+
+_configured = False
+
+def _add_request_id(record: Dict[str, Any]) -> None:
+    """Patcher attaching the active request id to every record."""
+    context = current_request()
+    record["extra"].setdefault("request_id", context.request_id if context else "-")
+
+def _add_json(record: Dict[str, Any]) -> None:
+    """Patcher rendering a record as one compact JSON line for the JSON sinks."""
+    _add_request_id(record)
+    entry = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "logger": record["name"],
+        "function": record["function"],
+        "line": record["line"],
+        "message": record["message"],
+        **{key: value for key, value in record["extra"].items() if key != "json"},
+    }
+    if record["exception"] is not None:
+        entry["exception"] = repr(record["exception"].value)
+    record["extra"]["json"] = json.dumps(entry, default=str)
+
+def _json_format(record: Dict[str, Any]) -> str:
+    """Format for JSON sinks; a callable so loguru appends no exception text after the line."""
+    return "{extra[json]}\n"
 
 # Configure Loguru logger
-def setup_logging():
-    """Configure logging for the application."""
+def setup_logging(log_name: str = "app"):
+    """Configure logging for the process; later calls are ignored.
+
+    Every sink writes through a queue drained by a background thread, so
+    logging never waits on disk on the request path. Backtraces and variable
+    values are captured only for the error log.
+
+    Args:
+        log_name: Base name of the log file under ``LOG_DIR``
+    """
+    global _configured
+    if _configured:
+        return logger
+    _configured = True
+
     # Create logs directory if it doesn't exist
-    os.makedirs("logs", exist_ok=True)
-    
+    os.makedirs(LOG_DIR, exist_ok=True)
+    json_logs = LOG_FORMAT.lower() == "json"
+    logger.configure(patcher=_add_json if json_logs else _add_request_id)
+
     # Remove default handler
     logger.remove()
-    
-    # Add console handler with INFO level
+
+    # Add console handler
     logger.add(
         sys.stderr,
-        format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-        level="INFO"
+        format=_json_format if json_logs else TEXT_FORMAT,
+        level=LOG_LEVEL,
+        enqueue=True,
+        backtrace=False,
+        diagnose=False,
     )
-    
-    # Add file handler with DEBUG level
+
+    # Add file handler
     logger.add(
-        "logs/app.log",
+        os.path.join(LOG_DIR, f"{log_name}.log"),
         rotation="500 MB",
         retention="10 days",
         compression="zip",
-        format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
-        level="DEBUG",
-        backtrace=True,
-        diagnose=True,
+        format=_json_format if json_logs else FILE_FORMAT,
+        level=LOG_LEVEL,
+        enqueue=True,
+        backtrace=False,
+        diagnose=False,
     )
-    
-    # Add file handler for errors only
+
+    # Add file handler for errors only, with full diagnostics
     logger.add(
-        "logs/error.log",
+        os.path.join(LOG_DIR, "error.log"),
         rotation="100 MB",
         retention="30 days",
         compression="zip",
-        format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
+        format=FILE_FORMAT,
         level="ERROR",
+        enqueue=True,
         backtrace=True,
         diagnose=True,
     )
-    
+
+    # Count errors for /metrics
+    logger.add(count_logged_error, level="ERROR", format="{message}")
+
     return logger
 
+def truncate_payload(payload: Any, max_chars: int = LOG_PAYLOAD_MAX_CHARS) -> str:
+    """Render a payload as text cut to ``max_chars``, noting how much was dropped."""
+    text = payload if isinstance(payload, str) else str(payload)
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}… [{len(text) - max_chars} more chars]"
+
+def log_payload(label: str, payload: Any) -> None:
+    """Log a large payload, truncated, for sampled requests only.
+
+    Requests outside the sample pay only for a context variable lookup.
+    """
+    context = current_request()
+    if context is None or not context.sample_payloads:
+        return
+    logger.opt(depth=1).info("{}: {}", label, truncate_payload(payload))
+
 # Function to get logger for a specific module
 def get_logger(name):
     """Get a logger for a specific module."""
-    return logger.bind(name=name)
\ No newline at end of file
+    return logger.bind(name=name)
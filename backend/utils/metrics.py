@@ -0,0 +1,203 @@
+import functools
+import inspect
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Tuple
+from ..config import load_environment
+
+# Load environment variables; prometheus_client picks single- or multi-process
+# mode from PROMETHEUS_MULTIPROC_DIR when it is imported, so this comes first
+load_environment()
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    REGISTRY
+)
+from .request_context import record_span
+
+# With several worker processes, point PROMETHEUS_MULTIPROC_DIR at an empty
+# directory shared by them so /metrics aggregates every worker
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Latency buckets in seconds, from cache hits up to slow model calls
+LATENCY_BUCKETS = (0.005, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)
+
+STAGE_SECONDS = Histogram(
+    "greenie_stage_duration_seconds",
+    "Time spent in each pipeline stage",
+    ["stage"],
+    buckets=LATENCY_BUCKETS
+)
+EXTERNAL_CALL_SECONDS = Histogram(
+    "greenie_external_call_duration_seconds",
+    "Duration of calls to external services, per attempt",
+    ["service", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "greenie_http_request_duration_seconds",
+    "Time to produce the response headers of an API request",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+CACHE_LOOKUPS = Counter(
+    "greenie_cache_lookups_total",
+    "Cache lookups by cache and result",
+    ["cache", "result"]
+)
+ERRORS = Counter(
+    "greenie_errors_total",
+    "Errors logged, by module",
+    ["component"]
+)
+FALLBACKS = Counter(
+    "greenie_fallbacks_total",
+    "Degraded answers served in place of a failed stage",
+    ["component"]
+)
+MODEL_TOKENS = Counter(
+    "greenie_model_tokens_total",
+    "Tokens reported by the model provider",
+    ["model", "kind"]
+)
+MODEL_HEDGES = Counter(
+    "greenie_model_hedges_total",
+    "Hedged duplicate model calls sent, and those that answered first",
+    ["backend", "result"]
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "greenie_requests_in_progress",
+    "API requests currently being handled",
+    ["method"],
+    multiprocess_mode="livesum"
+)
+PIPELINE_RUNS_IN_PROGRESS = Gauge(
+    "greenie_pipeline_runs_in_progress",
+    "Chat pipeline runs currently in progress",
+    ["mode"],
+    multiprocess_mode="livesum"
+)
+MODEL_QUEUE_DEPTH = Gauge(
+    "greenie_model_queue_depth",
+    "Model calls waiting for admission, by priority class",
+    ["priority"],
+    multiprocess_mode="livesum"
+)
+MODEL_CALLS_IN_FLIGHT = Gauge(
+    "greenie_model_calls_in_flight",
+    "Model calls admitted and not yet finished",
+    multiprocess_mode="livesum"
+)
+MODEL_CONCURRENCY_LIMIT = Gauge(
+    "greenie_model_concurrency_limit",
+    "Adaptive limit on concurrent model calls",
+    multiprocess_mode="livesum"
+)
+
+@contextmanager
+def time_stage(stage: str) -> Iterator[None]:
+    """Record the duration of a pipeline stage in its histogram and the request's timing spans."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        record_span(stage, elapsed)
+
+def _wrap_async(func: Callable[..., Any], context: Callable[[], Any]) -> Callable[..., Any]:
+    """Run a coroutine function or async generator function inside a fresh context manager per call."""
+    if inspect.isasyncgenfunction(func):
+        @functools.wraps(func)
+        async def stream_wrapper(*args: Any, **kwargs: Any) -> Any:
+            with context():
+                async for item in func(*args, **kwargs):
+                    yield item
+        return stream_wrapper
+
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with context():
+            return await func(*args, **kwargs)
+    return wrapper
+
+def timed_stage(stage: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Decorate a coroutine or async generator method to record its duration as a pipeline stage."""
+    return lambda func: _wrap_async(func, lambda: time_stage(stage))
+
+@contextmanager
+def time_external_call(service: str) -> Iterator[Dict[str, str]]:
+    """Record the duration of one external call.
+
+    The outcome is ``error`` if the block raises; the block may also set
+    ``outcome["outcome"]`` itself, for example for an error status code.
+    """
+    outcome = {"outcome": "ok"}
+    started = time.perf_counter()
+    try:
+        yield outcome
+    except BaseException:
+        outcome["outcome"] = "error"
+        raise
+    finally:
+        EXTERNAL_CALL_SECONDS.labels(service, outcome["outcome"]).observe(time.perf_counter() - started)
+
+@contextmanager
+def track_in_progress(gauge: Gauge, *labels: str) -> Iterator[None]:
+    """Hold a gauge up by one for the duration of the block."""
+    child = gauge.labels(*labels)
+    child.inc()
+    try:
+        yield
+    finally:
+        child.dec()
+
+def tracked_in_progress(gauge: Gauge, *labels: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Decorate a coroutine or async generator method to hold a gauge up by one while it runs."""
+    return lambda func: _wrap_async(func, lambda: track_in_progress(gauge, *labels))
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    """Count a cache hit or miss."""
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+def record_fallback(component: str) -> None:
+    """Count a degraded answer served by a component."""
+    FALLBACKS.labels(component).inc()
+
+def record_model_usage(model: str, prompt_tokens: int, output_tokens: int) -> None:
+    """Count the prompt and output tokens a model response reports."""
+    if prompt_tokens:
+        MODEL_TOKENS.labels(model, "prompt").inc(prompt_tokens)
+    if output_tokens:
+        MODEL_TOKENS.labels(model, "output").inc(output_tokens)
+
+def record_hedge(backend: str, result: str) -> None:
+    """Count a hedged model call ``sent`` to a backend, or ``won`` by it."""
+    MODEL_HEDGES.labels(backend, result).inc()
+
+def record_model_scheduler(queued: Dict[str, int], in_flight: int, limit: int) -> None:
+    """Publish the model scheduler's queue depth per priority class, in-flight calls and concurrency limit."""
+    for priority, depth in queued.items():
+        MODEL_QUEUE_DEPTH.labels(priority).set(depth)
+    MODEL_CALLS_IN_FLIGHT.set(in_flight)
+    MODEL_CONCURRENCY_LIMIT.set(limit)
+
+def count_logged_error(message: Any) -> None:
+    """Loguru sink counting ERROR records by the module that logged them."""
+    ERRORS.labels(message.record["name"]).inc()
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Return the metrics exposition and its content type, aggregated across workers when configured."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
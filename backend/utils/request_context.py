@@ -0,0 +1,50 @@
+import contextvars
+import random
+import re
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+# Incoming request ids are accepted only if short and made of safe characters
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._:-]{1,64}$")
+
+@dataclass
+class RequestContext:
+    """Per-request state shared by every task and thread working on the request."""
+    request_id: str
+    # Whether this request's payloads are logged
+    sample_payloads: bool = False
+    # Total milliseconds spent in each stage
+    spans: Dict[str, float] = field(default_factory=dict)
+
+_current: contextvars.ContextVar[Optional[RequestContext]] = contextvars.ContextVar("request_context", default=None)
+
+def begin_request(request_id: Optional[str] = None, payload_sample_rate: float = 0.0) -> contextvars.Token:
+    """Start a request context, keeping a valid caller-supplied id or generating one.
+
+    Returns:
+        Token to pass to ``end_request``
+    """
+    if not request_id or not REQUEST_ID_PATTERN.match(request_id):
+        request_id = uuid.uuid4().hex
+    sampled = payload_sample_rate > 0 and random.random() < payload_sample_rate
+    return _current.set(RequestContext(request_id, sampled))
+
+def end_request(token: contextvars.Token) -> None:
+    """Restore the context that was active before ``begin_request``."""
+    _current.reset(token)
+
+def current_request() -> Optional[RequestContext]:
+    """Return the active request context, or None outside a request."""
+    return _current.get()
+
+def current_request_id() -> Optional[str]:
+    """Return the active request id, or None outside a request."""
+    context = _current.get()
+    return context.request_id if context else None
+
+def record_span(stage: str, seconds: float) -> None:
+    """Add a stage's duration to the active request's timing spans."""
+    context = _current.get()
+    if context is not None:
+        context.spans[stage] = context.spans.get(stage, 0.0) + seconds * 1000
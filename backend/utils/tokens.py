@@ -0,0 +1,19 @@
+from typing import Any
+
+# Rough characters per token for English text with Gemini's tokenizer
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(contents: Any) -> int:
+    """Estimate the token count of a prompt or response without calling the API.
+
+    Args:
+        contents: A string, or a list of prompt parts; non-text parts are ignored
+
+    Returns:
+        The estimated number of tokens
+    """
+    if isinstance(contents, str):
+        return max(1, len(contents) // CHARS_PER_TOKEN) if contents else 0
+    if isinstance(contents, (list, tuple)):
+        return sum(estimate_tokens(part) for part in contents if isinstance(part, str))
+    return 0
@@ -0,0 +1,50 @@
+import asyncio
+import os
+import signal
+import sys
+from pathlib import Path
+from loguru import logger
+
+# Add the parent directory to the Python path to resolve imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+# Now import after path is set
+from backend.config import load_environment
+from backend.api.dependencies import ServiceContainer
+from backend.agents.job_worker import JobWorker
+from backend.utils.logging import setup_logging
+from prometheus_client import start_http_server
+
+# Load environment variables
+load_environment()
+
+# Configure logger
+setup_logging("worker")
+
+# Port for this worker's Prometheus metrics; 0 disables the exporter
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", 0))
+
+async def run_worker() -> None:
+    """Run a standalone job worker until SIGINT or SIGTERM."""
+    container = ServiceContainer()
+    worker = JobWorker(container.job_queue, container.pipeline, chat_history=container.chat_history)
+    if container.write_buffer is not None:
+        container.write_buffer.start()
+    container.start_preload()
+    worker.start()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, lambda: asyncio.ensure_future(worker.stop()))
+
+    try:
+        await worker.wait()
+    finally:
+        await container.close()
+        await logger.complete()
+
+if __name__ == "__main__":
+    logger.info("Starting job worker")
+    if WORKER_METRICS_PORT:
+        start_http_server(WORKER_METRICS_PORT)
+    asyncio.run(run_worker())